@@ -0,0 +1,138 @@
+"""Benchmark pytest-archon on synthetic packages of increasing size.
+
+    python benchmarks/bench.py --sizes 1000 10000 50000
+
+Every benchmark is run ``--repeat`` times, the best time is reported.
+Packages are generated in a temporary directory (or ``--root``, to reuse
+them between runs). With ``--json``, the results are written to a file as
+well, to compare them between releases.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+from generate import PackageSpec, generate, module_names  # noqa: E402
+
+from pytest_archon import archrule  # noqa: E402
+from pytest_archon import collect  # noqa: E402
+from pytest_archon.collect import (  # noqa: E402
+    ImportGraph,
+    collect_imports,
+    collect_imports_from_path,
+    extract_imports_ast,
+    recurse_imports,
+    resolve_module_or_object_by_path,
+    walk,
+)
+from pytest_archon.failure import pop_failures  # noqa: E402
+from pytest_archon.settings import settings  # noqa: E402
+
+Benchmark = Callable[[], object]
+
+
+def benchmarks(path: Path, package: str, top: str, engine: str) -> Dict[str, Benchmark]:
+    """The benchmarks for a generated package, top is a module in its top layer."""
+    # the names of from imports, which need to be resolved
+    names = []
+    for py_file in sorted(path.glob("**/*.py")):
+        module = collect.path_to_module(py_file, path, package)
+        nodes = [node for node in walk(ast.parse(py_file.read_bytes())) if isinstance(node, ast.ImportFrom)]
+        names.extend(extract_imports_ast(nodes, module, resolve=False))
+
+    def cold_collect():
+        return collect_imports_from_path(path, package, walk, settings.workers, engine)
+
+    def resolve():
+        collect._module_indexes.clear()
+        return [resolve_module_or_object_by_path(name) for name in names]
+
+    def graph():
+        ImportGraph._registry.clear()
+        return collect_imports(package, walk, engine=engine)
+
+    all_imports = graph()
+
+    def recurse():
+        return sum(1 for _ in recurse_imports(top, all_imports))
+
+    def check():
+        # only broken by the imports that create cycles
+        rule = archrule("layers").match(f"{package}.p0.*").should_not_import(f"{package}.p1.*")
+        rule.check(package, engine=engine, max_witnesses=3)
+        return pop_failures()
+
+    def check_cold():
+        ImportGraph._registry.clear()
+        return check()
+
+    return {
+        "collect_imports (no cache)": cold_collect,
+        "resolve_module_or_object_by_path": resolve,
+        "recurse_imports": recurse,
+        "check (cold graph)": check_cold,
+        "check (warm graph)": check,
+    }
+
+
+def best_of(benchmark: Benchmark, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        benchmark()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(root: Path, sizes: List[int], repeat: int, engine: str, spec: PackageSpec) -> List[dict]:
+    settings.cache_dir = None
+    results = []
+    for size in sizes:
+        package = f"{spec.name}{size}"
+        package_spec = PackageSpec(**{**vars(spec), "name": package, "modules": size})
+        if not (root / package).exists():
+            generate(root, package_spec)
+        top = module_names(package_spec)[-1]
+        sys.path.insert(0, str(root))
+        try:
+            for name, benchmark in benchmarks(root / package, package, top, engine).items():
+                seconds = best_of(benchmark, repeat)
+                results.append({"benchmark": name, "modules": size, "engine": engine, "seconds": seconds})
+                print(f"{size:>8} modules  {seconds:9.4f}s  {name}", flush=True)
+        finally:
+            sys.path.remove(str(root))
+            ImportGraph._registry.clear()
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", default="ast")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--root", type=Path, default=None, help="directory for the generated packages")
+    parser.add_argument("--json", type=Path, default=None, help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    settings.workers = args.workers
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root or Path(tmp)
+        root.mkdir(parents=True, exist_ok=True)
+        results = run(root, args.sizes, args.repeat, args.engine, PackageSpec())
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
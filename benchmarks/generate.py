@@ -0,0 +1,150 @@
+"""Generate synthetic packages to benchmark pytest-archon on.
+
+Modules are spread over a tree of subpackages, in order: ``p0`` holds the
+first modules, ``p1`` the next ones and so on. Every module imports a
+number of other modules, mostly ones generated before it, so the
+subpackages form layers like in a real code base. A fraction of the
+imports points the other way and creates cycles.
+
+    python benchmarks/generate.py /tmp/archon-bench --modules 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+STDLIB_IMPORTS = [
+    "import os",
+    "import sys",
+    "import json",
+    "from collections import OrderedDict",
+    "from json import dumps",
+    "from typing import Any",
+]
+
+
+@dataclass
+class PackageSpec:
+    """The shape of a synthetic package.
+
+    modules:
+        number of modules, excluding ``__init__`` modules
+    fanout:
+        number of modules each module imports
+    depth:
+        nesting depth of subpackages
+    cycles:
+        fraction of imports that point to a later module, creating cycles
+    relative:
+        fraction of imports within a subpackage written as relative imports
+    type_checking:
+        fraction of modules with an ``if TYPE_CHECKING:`` block
+    """
+
+    name: str = "synth"
+    modules: int = 1000
+    fanout: int = 5
+    depth: int = 3
+    cycles: float = 0.02
+    relative: float = 0.3
+    type_checking: float = 0.1
+    seed: int = 0
+
+
+def module_names(spec: PackageSpec) -> List[str]:
+    """The dotted names of the modules, in generation order."""
+    branches = max(2, math.ceil(spec.modules ** (1 / (spec.depth + 1))))
+    leaves = branches**spec.depth
+    names = []
+    for i in range(spec.modules):
+        leaf = i * leaves // spec.modules
+        parts = [f"p{leaf // branches**level % branches}" for level in reversed(range(spec.depth))]
+        names.append(".".join([spec.name, *parts, f"m{i}"]))
+    return names
+
+
+def generate(root: Path, spec: PackageSpec) -> Path:
+    """Write the package to root, returns the package directory."""
+    rng = random.Random(spec.seed)
+    names = module_names(spec)
+    for i, name in enumerate(names):
+        lines = [rng.choice(STDLIB_IMPORTS)]
+        typing_lines = []
+        for _ in range(min(spec.fanout, len(names) - 1)):
+            if i and rng.random() >= spec.cycles:
+                target = names[rng.randrange(i)]
+            else:
+                target = names[rng.randrange(len(names))]
+            if target == name:
+                continue
+            statement = import_statement(name, target, rng, spec.relative)
+            if rng.random() < spec.type_checking:
+                typing_lines.append(statement)
+            else:
+                lines.append(statement)
+        if typing_lines:
+            lines.append("from typing import TYPE_CHECKING")
+            lines.append("if TYPE_CHECKING:")
+            lines.extend(f"    {line}" for line in typing_lines)
+        lines.append("")
+        lines.append(f"VALUE_{i} = {i}")
+        lines.append("")
+        lines.append("")
+        lines.append("def function():")
+        lines.append(f"    {rng.choice(STDLIB_IMPORTS)}")
+        lines.append("    return VALUE_" + str(i))
+        write(root, name, "\n".join(lines) + "\n")
+
+    for package in {name.rpartition(".")[0] for name in names}:
+        while package:
+            init = root.joinpath(*package.split("."), "__init__.py")
+            if init.exists():
+                break
+            write(root, f"{package}.__init__", "")
+            package = package.rpartition(".")[0]
+    return root / spec.name
+
+
+def import_statement(module: str, target: str, rng: random.Random, relative: float) -> str:
+    package, _, name = target.rpartition(".")
+    if package == module.rpartition(".")[0] and rng.random() < relative:
+        return f"from . import {name}"
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"import {target}"
+    if kind == 1:
+        return f"from {package} import {name}"
+    # an object from a module, resolves to the module
+    return f"from {target} import VALUE_{name[1:]}"
+
+
+def write(root: Path, module: str, source: str) -> None:
+    path = root.joinpath(*module.split(".")).with_suffix(".py")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(source)
+
+
+def main(argv=None) -> None:
+    defaults = PackageSpec()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("root", type=Path, help="directory to write the package to")
+    parser.add_argument("--name", default=defaults.name)
+    parser.add_argument("--modules", type=int, default=defaults.modules)
+    parser.add_argument("--fanout", type=int, default=defaults.fanout)
+    parser.add_argument("--depth", type=int, default=defaults.depth)
+    parser.add_argument("--cycles", type=float, default=defaults.cycles)
+    parser.add_argument("--relative", type=float, default=defaults.relative)
+    parser.add_argument("--type-checking", type=float, default=defaults.type_checking)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = vars(parser.parse_args(argv))
+    root = args.pop("root")
+    print(generate(root, PackageSpec(**args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
-from pytest_archon.rule import archrule
+from pytest_archon.rule import archrule, check_all, layers
 
-__all__ = ["archrule"]
+__all__ = ["archrule", "check_all", "layers"]
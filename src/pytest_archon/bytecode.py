@@ -0,0 +1,113 @@
+"""Find import statements in compiled modules.
+
+If the ``__pycache__`` of a module holds a ``.pyc`` file that is fresh for
+the source, its code object can be unmarshalled, which is a lot cheaper
+than parsing the source. Every import statement compiles to an
+``IMPORT_NAME`` instruction, preceded by the loads of the import level and
+the names imported (``None`` for ``import x``). Nested code objects
+(functions, classes, comprehensions) are searched as well.
+
+Like the scanner, the result is a list of ``ast.Import`` and
+``ast.ImportFrom`` nodes. They are the same nodes ``walk`` yields, except
+for imports in code the compiler leaves out, such as ``if False:`` blocks.
+"""
+
+from __future__ import annotations
+
+import ast
+import dis
+import marshal
+from importlib.util import MAGIC_NUMBER, cache_from_source, source_hash
+from pathlib import Path
+from types import CodeType
+from typing import Any, List, Optional, Tuple
+
+IMPORT_NAME = dis.opmap["IMPORT_NAME"]
+EXTENDED_ARG = dis.opmap["EXTENDED_ARG"]
+LOAD_CONST = dis.opmap["LOAD_CONST"]
+# python 3.14 loads the import level as a small int
+LOAD_SMALL_INT = dis.opmap.get("LOAD_SMALL_INT")
+
+_IMPORT_NAME = bytes([IMPORT_NAME])
+
+
+def cached_code(py_file: Path, source: bytes) -> Optional[CodeType]:
+    """The code object of the pyc file of a module, if it is fresh for source."""
+    try:
+        data = Path(cache_from_source(str(py_file))).read_bytes()
+    except (NotImplementedError, OSError):
+        return None
+    if len(data) < 16 or data[:4] != MAGIC_NUMBER:
+        return None
+
+    flags = int.from_bytes(data[4:8], "little")
+    if flags & 0b1:
+        # hash based pyc, even unchecked ones are checked
+        if data[8:16] != source_hash(source):
+            return None
+    else:
+        mtime = int.from_bytes(data[8:12], "little")
+        size = int.from_bytes(data[12:16], "little")
+        if size != len(source) & 0xFFFFFFFF or mtime != int(py_file.stat().st_mtime) & 0xFFFFFFFF:
+            return None
+
+    try:
+        code = marshal.loads(data[16:])
+    except (EOFError, ValueError, TypeError):
+        return None
+    return code if isinstance(code, CodeType) else None
+
+
+def bytecode_imports(code: CodeType) -> List[ast.stmt]:
+    """Find the import statements in a code object and its nested code objects.
+
+    Raises ``ValueError`` for bytecode it does not understand.
+    """
+    nodes: List[ast.stmt] = []
+    todo = [code]
+    while todo:
+        code = todo.pop()
+        co_code = code.co_code
+        pos = co_code.find(_IMPORT_NAME)
+        while pos >= 0:
+            # instructions are two bytes, odd positions hold arguments
+            if pos % 2 == 0:
+                nodes.append(_import_node(code, pos))
+            pos = co_code.find(_IMPORT_NAME, pos + 1)
+        todo.extend(const for const in code.co_consts if isinstance(const, CodeType))
+    return nodes
+
+
+def _import_node(code: CodeType, pos: int) -> ast.stmt:
+    namei, start = _arg(code.co_code, pos)
+    fromlist, start = _loaded_const(code, start - 2)
+    level, _ = _loaded_const(code, start - 2)
+    name = code.co_names[namei]
+    if fromlist is None:
+        return ast.Import(names=[ast.alias(name=name, asname=None)])
+    return ast.ImportFrom(
+        module=name or None, names=[ast.alias(name=n, asname=None) for n in fromlist], level=level
+    )
+
+
+def _arg(co_code: bytes, pos: int) -> Tuple[int, int]:
+    """The argument of the instruction at pos and where it starts, including EXTENDED_ARG prefixes."""
+    arg = co_code[pos + 1]
+    shift = 8
+    while pos >= 2 and co_code[pos - 2] == EXTENDED_ARG:
+        pos -= 2
+        arg |= co_code[pos + 1] << shift
+        shift += 8
+    return arg, pos
+
+
+def _loaded_const(code: CodeType, pos: int) -> Tuple[Any, int]:
+    if pos < 0:
+        raise ValueError("IMPORT_NAME without arguments")
+    op = code.co_code[pos]
+    arg, start = _arg(code.co_code, pos)
+    if op == LOAD_CONST:
+        return code.co_consts[arg], start
+    if op == LOAD_SMALL_INT and LOAD_SMALL_INT is not None:
+        return arg, start
+    raise ValueError(f"unexpected instruction {dis.opname[op]} before IMPORT_NAME")
@@ -0,0 +1,355 @@
+"""Persistent cache for the imports extracted from source files.
+
+Every package root and walker gets its own cache file, and so do the source
+based engines and the pyc engine: the compiler drops code it can prove is
+dead (e.g. ``if False:`` blocks), so pyc files can lack imports that the
+source has. An entry is reused as
+long as the mtime and size of the source file did not change. If they did,
+the content hash decides whether the file needs to be parsed again.
+
+Entries hold what the parser found in the file: the imported modules and
+the full names of from imports. Whether such a name is a module or an
+object in a module depends on other files, so names are resolved again in
+every run.
+
+The results of rules are cached as well, by a fingerprint of the rule and
+the import graph it was checked against (see ``RuleResults``).
+
+With ``settings.shared_cache``, processes that scan the same package (e.g.
+pytest-xdist workers) take turns: the first one parses the files, the others
+wait for it and find a warm cache.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (windows)
+    fcntl = None  # type: ignore[assignment]
+
+from pytest_archon import profile
+from pytest_archon.settings import settings
+
+logger = getLogger(__name__)
+
+CACHE_VERSION = 3
+# lock files older than this are assumed to be left behind by a crashed process
+STALE_LOCK_SECONDS = 600
+
+# results of rules not used for this many checks are dropped
+MAX_RULE_RESULTS = 1000
+
+# mtime_ns, size, digest, imported modules, names of from imports
+Entry = Tuple[int, int, str, List[str], List[str]]
+# imported modules, names of from imports
+RawImports = Tuple[FrozenSet[str], FrozenSet[str]]
+# reason, path
+RuleFailure = Tuple[str, Optional[List[str]]]
+
+
+def digest(source: bytes) -> str:
+    return hashlib.sha1(source).hexdigest()
+
+
+def walker_kind(walker: Callable) -> str | None:
+    """A stable name for a walker, or ``None`` if it cannot be cached."""
+    qualname = getattr(walker, "__qualname__", None)
+    if not qualname or "<" in qualname:
+        return None
+    return f"{walker.__module__}.{qualname}"
+
+
+def engine_kind(engine: str) -> str:
+    """The engines that find the same imports: ``pyc``, or ``source`` for the others."""
+    return "pyc" if engine == "pyc" else "source"
+
+
+class ParseCache:
+    def __init__(self, file: Path, root: Path, walker: str) -> None:
+        self.file = file
+        self.root = root
+        self.walker = walker
+        self.entries: Dict[str, Entry] = {}
+        self.seen: set[str] = set()
+        self.dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.file.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable archon cache file {self.file}")
+            return
+        if data.get("version") != CACHE_VERSION or data.get("walker") != self.walker:
+            return
+        self.entries = {k: tuple(v) for k, v in data.get("files", {}).items()}  # type: ignore[misc]
+
+    def _key(self, py_file: Path) -> str:
+        return py_file.relative_to(self.root).as_posix()
+
+    def get(self, py_file: Path) -> Tuple[Optional[RawImports], Optional[bytes]]:
+        """Look up the imports of a file.
+
+        Returns the cached modules and names of from imports, or ``None`` on a miss. If the source had
+        to be read to compare hashes, it is returned as well, so the caller
+        does not have to read it again.
+        """
+        key = self._key(py_file)
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None, None
+
+        mtime_ns, size, hexdigest, modules, names = entry
+        stat = py_file.stat()
+        profile.stats.syscalls += 1
+        if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+            return (frozenset(modules), frozenset(names)), None
+
+        source = py_file.read_bytes()
+        profile.stats.syscalls += 1
+        if digest(source) != hexdigest:
+            return None, source
+        # touched, but not changed
+        self.entries[key] = (stat.st_mtime_ns, stat.st_size, hexdigest, modules, names)
+        self.dirty = True
+        return (frozenset(modules), frozenset(names)), source
+
+    def put(self, py_file: Path, hexdigest: str, modules: FrozenSet[str], names: FrozenSet[str]) -> None:
+        key = self._key(py_file)
+        stat = py_file.stat()
+        profile.stats.syscalls += 1
+        self.seen.add(key)
+        self.entries[key] = (stat.st_mtime_ns, stat.st_size, hexdigest, sorted(modules), sorted(names))
+        self.dirty = True
+
+    def save(self, prune: bool = True) -> None:
+        """Write the cache.
+
+        With ``prune``, entries of files that were not seen are dropped.
+        """
+        stale = self.entries.keys() - self.seen if prune else set()
+        for key in stale:
+            del self.entries[key]
+        if not (self.dirty or stale):
+            return
+
+        write_json(self.file, {"version": CACHE_VERSION, "walker": self.walker, "files": self.entries})
+        self.dirty = False
+
+
+def write_json(file: Path, data) -> None:
+    """Atomically replace a cache file."""
+    tmp = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+    try:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, file)
+    except OSError:
+        logger.warning(f"Could not write archon cache file {file}")
+
+
+def _cache_file(path: Path, package: str, kind: str, engine: str) -> Path:
+    assert settings.cache_dir is not None
+    key = f"{Path(path).resolve()}\0{package}\0{kind}\0{engine_kind(engine)}"
+    name = hashlib.sha1(key.encode()).hexdigest()[:24]
+    return Path(settings.cache_dir) / f"{package}-{name}.json"
+
+
+def open_cache(path: Path, package: str, walker: Callable, engine: str = "ast") -> ParseCache | None:
+    """Open the parse cache for a package root, if caching is enabled."""
+    kind = walker_kind(walker)
+    if settings.cache_dir is None or kind is None:
+        return None
+    return ParseCache(_cache_file(path, package, kind, engine), Path(path), kind)
+
+
+@contextmanager
+def cache_lock(path: Path, package: str, walker: Callable, engine: str = "ast") -> Iterator[None]:
+    """Hold the lock of a parse cache, if the cache is shared between processes."""
+    kind = walker_kind(walker)
+    if not settings.shared_cache or settings.cache_dir is None or kind is None:
+        yield
+        return
+    file = _cache_file(path, package, kind, engine)
+    with file_lock(file.with_name(f"{file.name}.lock")):
+        yield
+
+
+@contextmanager
+def file_lock(file: Path) -> Iterator[None]:
+    """An exclusive lock between processes.
+
+    Uses ``flock`` where available, and the exclusive creation of the lock
+    file otherwise. If the lock file cannot be created at all, the caller
+    goes ahead without a lock.
+    """
+    try:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(file, os.O_CREAT | os.O_WRONLY) if fcntl else _create_exclusive(file)
+    except OSError:
+        logger.warning(f"Could not lock archon cache file {file}")
+        yield
+        return
+
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+        if not fcntl:
+            file.unlink()
+
+
+def _create_exclusive(file: Path) -> int:
+    while True:
+        try:
+            return os.open(file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - file.stat().st_mtime > STALE_LOCK_SECONDS:
+                    file.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(0.05)
+
+
+def _module_index_file(locations: Sequence[str]) -> Path | None:
+    if settings.cache_dir is None:
+        return None
+    name = hashlib.sha1("\0".join(locations).encode()).hexdigest()[:24]
+    return Path(settings.cache_dir) / "module-index" / f"{name}.json"
+
+
+@contextmanager
+def module_index_lock(locations: Sequence[str]) -> Iterator[None]:
+    """Hold the lock of a persisted module index, if the cache is shared between processes."""
+    file = _module_index_file(locations)
+    if not settings.shared_cache or file is None:
+        yield
+        return
+    with file_lock(file.with_name(f"{file.name}.lock")):
+        yield
+
+
+def load_module_index(locations: Sequence[str]) -> FrozenSet[str] | None:
+    """Load a persisted module index, if none of its directories changed."""
+    file = _module_index_file(locations)
+    if file is None:
+        return None
+    try:
+        data = json.loads(file.read_text())
+        if data.get("version") != CACHE_VERSION or data.get("locations") != list(locations):
+            return None
+        for dirpath, mtime_ns in data["dirs"].items():
+            if os.stat(dirpath).st_mtime_ns != mtime_ns:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return frozenset(data["modules"])
+
+
+def save_module_index(locations: Sequence[str], modules: FrozenSet[str], dirs: Mapping[str, int]) -> None:
+    file = _module_index_file(locations)
+    if file is None:
+        return
+    write_json(
+        file,
+        {"version": CACHE_VERSION, "locations": list(locations), "dirs": dirs, "modules": sorted(modules)},
+    )
+
+
+class RuleResults:
+    """The failures of rules checked before, by fingerprint.
+
+    Entries are saved with the time they were last used, only the most
+    recently used ``MAX_RULE_RESULTS`` are kept. Results saved by other
+    processes in the meantime (e.g. pytest-xdist workers) are merged in.
+    """
+
+    def __init__(self, file: Path) -> None:
+        self.file = file
+        self.entries: Dict[str, Tuple[float, List[RuleFailure]]] = self._load()
+        self.used: set[str] = set()
+
+    def _load(self) -> Dict[str, Tuple[float, List[RuleFailure]]]:
+        try:
+            data = json.loads(self.file.read_text())
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable archon cache file {self.file}")
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+        return {
+            key: (used, [tuple(failure) for failure in failures])  # type: ignore[misc]
+            for key, (used, failures) in data.get("results", {}).items()
+        }
+
+    def get(self, key: str) -> List[RuleFailure] | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.used.add(key)
+        return entry[1]
+
+    def put(self, key: str, failures: Sequence[Tuple[str, Optional[Sequence[str]]]]) -> None:
+        entry = [(reason, None if path is None else list(path)) for reason, path in failures]
+        self.entries[key] = (0.0, entry)
+        self.used.add(key)
+
+    def save(self) -> None:
+        if not self.used:
+            return
+        now = time.time()
+        with cache_file_lock(self.file):
+            entries = self._load()
+            entries.update((key, (now, self.entries[key][1])) for key in self.used)
+            newest = sorted(entries.items(), key=lambda item: item[1][0], reverse=True)[:MAX_RULE_RESULTS]
+            write_json(self.file, {"version": CACHE_VERSION, "results": dict(newest)})
+        self.used.clear()
+
+
+_rule_results: Dict[Path, RuleResults] = {}
+
+
+def rule_results() -> RuleResults | None:
+    """The rule results cache of the cache directory, if caching is enabled."""
+    if settings.cache_dir is None:
+        return None
+    file = Path(settings.cache_dir) / "rule-results.json"
+    results = _rule_results.get(file)
+    if results is None:
+        results = _rule_results[file] = RuleResults(file)
+    return results
+
+
+def save_rule_results() -> None:
+    """Write the rule results cache of every cache directory used."""
+    for results in _rule_results.values():
+        results.save()
+    _rule_results.clear()
+
+
+@contextmanager
+def cache_file_lock(file: Path) -> Iterator[None]:
+    """Hold the lock of a cache file, if the cache is shared between processes."""
+    if not settings.shared_cache:
+        yield
+        return
+    with file_lock(file.with_name(f"{file.name}.lock")):
+        yield
@@ -0,0 +1,289 @@
+"""Check architecture rules without starting pytest.
+
+    pytest-archon tests/test_architecture.py
+
+Rules are loaded from Python files, the same files pytest runs: every
+function named ``test_*`` is called as a check, and rules checked when the
+file is loaded are reported as well. Checks can take the ``archrule``
+fixture, other fixtures are not available. Pytest is not imported, so a
+run takes about as long as building the import graph, which makes it
+suitable for pre-commit hooks.
+
+Rule files and defaults for the options can be configured in
+``pyproject.toml``:
+
+    [tool.pytest-archon]
+    rules = ["tests/test_architecture.py"]
+    pythonpath = ["src"]
+    engine = "scan"
+    workers = 4
+
+The parse cache and the cached results of rules are shared with the pytest
+plugin. The exit status is 0 if all rules pass, 1 if rules are violated and
+2 on errors.
+
+For instant feedback while editing, keep the import graphs in memory:
+
+    pytest-archon --serve /tmp/archon.sock tests/test_architecture.py &
+    pytest-archon --connect /tmp/archon.sock tests/test_architecture.py
+
+The daemon checks the rule files it gets from ``--connect`` (the files it
+was started with, if none are given), after updating the graphs with the
+files that were changed since the last check.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import perf_counter
+from types import FunctionType, ModuleType
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from pytest_archon.cache import save_rule_results
+from pytest_archon.failure import Failure, format_failures, pop_failures
+from pytest_archon.profile import format_stats, stats
+from pytest_archon.rule import archrule
+from pytest_archon.settings import ENGINES, settings
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+EXIT_OK = 0
+EXIT_VIOLATIONS = 1
+EXIT_ERROR = 2
+
+# the same directory the pytest plugin uses, relative to the working directory
+DEFAULT_CACHE_DIR = Path(".pytest_cache", "d", "archon")
+
+FIXTURES: Dict[str, Any] = {"archrule": archrule}
+
+
+@dataclass
+class Outcome:
+    """The result of one check: a test function, or loading a rules file."""
+
+    name: str
+    failures: List[Failure] = field(default_factory=list)
+    # a failed assert of the check itself
+    assertion: str | None = None
+    error: str | None = None
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.failures or self.assertion)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="pytest-archon", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("rules", nargs="*", type=Path, help="python files with rules (default: from config)")
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=Path("pyproject.toml"),
+        help="configuration file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--pythonpath", action="append", default=None, help="directory to add to sys.path, can be repeated"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used to parse modules")
+    parser.add_argument("--engine", choices=ENGINES, default=None, help="how imports are extracted")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="directory of the parse cache")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the parse cache")
+    parser.add_argument("--recheck", action="store_true", help="do not reuse cached results of rules")
+    parser.add_argument("--profile", action="store_true", help="show where the time was spent")
+    parser.add_argument(
+        "--serve",
+        type=Path,
+        default=None,
+        metavar="SOCKET",
+        help="keep the import graphs up to date and serve checks",
+    )
+    parser.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify")
+    parser.add_argument(
+        "--connect",
+        type=Path,
+        default=None,
+        metavar="SOCKET",
+        help="run the checks in a daemon started with --serve",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    rules = args.rules or [Path(rules) for rules in config.get("rules", [])]
+    if not rules and not args.connect:
+        parser.error(f"no rule files given, and no 'rules' in [tool.pytest-archon] of {args.config}")
+    engine = args.engine or config.get("engine", "ast")
+    if engine not in ENGINES:
+        parser.error(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+
+    for path in reversed(args.pythonpath or config.get("pythonpath", [])):
+        sys.path.insert(0, str(Path(path).resolve()))
+    settings.engine = engine
+    settings.workers = args.workers if args.workers is not None else config.get("workers")
+    if args.no_cache:
+        settings.cache_dir = None
+    else:
+        settings.cache_dir = args.cache_dir or Path(config.get("cache_dir", DEFAULT_CACHE_DIR))
+    settings.reuse_results = not args.recheck
+    stats.reset()
+
+    if args.connect:
+        return connect(args.connect, rules)
+    if args.serve:
+        return serve(args.serve, rules, args.poll)
+
+    lines, status = run_rules(rules)
+    if args.profile:
+        lines[-1:-1] = format_stats(stats)
+    print("\n".join(lines))
+    return status
+
+
+def run_rules(rules: Sequence[Path]) -> Tuple[List[str], int]:
+    """Run the checks of rule files, returns the report and the exit status."""
+    start = perf_counter()
+    lines = []
+    failed = errors = passed = 0
+    for rules_file in rules:
+        for outcome in run_file(rules_file):
+            if outcome.error:
+                errors += 1
+                lines.append(f"ERROR {outcome.name}\n{outcome.error}")
+            elif outcome.failed:
+                failed += 1
+                lines.append(outcome.name)
+                if outcome.failures:
+                    lines.append(format_failures(outcome.failures))
+                if outcome.assertion:
+                    lines.append(f"AssertionError: {outcome.assertion}")
+            else:
+                passed += 1
+    save_rule_results()
+
+    lines.append(f"{failed} failed, {passed} passed, {errors} errors in {perf_counter() - start:.2f}s")
+    if errors:
+        return lines, EXIT_ERROR
+    return lines, EXIT_VIOLATIONS if failed else EXIT_OK
+
+
+def serve(socket_path: Path, rules: Sequence[Path], poll: bool = False) -> int:
+    """Run the rules once, to build the import graphs, and serve check requests until stopped."""
+    from pytest_archon.daemon import Daemon, make_watcher
+
+    daemon = Daemon(socket_path, make_watcher(poll))
+
+    def check(message: Dict[str, Any]) -> Dict[str, Any]:
+        lines, status = run_rules([Path(rules_file) for rules_file in message.get("rules") or rules])
+        return {"output": lines, "status": status}
+
+    daemon.handlers["check"] = check
+    try:
+        daemon.remove_stale_socket()
+    except FileExistsError as ex:
+        print(f"ERROR cannot serve on {socket_path}: {ex}")
+        return EXIT_ERROR
+    lines, _ = run_rules(rules)
+    print(lines[-1])
+    print(f"serving on {socket_path}", flush=True)
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+
+def connect(socket_path: Path, rules: Sequence[Path]) -> int:
+    """Run the rules in a daemon started with ``--serve``."""
+    from pytest_archon.daemon import request
+
+    try:
+        response = request(socket_path, {"command": "check", "rules": [str(r.resolve()) for r in rules]})
+    except (OSError, RuntimeError) as ex:
+        print(f"ERROR cannot check the rules in the daemon at {socket_path}: {ex}")
+        return EXIT_ERROR
+    print("\n".join(response["output"]))
+    return response["status"]
+
+
+def load_config(path: Path) -> dict:
+    """The ``[tool.pytest-archon]`` table of a pyproject.toml file, if there is one."""
+    if not path.is_file():
+        return {}
+    with path.open("rb") as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError as ex:
+            raise ValueError(f"cannot read {path}: {ex}") from ex
+    return data.get("tool", {}).get("pytest-archon", {})
+
+
+def run_file(path: Path) -> Iterator[Outcome]:
+    """Load a rules file and run its checks.
+
+    Rules checked while loading are reported as a check named after the file.
+    """
+    loaded = Outcome(str(path))
+    try:
+        module = load_module(path)
+    except Exception as ex:
+        loaded.error = f"{type(ex).__name__}: {ex}"
+        pop_failures()
+        yield loaded
+        return
+    loaded.failures = pop_failures()
+    if loaded.failures:
+        yield loaded
+
+    for name, function in list(vars(module).items()):
+        if not name.startswith("test") or not isinstance(function, FunctionType):
+            continue
+        if function.__module__ == module.__name__:
+            yield run_check(f"{path}::{name}", function)
+
+
+def load_module(path: Path) -> ModuleType:
+    """Import a rules file, with its directory on sys.path like pytest does by default."""
+    directory = str(path.resolve().parent)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"cannot load rules from {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_check(name: str, function: FunctionType) -> Outcome:
+    code = function.__code__
+    arguments = code.co_varnames[: code.co_argcount + code.co_kwonlyargcount]
+    unknown = [argument for argument in arguments if argument not in FIXTURES]
+    if unknown:
+        return Outcome(name, error=f"fixture {unknown[0]!r} is not available outside pytest")
+
+    outcome = Outcome(name)
+    try:
+        function(**{argument: FIXTURES[argument] for argument in arguments})
+    except AssertionError as ex:
+        outcome.assertion = str(ex) or "assert failed"
+    except Exception as ex:
+        outcome.error = f"{type(ex).__name__}: {ex}"
+    outcome.failures = pop_failures()
+    return outcome
+
+
+if __name__ == "__main__":
+    sys.exit(main())
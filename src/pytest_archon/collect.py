@@ -4,15 +4,31 @@ import ast
 import os
 import re
 import sys
+import threading
 from collections import deque
-from functools import lru_cache
+from dataclasses import dataclass
+from importlib.machinery import ModuleSpec
 from importlib.util import find_spec
 from logging import getLogger
 from pathlib import Path
 from types import ModuleType
-from typing import Callable, Dict, Iterable, Iterator, Sequence, Set
-
+from typing import AbstractSet, Callable, FrozenSet, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+
+from pytest_archon import profile
+from pytest_archon.bytecode import bytecode_imports, cached_code
+from pytest_archon.cache import (
+    cache_lock,
+    digest,
+    engine_kind,
+    load_module_index,
+    module_index_lock,
+    open_cache,
+    save_module_index,
+)
 from pytest_archon.core_modules import core_modules
+from pytest_archon.graph import CompactGraph
+from pytest_archon.scanner import scan_imports
+from pytest_archon.settings import ENGINES, settings
 
 # https://docs.djangoproject.com/en/4.1/_modules/django/utils/module_loading/
 # https://stackoverflow.com/questions/54325116/can-i-handle-imports-in-an-abstract-syntax-tree
@@ -21,24 +37,39 @@ from pytest_archon.core_modules import core_modules
 
 
 Walker = Callable[[ast.Module], Iterator[ast.AST]]
-ImportMap = Dict[str, Set[str]]
+ImportMap = Mapping[str, AbstractSet[str]]
+# path, module name, source (if already read), walker and engine
+ParseJob = Tuple[Path, str, Optional[bytes], Walker, str]
+# path, module name, imported modules and names of from imports (not resolved yet)
+ScannedFile = Tuple[Path, str, FrozenSet[str], FrozenSet[str]]
 
 logger = getLogger(__name__)
 
 
-def collect_imports(package: str | ModuleType, walker: Walker) -> ImportMap:
-    if isinstance(package, ModuleType):
-        if not hasattr(package, "__path__"):
-            raise AttributeError(f"module {package.__name__} does not have __path__")
-        package = package.__name__
+def collect_imports(
+    package: str | ModuleType | Iterable[str | ModuleType],
+    walker: Walker,
+    workers: int | None = None,
+    engine: str | None = None,
+) -> ImportMap:
+    """Collect the imports of a package, a namespace package or several packages.
+
+    Every root directory is scanned once per session. The graphs of several
+    roots are merged, so imports can be followed from one root into another.
+    """
+    packages = [package] if isinstance(package, (str, ModuleType)) else list(package)
+    if not packages:
+        raise ValueError("no packages to collect imports from")
 
-    all_imports: ImportMap = {}
-    for name, imports in collect_imports_from_path(package_dir(package), package, walker):
-        direct_imports = {imp for imp in imports if imp != name}
-        if name in all_imports:
-            raise KeyError(f"WTF? duplicate module {name}")
-        all_imports[name] = direct_imports
-    return all_imports
+    if workers is None:
+        workers = settings.workers
+    if engine is None:
+        engine = settings.engine
+
+    graphs = []
+    for name in map(package_name, packages):
+        graphs.extend(import_graphs(name, walker, workers, engine))
+    return graphs[0].imports if len(graphs) == 1 else merge_graphs(graphs)
 
 
 def walk(node: ast.AST) -> Iterator[ast.AST]:
@@ -64,6 +95,10 @@ def walk_toplevel(node: ast.Module) -> Iterator[ast.AST]:
     yield from node.body
 
 
+# scan modes of the scan engine for the builtin walkers
+_scan_modes = {walk: "all", walk_runtime: "runtime", walk_toplevel: "toplevel"}
+
+
 def package_dir(package: str) -> Path:
     spec = find_spec(package)
     if not spec:
@@ -73,17 +108,369 @@ def package_dir(package: str) -> Path:
     return Path(spec.origin).parent
 
 
-@lru_cache(maxsize=2048)
+def package_dirs(package: str) -> list[Path]:
+    """The directories to scan for a package.
+
+    That is the directory of a regular package, or all portions of a
+    namespace package.
+    """
+    spec = find_spec(package)
+    if not spec:
+        raise ModuleNotFoundError(f"could not find the module {package!r}", name=package)
+
+    if spec.origin in (None, "namespace") and spec.submodule_search_locations is not None:
+        return [Path(location) for location in spec.submodule_search_locations]
+    return [package_dir(package)]
+
+
+def package_name(package: str | ModuleType) -> str:
+    if isinstance(package, ModuleType):
+        if not hasattr(package, "__path__"):
+            raise AttributeError(f"module {package.__name__} does not have __path__")
+        return package.__name__
+    return package
+
+
+def import_graphs(
+    package: str, walker: Walker = walk, workers: int | None = None, engine: str = "ast"
+) -> list[ImportGraph]:
+    """The graphs of all directories of a package, one for each portion of a namespace package."""
+    return [ImportGraph.for_root(path, package, walker, workers, engine) for path in package_dirs(package)]
+
+
+_merged: dict[tuple[ImportGraph, ...], tuple[tuple[CompactGraph, ...], CompactGraph]] = {}
+
+
+def merge_graphs(graphs: Sequence[ImportGraph]) -> CompactGraph:
+    """One graph with the modules of several import graphs.
+
+    A module found in more than one graph (e.g. when both a package and one
+    of its subpackages are given) is taken from the first. The result is
+    shared until one of the graphs changes.
+    """
+    key = tuple(graphs)
+    parts = tuple(graph.imports for graph in graphs)
+    cached = _merged.get(key)
+    if cached and all(old is new for old, new in zip(cached[0], parts)):
+        return cached[1]
+
+    seen: set[str] = set()
+    items = []
+    for part in parts:
+        for module in part:
+            if module not in seen:
+                seen.add(module)
+                items.append((module, part[module]))
+    merged = CompactGraph.from_items(items)
+    _merged[key] = (parts, merged)
+    return merged
+
+
 def collect_imports_from_path(
-    path: Path, package: str, walker: Walker = walk
+    path: Path, package: str, walker: Walker = walk, workers: int | None = None, engine: str = "ast"
 ) -> frozenset[tuple[str, frozenset[str]]]:
-    def _collect(py_file):
-        module_name = path_to_module(py_file, path, package)
-        tree = ast.parse(py_file.read_bytes())
-        imports = extract_imports_ast(walker(tree), module_name)
-        return module_name, frozenset(imports)
+    """Collect the imports of all modules found in path.
 
-    return frozenset(_collect(py_file) for py_file in Path(path).glob("**/*.py"))
+    With ``workers`` > 1, files are parsed in a pool of processes.
+    With ``engine="scan"``, import statements are found by a scanner
+    instead of the parser, with ``engine="pyc"`` they are read from
+    compiled modules (see ``parse_file``).
+    """
+    py_files = sorted(Path(path).glob("**/*.py"))
+    collected = resolve_imports(scan_files(path, package, walker, py_files, workers, engine=engine), workers)
+    return frozenset((module, imports) for _, module, imports in collected)
+
+
+def scan_files(
+    path: Path,
+    package: str,
+    walker: Walker,
+    py_files: Sequence[Path],
+    workers: int | None = None,
+    complete: bool = True,
+    engine: str = "ast",
+) -> list[ScannedFile]:
+    """Collect the imports of the given files in path, using the parse cache.
+
+    The names of from imports are not resolved yet, as the result depends on
+    other files (see ``resolve_imports``).
+
+    If the files given are a ``complete`` listing of path, cache entries of
+    other files are dropped. A shared cache is locked while files are parsed,
+    so other processes can use the results instead of parsing them as well.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {', '.join(ENGINES)}")
+    with cache_lock(path, package, walker, engine):
+        cache = open_cache(path, package, walker, engine)
+
+        collected: list[ScannedFile] = []
+        todo: list[ParseJob] = []
+        for py_file in py_files:
+            module_name = path_to_module(py_file, path, package)
+            source = None
+            if cache:
+                cached, source = cache.get(py_file)
+                if cached is not None:
+                    collected.append((py_file, module_name, *cached))
+                    profile.stats.cache_hits += 1
+                    continue
+            todo.append((py_file, module_name, source, walker, engine))
+        profile.stats.files_parsed += len(todo)
+
+        for (py_file, module_name, *_), (modules, names, hexdigest) in zip(todo, parse_files(todo, workers)):
+            collected.append((py_file, module_name, modules, names))
+            if cache:
+                cache.put(py_file, hexdigest, modules, names)
+
+        if cache:
+            cache.save(prune=complete)
+    return collected
+
+
+def resolve_imports(
+    collected: Sequence[ScannedFile], workers: int | None = None
+) -> list[tuple[Path, str, frozenset[str]]]:
+    """The imports of files collected by ``scan_files``, with the names of from imports resolved.
+
+    Every name is resolved once for all files (see ``resolve_names``).
+    """
+    with profile.stats.timer("resolve"):
+        resolved = resolve_names((name for *_, names in collected for name in names), workers)
+    return [
+        (py_file, module, modules | {resolved[name] for name in names})
+        for py_file, module, modules, names in collected
+    ]
+
+
+@dataclass(frozen=True)
+class FileState:
+    mtime_ns: int
+    size: int
+    module: str
+
+
+class ImportGraph:
+    """The imports of all modules in a package.
+
+    The graph keeps track of the source files it was built from.
+    ``refresh()`` brings it up to date after files have been changed,
+    added or deleted, parsing only the files that changed. The from imports
+    of other modules that may refer to an added or deleted module are
+    resolved again.
+    """
+
+    # keyed by root, package, walker and engine kind (see ``engine_kind``)
+    _registry: dict[tuple[Path, str, Walker, str], ImportGraph] = {}
+    # one lock per registry key, so a graph is only built once, even when
+    # it is requested by a background thread and a test at the same time
+    _registry_locks: dict[tuple[Path, str, Walker, str], threading.Lock] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: Path,
+        package: str,
+        walker: Walker = walk,
+        workers: int | None = None,
+        engine: str = "ast",
+    ) -> None:
+        self.path = Path(path)
+        self.package = package
+        self.walker = walker
+        self.workers = workers
+        self.engine = engine
+        self.files: dict[Path, FileState] = {}
+        # the imports of every module, before the names of from imports are resolved
+        self.scanned: dict[str, tuple[frozenset[str], frozenset[str]]] = {}
+        self.imports = CompactGraph.from_items(())
+        self.refresh()
+
+    @classmethod
+    def for_package(
+        cls, package: str, walker: Walker = walk, workers: int | None = None, engine: str = "ast"
+    ) -> ImportGraph:
+        """The graph of a package, shared for the rest of the session.
+
+        The source based engines yield the same imports, and share a graph.
+        The pyc engine has graphs of its own. A namespace package in several
+        directories has one graph for each, see ``import_graphs``.
+        """
+        graphs = import_graphs(package, walker, workers, engine)
+        if len(graphs) > 1:
+            raise ValueError(f"namespace package {package!r} has several directories, use import_graphs()")
+        return graphs[0]
+
+    @classmethod
+    def for_root(
+        cls, path: Path, package: str, walker: Walker = walk, workers: int | None = None, engine: str = "ast"
+    ) -> ImportGraph:
+        """The graph of the package in path, shared for the rest of the session."""
+        key = (Path(path), package, walker, engine_kind(engine))
+        with cls._registry_lock:
+            lock = cls._registry_locks.setdefault(key, threading.Lock())
+        with lock:
+            graph = cls._registry.get(key)
+            if graph is None:
+                graph = cls._registry[key] = cls(Path(path), package, walker, workers, engine)
+        return graph
+
+    def refresh(self, paths: Iterable[Path] | None = None) -> set[str]:
+        """Update the graph, returns the names of the modules that changed.
+
+        If the paths that changed are known (e.g. from a file watcher), only
+        those are checked, instead of every file in the package. Paths that
+        are not Python files in the package are ignored.
+        """
+        with profile.stats.timer("collect"):
+            return self._refresh(paths)
+
+    def _refresh(self, paths: Iterable[Path] | None = None) -> set[str]:
+        if paths is None:
+            py_files = sorted(self.path.glob("**/*.py"))
+            removed = self.files.keys() - set(py_files)
+        else:
+            candidates = sorted({Path(path) for path in paths if self._contains(Path(path))})
+            py_files = [py_file for py_file in candidates if py_file.is_file()]
+            removed = {py_file for py_file in candidates if py_file in self.files} - set(py_files)
+        stats = {py_file: py_file.stat() for py_file in py_files}
+        profile.stats.syscalls += len(stats)
+
+        built = bool(self.files)
+        updates: dict[str, frozenset[str] | None] = {}
+        for py_file in removed:
+            module = self.files.pop(py_file).module
+            del self.scanned[module]
+            updates[module] = None
+
+        todo = []
+        for py_file, stat in stats.items():
+            state = self.files.get(py_file)
+            if not state or state.mtime_ns != stat.st_mtime_ns or state.size != stat.st_size:
+                todo.append(py_file)
+
+        # names that referred to an added or removed module may resolve differently now
+        moved = set(updates)
+        if built:
+            moved.update(
+                path_to_module(py_file, self.path, self.package)
+                for py_file in todo
+                if py_file not in self.files
+            )
+        if moved:
+            forget_module_indexes()
+
+        complete = paths is None and len(todo) == len(stats)
+        modules = {state.module for state in self.files.values()}
+        collected = scan_files(
+            self.path, self.package, self.walker, todo, self.workers, complete, self.engine
+        )
+        for _, module, imported, names in collected:
+            self.scanned[module] = (imported, names)
+        for py_file, module, imports in resolve_imports(collected, self.workers):
+            stat = stats[py_file]
+            imports = imports - {module}
+            if py_file not in self.files and module in modules:
+                raise KeyError(f"WTF? duplicate module {module}")
+            self.files[py_file] = FileState(stat.st_mtime_ns, stat.st_size, module)
+            modules.add(module)
+            if module in updates or module not in self.imports or self.imports[module] != imports:
+                updates[module] = imports
+
+        if updates:
+            self.imports = self.imports.patched(updates)
+        changed = set(updates)
+        if moved:
+            changed |= self.resolve_again(moved)
+        return changed
+
+    def resolve_again(self, moved: AbstractSet[str]) -> set[str]:
+        """Resolve the names of from imports that may refer to modules that were added or
+        removed, returns the names of the modules whose imports changed.
+
+        The module indexes must have been dropped (see ``forget_module_indexes``).
+        """
+        collected = [
+            (py_file, state.module, *self.scanned[state.module])
+            for py_file, state in self.files.items()
+            if _refers_to(self.scanned[state.module][1], moved)
+        ]
+        updates = {}
+        for _, module, imports in resolve_imports(collected, self.workers):
+            imports = imports - {module}
+            if self.imports[module] != imports:
+                updates[module] = imports
+        if updates:
+            self.imports = self.imports.patched(updates)
+        return set(updates)
+
+    def _contains(self, path: Path) -> bool:
+        if path.suffix != ".py":
+            return False
+        try:
+            path.relative_to(self.path)
+        except ValueError:
+            return False
+        return True
+
+
+def _refers_to(names: Iterable[str], modules: AbstractSet[str]) -> bool:
+    """Is one of the names of from imports one of the modules, in one of them, or a package of one?"""
+    return any(
+        name == module or name.startswith(f"{module}.") or module.startswith(f"{name}.")
+        for name in names
+        for module in modules
+    )
+
+
+def parse_files(
+    jobs: Sequence[ParseJob], workers: int | None = None
+) -> Iterable[tuple[frozenset[str], frozenset[str], str]]:
+    """Parse files and extract their imports, in order of the jobs given."""
+    if not workers or workers < 2 or len(jobs) < 2:
+        return map(parse_file, jobs)
+
+    # imported here, multiprocessing is a large part of the import time of this module
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with profile.stats.timer("parse"), ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse_file, jobs, chunksize=chunksize))
+
+
+def parse_file(job: ParseJob) -> tuple[frozenset[str], frozenset[str], str]:
+    """Extract the imports of a file: the imported modules, and the names of
+    from imports, which still need to be resolved (see ``resolve_names``).
+
+    The scan engine only knows the builtin walkers. Custom walkers and
+    sources it cannot make sense of are parsed into an AST instead.
+    The pyc engine only knows ``walk``, and needs a pyc file that is fresh
+    for the source. Otherwise the source is parsed.
+    """
+    py_file, module_name, source, walker, engine = job
+    stats = profile.stats
+    if source is None:
+        with stats.timer("read"):
+            source = py_file.read_bytes()
+        stats.syscalls += 1
+    nodes: Optional[Iterable[ast.AST]] = None
+    with stats.timer("parse"):
+        if engine == "scan" and walker in _scan_modes:
+            try:
+                nodes = scan_imports(source, _scan_modes[walker])
+            except (SyntaxError, ValueError):
+                pass
+        elif engine == "pyc" and walker is walk:
+            code = cached_code(py_file, source)
+            if code is not None:
+                try:
+                    nodes = bytecode_imports(code)
+                except ValueError:
+                    pass
+        if nodes is None:
+            nodes = walker(ast.parse(source))
+        modules, names = extract_import_names(nodes, module_name)
+    return frozenset(modules), frozenset(names), digest(source)
 
 
 def path_to_module(module_path: Path, base_path: Path, package=None) -> str:
@@ -103,24 +490,65 @@ def path_to_module(module_path: Path, base_path: Path, package=None) -> str:
 
 
 def extract_imports_ast(nodes: Iterator[ast.AST], package: str, resolve=True) -> Iterator[str]:
+    modules, names = extract_import_names(nodes, package)
+    yield from modules
+    if resolve:
+        resolved = resolve_names(names)
+        yield from (resolved[name] for name in names)
+    else:
+        yield from names
+
+
+def extract_import_names(nodes: Iterable[ast.AST], package: str) -> tuple[list[str], list[str]]:
+    """The modules of import statements, and the full names of from imports.
+
+    A from import can import a module or an object from a module, which is
+    only known once the name is resolved.
+    """
+    modules: list[str] = []
+    names: list[str] = []
     for node in nodes:
         if isinstance(node, ast.Import):
-            for alias in node.names:
-                yield alias.name
+            modules.extend(alias.name for alias in node.names)
         elif isinstance(node, ast.ImportFrom):
             for alias in node.names:
-                fqname = resolve_import_from(alias.name, node.module, package=package, level=node.level)
-                if resolve:
-                    try:
-                        yield resolve_module_or_object_by_path(fqname)
-                    except (ModuleNotFoundError, ValueError):
-                        logger.warning(
-                            f"Could not determine if {fqname} is a module or function."
-                            " Assuming it is a module."
-                        )
-                        yield fqname
-                else:
-                    yield fqname
+                names.append(resolve_import_from(alias.name, node.module, package=package, level=node.level))
+    return modules, names
+
+
+def resolve_names(names: Iterable[str], workers: int | None = None) -> dict[str, str]:
+    """Resolve the names of from imports to the module they are, or the module they are in.
+
+    Every name is resolved once. Names that cannot be resolved are assumed to
+    be modules, and reported together in one warning. With ``workers`` > 1,
+    the toplevel packages are indexed in a pool of threads first, so their
+    filesystem calls overlap (which helps on network mounts).
+    """
+    unique = set(names)
+    _check_sys_path()
+    if workers and workers > 1:
+        index_modules({name.partition(".")[0] for name in unique}, workers)
+
+    resolved = {}
+    unresolved = []
+    for name in sorted(unique):
+        if name in _unresolved:
+            resolved[name] = name
+            continue
+        try:
+            resolved[name] = resolve_module_or_object_by_path(name)
+        except (ModuleNotFoundError, ValueError):
+            resolved[name] = name
+            unresolved.append(name)
+
+    if unresolved:
+        _unresolved.update(unresolved)
+        shown = ", ".join(unresolved[:10]) + (", ..." if len(unresolved) > 10 else "")
+        logger.warning(
+            f"Could not determine if {len(unresolved)} imported names are modules or objects,"
+            f" assuming they are modules: {shown}"
+        )
+    return resolved
 
 
 def type_checking_clause(node: ast.AST) -> bool:
@@ -187,6 +615,7 @@ def resolve_module_or_object_by_spec(fqname: str) -> str:
 
 
 def resolve_module_or_object_by_path(fqname: str) -> str:
+    profile.stats.resolutions += 1
     if "." not in fqname:
         return fqname
 
@@ -215,34 +644,121 @@ def resolve_module_or_object_by_path(fqname: str) -> str:
                 raise ValueError(f"{fqname}.__spec__ is None")
             return fqname
 
-    spec = find_spec(head)
+    spec, index = module_index(head)
     if not spec:
         raise ModuleNotFoundError(f"could not find the module {head} to resolve {fqname}", name=head)
 
-    has_no_submodules = (
-        not hasattr(spec, "submodule_search_locations") or spec.submodule_search_locations is None
-    )
-    if len(parts) == 2 and has_no_submodules:
+    if len(parts) == 2 and index is None:
         # we have from a import b with a being a.py, is that possible:
         # a package without directories, just one file? I assume yes for now
         return head
 
-    if has_no_submodules:
+    if index is None:
         raise ModuleNotFoundError(f"could not find the module {head} to resolve {fqname}", name=head)
 
-    assert spec.submodule_search_locations
-    for base_path in spec.submodule_search_locations:
-        init = os.path.join(base_path, *(parts[1:] + ["__init__.py"]))
-        dir = os.path.join(base_path, *parts[1:])
-        direct = os.path.join(base_path, *parts[1:]) + ".py"
-        if os.path.exists(init) or os.path.exists(direct) or os.path.isdir(dir):
-            # we have a module
-            return fqname
+    if ".".join(parts[1:]) in index:
+        # we have a module
+        return fqname
     # we imported an object, return "parent"
     return parent_name
 
 
+_module_indexes: dict[str, tuple[ModuleSpec | None, frozenset[str] | None]] = {}
+_module_indexes_path: tuple[str, ...] = ()
+# names that could not be resolved, they are tried once until sys.path changes
+_unresolved: set[str] = set()
+
+
+def _check_sys_path() -> None:
+    """Drop the module indexes and unresolved names if sys.path changed."""
+    global _module_indexes_path
+    if _module_indexes_path != tuple(sys.path):
+        _module_indexes.clear()
+        _unresolved.clear()
+        _module_indexes_path = tuple(sys.path)
+
+
+def forget_module_indexes() -> None:
+    """Drop the module indexes and unresolved names, e.g. after modules were added or removed."""
+    _module_indexes.clear()
+    _unresolved.clear()
+
+
+def module_index(head: str) -> tuple[ModuleSpec | None, frozenset[str] | None]:
+    """Find a toplevel module and the names of all its submodules.
+
+    The submodule names are relative to the toplevel module. If it is not a
+    package, the index is ``None``. Results are cached until sys.path changes.
+    """
+    _check_sys_path()
+    entry = _module_indexes.get(head)
+    if entry is None:
+        spec = find_spec(head)
+        locations = getattr(spec, "submodule_search_locations", None)
+        index = None if locations is None else build_module_index(list(locations))
+        entry = _module_indexes[head] = spec, index
+    return entry
+
+
+def index_modules(heads: Iterable[str], workers: int) -> None:
+    """Build the module indexes of toplevel modules in a pool of threads."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    todo = [head for head in sorted(heads) if head not in _module_indexes and head not in core_modules()]
+    if len(todo) < 2:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in executor.map(_index_quietly, todo):
+            pass
+
+
+def _index_quietly(head: str) -> None:
+    try:
+        module_index(head)
+    except (ImportError, ValueError):
+        # reported when the names in it are resolved
+        pass
+
+
+def build_module_index(locations: Sequence[str]) -> frozenset[str]:
+    with module_index_lock(locations):
+        index = load_module_index(locations)
+        if index is not None:
+            return index
+
+        modules = set()
+        dirs = {}
+        for base_path in locations:
+            # the real paths of the directories above each directory, to not follow symlinks in circles
+            parents: dict[str, frozenset[str]] = {base_path: frozenset()}
+            for dirpath, dirnames, filenames in os.walk(base_path, followlinks=True):
+                real_path = os.path.realpath(dirpath)
+                above = parents.pop(dirpath)
+                if real_path in above:
+                    dirnames[:] = []
+                    continue
+                # names with dots can never be part of a module name
+                dirnames[:] = [d for d in dirnames if "." not in d]
+                for d in dirnames:
+                    parents[os.path.join(dirpath, d)] = above | {real_path}
+                dirs[dirpath] = os.stat(dirpath).st_mtime_ns
+                rel_path = os.path.relpath(dirpath, base_path)
+                prefix = "" if rel_path == os.curdir else rel_path.replace(os.sep, ".") + "."
+                if prefix:
+                    modules.add(prefix[:-1])
+                modules.update(prefix + f[:-3] for f in filenames if f.endswith(".py") and "." not in f[:-3])
+
+        profile.stats.syscalls += len(dirs)
+        index = frozenset(modules)
+        save_module_index(locations, index, dirs)
+        return index
+
+
 def recurse_imports(module: str, all_imports: ImportMap) -> Iterable[Sequence[str]]:
+    if isinstance(all_imports, CompactGraph):
+        yield from all_imports.paths(module)
+        return
+
     seen = set()
 
     def recurse(path):
@@ -0,0 +1,430 @@
+"""Keep import graphs in memory and up to date, and serve requests over a Unix socket.
+
+The daemon watches the directories of all graphs in the ``ImportGraph``
+registry. It uses inotify on Linux and polls on other platforms. When files
+change, only those files are parsed again (``ImportGraph.refresh(paths)``),
+so a check after an edit takes milliseconds.
+
+Every request is one line of JSON with a ``command``, and so is the
+response, with ``ok`` set to false and an ``error`` if it failed. Commands:
+
+ping:
+    the process id of the daemon, the graphs it holds and their ``version``
+snapshot:
+    the import graph of a ``package`` (for a ``walker``: ``all``,
+    ``runtime`` or ``toplevel``), as the lines of a JSON lines snapshot, or
+    base64 encoded with ``"format": "binary"``. With the ``version`` of an
+    earlier response, the snapshot is left out if no graph changed since
+stop:
+    stop the daemon
+
+More commands can be registered, the command line interface adds
+``check`` to run rule files (see ``pytest-archon --serve``).
+
+With ``settings.daemon`` (``pytest --archon-daemon SOCKET``), checks get
+their import graphs from the daemon (see ``daemon_imports``). Clients keep
+the snapshots they fetched, and only fetch them again when the version of
+the daemon changed, so checks share one graph object (and its indexes).
+"""
+
+from __future__ import annotations
+
+import base64
+import ctypes
+import json
+import os
+import select
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Set, Tuple, Union
+
+from pytest_archon.collect import ImportGraph, ImportMap, Walker
+from pytest_archon.prewarm import WALKERS
+from pytest_archon.snapshot import Snapshot, _dump_binary, _dump_jsonl, _load_binary, take_snapshot
+
+logger = getLogger(__name__)
+
+Message = Dict[str, Any]
+Handler = Callable[[Message], Message]
+
+# seconds between scans of the polling watcher (and checks for a stop request),
+# and to wait for more events after a change
+POLL_INTERVAL = 0.5
+SETTLE_TIME = 0.05
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_WATCH_MASK |= IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """Reports that anything may have changed, every ``interval`` seconds.
+
+    Graphs are then refreshed as a whole, which compares the mtime and size
+    of every file.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL) -> None:
+        self.interval = interval
+
+    def watch(self, root: Path) -> None:
+        pass
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(min(timeout, self.interval))
+
+    def take(self) -> Optional[Set[Path]]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Reports the files that changed, using inotify (Linux only).
+
+    Every directory in a watched tree gets a watch, directories that are
+    created later are added as they appear. Events are read as soon as they
+    are available, and kept until they are taken.
+    """
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._add_watch.restype = ctypes.c_int
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        self.fd: int = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # the directory of every watch descriptor
+        self.dirs: Dict[int, Path] = {}
+        self._watched: Set[Path] = set()
+        # None if files changed that are not known by name
+        self._changed: Optional[Set[Path]] = set()
+        self._lock = threading.RLock()
+
+    def watch(self, root: Path) -> Set[Path]:
+        """Watch a directory tree, returns the Python files in it."""
+        py_files: Set[Path] = set()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if "." not in d and d != "__pycache__"]
+            directory = Path(dirpath)
+            if directory in self._watched:
+                continue
+            wd: int = self._add_watch(self.fd, os.fsencode(dirpath), _WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"cannot watch {dirpath}: {os.strerror(errno)}")
+            self.dirs[wd] = directory
+            self._watched.add(directory)
+            py_files.update(directory / f for f in filenames if f.endswith(".py"))
+        return py_files
+
+    def wait(self, timeout: float) -> None:
+        """Wait until files changed, or the timeout expired."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            self._read()
+            # editors write a file in several steps, wait for all of them
+            ready, _, _ = select.select([self.fd], [], [], SETTLE_TIME)
+
+    def take(self) -> Optional[Set[Path]]:
+        """The files that changed since the last call, or ``None`` if that is not known."""
+        with self._lock:
+            self._read()
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def _read(self) -> None:
+        with self._lock:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = os.fsdecode(data[pos + _EVENT.size : pos + _EVENT.size + length].rstrip(b"\0"))
+                pos += _EVENT.size + length
+                self._event(wd, mask, name)
+
+    def _event(self, wd: int, mask: int, name: str) -> None:
+        directory = self.dirs.get(wd)
+        if mask & IN_Q_OVERFLOW:
+            self._changed = None
+        elif directory is None:
+            return
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # the files in it are gone, but which ones is not known
+            del self.dirs[wd]
+            self._watched.discard(directory)
+            self._changed = None
+        elif mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                added = self.watch(directory / name)
+                if self._changed is not None:
+                    self._changed.update(added)
+            elif mask & IN_MOVED_FROM:
+                self._changed = None
+        elif name.endswith(".py") and self._changed is not None:
+            self._changed.add(directory / name)
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+Watcher = Union[PollingWatcher, InotifyWatcher]
+
+
+def make_watcher(poll: bool = False) -> Watcher:
+    """An inotify watcher if possible, a polling watcher otherwise."""
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as ex:
+            logger.info(f"Falling back to polling for changes: {ex}")
+    return PollingWatcher()
+
+
+class Daemon:
+    """Serves requests over a Unix socket, while keeping the import graphs up to date.
+
+    Graphs are refreshed when the watcher reports changes, and right before
+    a request is handled, so a request never sees a graph that is older
+    than the files.
+    """
+
+    def __init__(self, socket_path: str | Path, watcher: Watcher | None = None) -> None:
+        self.socket_path = Path(socket_path)
+        self.watcher = watcher or make_watcher()
+        self.handlers: Dict[str, Handler] = {
+            "ping": self._ping,
+            "snapshot": self._snapshot,
+            "stop": self._stop,
+        }
+        self.lock = threading.Lock()
+        self._roots: Set[Path] = set()
+        self._stopped = threading.Event()
+        self._server: socketserver.UnixStreamServer | None = None
+        # distinguishes the versions of this daemon from those of earlier ones
+        self._started = f"{os.getpid()}-{time.time_ns()}"
+        self.generation = 0
+
+    @property
+    def version(self) -> str:
+        """Changes whenever a graph changes."""
+        return f"{self._started}-{self.generation}"
+
+    def serve(self) -> None:
+        """Serve requests until a stop request comes in.
+
+        Raises ``FileExistsError`` if the socket path is in use (see
+        ``remove_stale_socket``).
+        """
+        self.remove_stale_socket()
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                self.wfile.write(json.dumps(daemon.handle(self.rfile.readline())).encode() + b"\n")
+
+        watch_thread = threading.Thread(target=self._watch, name="archon-watch", daemon=True)
+        with socketserver.UnixStreamServer(str(self.socket_path), RequestHandler) as server:
+            self._server = server
+            with self.lock:
+                self._watch_new_roots()
+            watch_thread.start()
+            try:
+                server.serve_forever()
+            finally:
+                self._stopped.set()
+                watch_thread.join()
+                self.watcher.close()
+                self.socket_path.unlink(missing_ok=True)
+
+    def remove_stale_socket(self) -> None:
+        """Remove a socket left behind by a daemon that is gone.
+
+        Raises ``FileExistsError`` if the path is not a socket, or another
+        daemon is serving on it.
+        """
+        try:
+            mode = self.socket_path.lstat().st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(f"{self.socket_path} exists and is not a socket")
+        try:
+            request(self.socket_path, {"command": "ping"}, timeout=1.0)
+        except (ConnectionRefusedError, FileNotFoundError):
+            self.socket_path.unlink(missing_ok=True)
+            return
+        except (OSError, RuntimeError, ValueError):
+            pass
+        raise FileExistsError(f"another daemon is serving on {self.socket_path}")
+
+    def handle(self, line: bytes) -> Message:
+        try:
+            message = json.loads(line)
+            handler = self.handlers.get(message.get("command"))
+            if handler is None:
+                raise ValueError(f"unknown command {message.get('command')!r}")
+            with self.lock:
+                self.sync()
+                response = handler(message)
+                # graphs built by the request
+                self._watch_new_roots()
+        except Exception as ex:
+            return {"ok": False, "error": f"{type(ex).__name__}: {ex}"}
+        return {"ok": True, **response}
+
+    def sync(self) -> Set[str]:
+        """Refresh the graphs with the changes reported so far, returns the modules that changed.
+
+        The daemon lock must be held.
+        """
+        changed = self.watcher.take()
+        if changed is not None and not changed:
+            return set()
+        modules = self.refresh(changed)
+        if modules:
+            logger.info(f"Refreshed {len(modules)} modules")
+        return modules
+
+    def refresh(self, changed: Optional[Iterable[Path]] = None) -> Set[str]:
+        """Refresh all graphs, or only the files that changed, returns the modules that changed."""
+        paths = None if changed is None else list(changed)
+        graphs = list(ImportGraph._registry.values())
+        modules: Set[str] = set()
+        moved: Set[str] = set()
+        for graph in graphs:
+            known = {state.module for state in graph.files.values()}
+            modules |= graph.refresh(paths)
+            moved |= known ^ {state.module for state in graph.files.values()}
+        if moved:
+            # from imports in the other graphs may refer to the modules as well
+            for graph in graphs:
+                modules |= graph.resolve_again(moved)
+        if modules:
+            self.generation += 1
+        return modules
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            self.watcher.wait(POLL_INTERVAL)
+            with self.lock:
+                try:
+                    self.sync()
+                except Exception as ex:
+                    logger.warning(f"Could not refresh the import graphs: {ex}")
+
+    def _watch_new_roots(self) -> None:
+        for graph in list(ImportGraph._registry.values()):
+            if graph.path not in self._roots:
+                self.watcher.watch(graph.path)
+                self._roots.add(graph.path)
+                # changes made before the watch was in place
+                if graph.refresh():
+                    self.generation += 1
+
+    def _ping(self, message: Message) -> Message:
+        graphs = [f"{graph.package} {graph.path}" for graph in ImportGraph._registry.values()]
+        return {"pid": os.getpid(), "graphs": sorted(set(graphs)), "version": self.version}
+
+    def _snapshot(self, message: Message) -> Message:
+        if message.get("version") == self.version:
+            return {"version": self.version, "unchanged": True}
+        walker = WALKERS[message.get("walker", "all")]
+        snapshot = take_snapshot(message["package"], walker)
+        if message.get("format") == "binary":
+            return {"version": self.version, "snapshot": base64.b64encode(_dump_binary(snapshot)).decode()}
+        return {"version": self.version, "snapshot": list(_dump_jsonl(snapshot))}
+
+    def _stop(self, message: Message) -> Message:
+        assert self._server is not None
+        # shutdown() waits for serve_forever() to return, which runs this handler
+        threading.Thread(target=self._server.shutdown).start()
+        return {}
+
+
+def request(socket_path: str | Path, message: Message, timeout: float | None = None) -> Message:
+    """Send a request to a daemon, returns its response.
+
+    Raises ``RuntimeError`` if the request failed.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as response_file:
+            response = json.loads(response_file.readline() or b"{}")
+    if not response.get("ok"):
+        raise RuntimeError(f"archon daemon: {response.get('error', 'no response')}")
+    return response
+
+
+# the last snapshot fetched from a daemon and its version, by socket, packages and walker
+_fetched: Dict[Tuple[str, Tuple[str, ...], str], Tuple[str, Snapshot]] = {}
+
+
+def daemon_snapshot(socket_path: str | Path, package: str | Sequence[str], walker: str = "all") -> Snapshot:
+    """The current import graph of one or more packages, from a daemon.
+
+    Rules can be checked against it: ``rule.check(daemon_snapshot(path, "pkg"))``.
+    As long as no graph in the daemon changed, the snapshot fetched before
+    is returned.
+    """
+    packages = (package,) if isinstance(package, str) else tuple(package)
+    key = (str(socket_path), packages, walker)
+    message: Message = {"command": "snapshot", "package": package, "walker": walker, "format": "binary"}
+    fetched = _fetched.get(key)
+    if fetched is not None:
+        message["version"] = fetched[0]
+    response = request(socket_path, message)
+    if fetched is not None and response.get("unchanged"):
+        return fetched[1]
+    snapshot = _load_binary(base64.b64decode(response["snapshot"]))
+    _fetched[key] = (response["version"], snapshot)
+    return snapshot
+
+
+def daemon_imports(socket_path: str | Path, packages: Sequence[str], walker: Walker) -> ImportMap | None:
+    """The imports of packages, from a daemon.
+
+    Returns ``None`` if the walker is not one of the builtin walkers, or the
+    daemon cannot provide the imports, so the caller can collect them itself.
+    """
+    kind = next((kind for kind, known in WALKERS.items() if known is walker), None)
+    if kind is None:
+        return None
+    try:
+        return daemon_snapshot(socket_path, list(packages), kind).imports
+    except (OSError, RuntimeError) as ex:
+        logger.warning(f"Could not get the imports from the archon daemon at {socket_path}: {ex}")
+        return None
@@ -5,7 +5,13 @@ https://github.com/okken/pytest-check.
 
 from __future__ import annotations
 
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+from itertools import groupby
+from operator import attrgetter
+from typing import Iterable, Iterator, Sequence
 
 
 @dataclass(frozen=True)
@@ -16,17 +22,71 @@ class Failure:
     path: tuple[str, ...]
 
 
+# failures are added to the collector of the current context, if there is
+# one (see collect_failures), and to the process wide list otherwise
+_collector: ContextVar[list[Failure] | None] = ContextVar("archon_failures", default=None)
 _failures: list[Failure] = []
+_lock = threading.Lock()
 
 
-def add_failure(rule_name, rule_comment, reason, path: list[str] | None = None):
-    global _failures
-    _failures.append(Failure(rule_name, rule_comment, reason, tuple(path) if path else ()))
+def make_failure(rule_name, rule_comment, reason, path: Sequence[str] | None = None) -> Failure:
+    return Failure(rule_name, rule_comment, reason, tuple(path) if path else ())
+
+
+def add_failure(rule_name, rule_comment, reason, path: Sequence[str] | None = None):
+    add_failures([make_failure(rule_name, rule_comment, reason, path)])
+
+
+def add_failures(failures: Iterable[Failure]) -> None:
+    """Add the failures of a check at once.
+
+    They stay together, even if checks in other threads add failures at the
+    same time (``format_failures`` groups consecutive failures by rule).
+    """
+    collector = _collector.get()
+    if collector is not None:
+        collector.extend(failures)
+        return
+    failures = list(failures)
+    with _lock:
+        _failures.extend(failures)
 
 
 def pop_failures():
     global _failures
+    collector = _collector.get()
+    if collector is not None:
+        failures = collector[:]
+        collector.clear()
+        return failures
+    with _lock:
+        try:
+            return _failures
+        finally:
+            _failures = []
+
+
+@contextmanager
+def collect_failures() -> Iterator[list[Failure]]:
+    """Collect the failures added in the with block in a list of their own.
+
+    Only failures added in the current context (thread or asyncio task) are
+    collected, so checks run concurrently do not see each other's failures.
+    """
+    failures: list[Failure] = []
+    token = _collector.set(failures)
     try:
-        return _failures
+        yield failures
     finally:
-        _failures = []
+        _collector.reset(token)
+
+
+def format_failures(failures):
+    longrepr = []
+    for rule_name, rule_failures in groupby(failures, attrgetter("rule_name")):
+        longrepr.append(f"FAILED Rule '{rule_name}':")
+        for reason, reason_failures in groupby(rule_failures, attrgetter("reason")):
+            longrepr.append(f"- {reason}")
+            for path in set(f.path for f in reason_failures):
+                longrepr.append(f"    from {' ↣ '.join(path)}")
+    return "\n".join(longrepr)
@@ -0,0 +1,556 @@
+from __future__ import annotations
+
+import hashlib
+from array import array
+from collections import deque
+from typing import (
+    AbstractSet,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+
+class CompactGraph(Mapping[str, FrozenSet[str]]):
+    """A read-only import map with a small memory footprint.
+
+    Module names are interned to integer ids. The imports of all modules are
+    stored in two ``array('i')`` buffers (compressed sparse rows): the
+    imports of module ``n`` are ``targets[offsets[n]:offsets[n + 1]]``.
+
+    Only modules that have been collected are keys of the mapping. Modules
+    that are only imported (e.g. ``os``) do have an id.
+    """
+
+    def __init__(self, names: List[str], is_key: bytearray, offsets: array, targets: array) -> None:
+        self.names = names
+        self.ids: Dict[str, int] = {name: node for node, name in enumerate(names)}
+        self.is_key = is_key
+        self.offsets = offsets
+        self.targets = targets
+        self._len = sum(is_key)
+        self._reachability: ReachabilityIndex | None = None
+        self._cycles: List[Tuple[str, ...]] | None = None
+        self._fingerprint: str | None = None
+        self._collapsed: Dict[int, CompactGraph] = {}
+        # derived data, such as pattern matchers, that lives as long as the graph
+        self.memo: Dict[Hashable, Any] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, Iterable[str]]]) -> CompactGraph:
+        """Build a graph from (module, imports) pairs.
+
+        Modules are kept in the order given, imports are sorted.
+        Self-imports are dropped.
+        """
+        ids: Dict[str, int] = {}
+        names: List[str] = []
+
+        def intern(name):
+            node = ids.get(name)
+            if node is None:
+                node = ids[name] = len(names)
+                names.append(name)
+            return node
+
+        edges: Dict[int, List[int]] = {}
+        for module, imports in items:
+            node = intern(module)
+            if node in edges:
+                raise KeyError(f"WTF? duplicate module {module}")
+            edges[node] = [intern(imp) for imp in sorted(set(imports)) if imp != module]
+
+        is_key = bytearray(len(names))
+        offsets = array("i", [0])
+        targets = array("i")
+        for node in range(len(names)):
+            if node in edges:
+                is_key[node] = 1
+                targets.extend(edges[node])
+            offsets.append(len(targets))
+        return cls(names, is_key, offsets, targets)
+
+    def patched(self, updates: Mapping[str, Optional[Iterable[str]]]) -> CompactGraph:
+        """A copy of this graph, with the imports of some modules replaced.
+
+        Modules mapped to ``None`` are removed. Module ids do not change, so
+        the reachability index and memo are carried over to the new graph,
+        rather than rebuilt.
+        """
+        names = list(self.names)
+        ids = dict(self.ids)
+
+        def intern(name):
+            node = ids.get(name)
+            if node is None:
+                node = ids[name] = len(names)
+                names.append(name)
+            return node
+
+        edges: Dict[int, Optional[List[int]]] = {}
+        for module, imports in updates.items():
+            edges[intern(module)] = (
+                None if imports is None else [intern(imp) for imp in sorted(set(imports)) if imp != module]
+            )
+
+        is_key = bytearray(self.is_key)
+        is_key.extend(bytes(len(names) - len(is_key)))
+        offsets = array("i", [0])
+        targets = array("i")
+        for node in range(len(names)):
+            if node in edges:
+                new_edges = edges[node]
+                is_key[node] = new_edges is not None
+                targets.extend(new_edges or ())
+            elif node < len(self.names):
+                targets.extend(self.successors(node))
+            offsets.append(len(targets))
+
+        graph = CompactGraph(names, is_key, offsets, targets)
+        graph.memo = self.memo
+        if self._reachability is not None:
+            graph._reachability = self._reachability.rebased(graph, edges.keys())
+        return graph
+
+    @classmethod
+    def from_mapping(cls, all_imports: Mapping[str, Iterable[str]]) -> CompactGraph:
+        if isinstance(all_imports, CompactGraph):
+            return all_imports
+        return cls.from_items(all_imports.items())
+
+    def __getitem__(self, module: str) -> FrozenSet[str]:
+        node = self.ids.get(module)
+        if node is None or not self.is_key[node]:
+            raise KeyError(module)
+        names = self.names
+        return frozenset(names[t] for t in self.successors(node))
+
+    def __contains__(self, module: object) -> bool:
+        node = self.ids.get(module)  # type: ignore[call-overload]
+        return node is not None and bool(self.is_key[node])
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.names
+        return (names[node] for node, key in enumerate(self.is_key) if key)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"<CompactGraph of {len(self)} modules, {len(self.targets)} imports>"
+
+    def successors(self, node: int) -> array:
+        return self.targets[self.offsets[node] : self.offsets[node + 1]]
+
+    def fingerprint(self) -> str:
+        """A hash of the modules and imports of this graph.
+
+        Graphs built from the same items in the same order have the same
+        fingerprint.
+        """
+        if self._fingerprint is None:
+            h = hashlib.sha1("\n".join(self.names).encode())
+            h.update(self.is_key)
+            h.update(self.offsets.tobytes())
+            h.update(self.targets.tobytes())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def collapse(self, depth: int) -> CompactGraph:
+        """This graph with every module merged into its package at depth.
+
+        At depth 2, ``a.b.c`` and ``a.b.d.e`` become ``a.b``; shorter names
+        are kept. A package imports everything its modules import, imports
+        within a package are dropped. Computed once per depth.
+        """
+        if depth < 1:
+            raise ValueError(f"granularity must be at least 1, not {depth}")
+        collapsed = self._collapsed.get(depth)
+        if collapsed is None:
+            prefixes = [_prefix(name, depth) for name in self.names]
+            edges: Dict[str, set] = {}
+            for node, prefix in enumerate(prefixes):
+                if self.is_key[node]:
+                    edges.setdefault(prefix, set()).update(prefixes[t] for t in self.successors(node))
+            collapsed = self._collapsed[depth] = CompactGraph.from_items(edges.items())
+        return collapsed
+
+    def witness(self, path: Sequence[str], depth: int) -> List[Tuple[str, str]]:
+        """The imports between modules behind a path of ``collapse(depth)``.
+
+        This is the shortest chain of imports that passes through the
+        packages of the path in order, if there is one. Otherwise the import
+        of a package does not lead to the module that imports the next one,
+        and the first import (by name) is picked for every step.
+        """
+        wanted = set(path)
+        members: Dict[str, List[int]] = {}
+        names = self.names
+        for node, name in enumerate(names):
+            prefix = _prefix(name, depth)
+            if prefix in wanted:
+                members.setdefault(prefix, []).append(node)
+        for nodes in members.values():
+            nodes.sort(key=names.__getitem__)
+        steps = [set(members.get(package, ())) for package in path]
+        last = len(path) - 1
+
+        # breadth first, a state is a module and the step of the path it is at
+        parents: Dict[Tuple[int, int], Tuple[int, int] | None] = {}
+        for node in members.get(path[0], ()):
+            parents[node, 0] = None
+        queue = deque(parents)
+        while queue:
+            state = queue.popleft()
+            node, step = state
+            if step == last:
+                chain = []
+                current: Tuple[int, int] | None = state
+                while current is not None:
+                    chain.append(names[current[0]])
+                    current = parents[current]
+                chain.reverse()
+                return list(zip(chain, chain[1:]))
+            for target in self.successors(node):
+                for next_state in ((target, step), (target, step + 1)):
+                    if next_state[1] <= last and target in steps[next_state[1]] and next_state not in parents:
+                        parents[next_state] = state
+                        queue.append(next_state)
+
+        imports = []
+        for step, (package, imported) in enumerate(zip(path, path[1:])):
+            found = next(
+                (
+                    (names[source], names[target])
+                    for source in members.get(package, ())
+                    for target in self.successors(source)
+                    if target in steps[step + 1]
+                ),
+                None,
+            )
+            if found is None:
+                raise KeyError(f"{package} does not import {imported}")
+            imports.append(found)
+        return imports
+
+    @property
+    def reachability(self) -> ReachabilityIndex:
+        """The reachability index of this graph, built on first use."""
+        if self._reachability is None:
+            self._reachability = ReachabilityIndex(self)
+        return self._reachability
+
+    def shortest_paths(self, module: str) -> ShortestPaths:
+        return ShortestPaths(self, module)
+
+    def cycles(self) -> List[Tuple[str, ...]]:
+        """The import cycles: strongly connected components of more than one module.
+
+        The modules of each cycle are sorted. Computed once per graph, in
+        linear time (Tarjan's algorithm).
+        """
+        if self._cycles is None:
+            names = self.names
+            self._cycles = [
+                tuple(sorted(names[node] for node in component))
+                for component in self._components()
+                if len(component) > 1
+            ]
+        return self._cycles
+
+    def shortest_cycle(self, module: str, members: AbstractSet[str]) -> Tuple[str, ...]:
+        """The shortest path from module back to itself, only visiting members."""
+        start = self.ids[module]
+        allowed = {self.ids[name] for name in members}
+        parents: Dict[int, int] = {}
+        queue = deque([start])
+        while queue and start not in parents:
+            node = queue.popleft()
+            for target in self.successors(node):
+                if target in allowed and target not in parents:
+                    parents[target] = node
+                    queue.append(target)
+        if start not in parents:
+            raise KeyError(module)
+        nodes = [start]
+        node = parents[start]
+        while node != start:
+            nodes.append(node)
+            node = parents[node]
+        nodes.append(start)
+        names = self.names
+        return tuple(names[n] for n in reversed(nodes))
+
+    def _components(self) -> Iterator[List[int]]:
+        # iterative version of Tarjan's algorithm
+        successors = self.successors
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        stack: List[int] = []
+        on_stack = set()
+        for root in range(len(self.names)):
+            if root in index or not self.is_key[root]:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(successors(root)))]
+            while work:
+                v, it = work[-1]
+                for w in it:
+                    if w not in index:
+                        index[w] = low[w] = len(index)
+                        stack.append(w)
+                        on_stack.add(w)
+                        work.append((w, iter(successors(w))))
+                        break
+                    if w in on_stack:
+                        low[v] = min(low[v], index[w])
+                else:
+                    work.pop()
+                    if work:
+                        u = work[-1][0]
+                        low[u] = min(low[u], low[v])
+                    if low[v] == index[v]:
+                        component = []
+                        while True:
+                            w = stack.pop()
+                            on_stack.discard(w)
+                            component.append(w)
+                            if w == v:
+                                break
+                        yield component
+
+    def paths(self, module: str) -> Iterator[Tuple[str, ...]]:
+        """All import paths starting at module, depth first.
+
+        This yields the same paths as ``recurse_imports``.
+        """
+        start = self.ids.get(module)
+        if start is None or not self.is_key[start]:
+            return
+        names = self.names
+        is_key = self.is_key
+        seen = {start}
+        path = [start]
+        stack = [iter(self.successors(start))]
+        while stack:
+            for node in stack[-1]:
+                path.append(node)
+                yield tuple(names[n] for n in path)
+                if node not in seen and is_key[node]:
+                    seen.add(node)
+                    stack.append(iter(self.successors(node)))
+                    break
+                path.pop()
+            else:
+                stack.pop()
+                path.pop()
+
+
+class ShortestPaths:
+    """The shortest import path from a module to every module it imports.
+
+    The graph is traversed breadth first. Only a parent pointer is stored
+    for every module reached; a path is built when it is asked for.
+    Iterating yields the modules reached, nearest first. The module itself
+    is only reached if it is part of a cycle.
+    """
+
+    def __init__(self, graph: CompactGraph, module: str) -> None:
+        self.graph = graph
+        self.start = graph.ids.get(module)
+        self.parents: Dict[int, int] = {}
+        self.order: List[int] = []
+        if self.start is None or not graph.is_key[self.start]:
+            return
+
+        parents = self.parents
+        order = self.order
+        is_key = graph.is_key
+        successors = graph.successors
+        expanded = {self.start}
+        queue = deque([self.start])
+        while queue:
+            node = queue.popleft()
+            for target in successors(node):
+                if target in parents:
+                    continue
+                parents[target] = node
+                order.append(target)
+                if target not in expanded and is_key[target]:
+                    expanded.add(target)
+                    queue.append(target)
+
+    def __iter__(self) -> Iterator[str]:
+        names = self.graph.names
+        return (names[node] for node in self.order)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def path(self, module: str) -> Tuple[str, ...]:
+        """The shortest path from the start module to module."""
+        node = self.graph.ids.get(module)
+        if node is None or node not in self.parents:
+            raise KeyError(module)
+        nodes = [node]
+        node = self.parents[node]
+        while node != self.start:
+            nodes.append(node)
+            node = self.parents[node]
+        nodes.append(node)
+        names = self.graph.names
+        return tuple(names[n] for n in reversed(nodes))
+
+
+class ReachabilityIndex:
+    """Transitive closure of an import map.
+
+    Strongly connected components (import cycles) are condensed, and the
+    closure of each component is computed once, when it is first needed.
+    Closures and masks are bitsets (ints), indexed by module id.
+    """
+
+    def __init__(self, all_imports: Mapping[str, AbstractSet[str]]) -> None:
+        self.graph = CompactGraph.from_mapping(all_imports)
+        self._closures: Dict[int, int] = {}
+        self._masks: Dict[Hashable, Tuple[Callable[[str], object], int]] = {}
+
+    def rebased(self, graph: CompactGraph, changed: Iterable[int]) -> ReachabilityIndex:
+        """An index for graph, a patched version of this index' graph.
+
+        Only the closures of modules that could reach a changed module are
+        dropped. Masks are extended with the modules that were added.
+        """
+        changed = set(changed)
+        changed_mask = _bits(changed, len(graph.names))
+        index = ReachabilityIndex(graph)
+        index._closures = {
+            node: closure
+            for node, closure in self._closures.items()
+            if node not in changed and not closure & changed_mask
+        }
+        known = len(self.names)
+        for key, (pred, mask) in self._masks.items():
+            added = (node for node in range(known, len(graph.names)) if pred(graph.names[node]))
+            index._masks[key] = (pred, mask | _bits(added, len(graph.names)))
+        return index
+
+    @property
+    def names(self) -> List[str]:
+        return self.graph.names
+
+    def closure(self, module: str) -> int:
+        """The modules reachable from module, as a bitset.
+
+        The module itself is only part of its closure if it is in a cycle.
+        """
+        node = self.graph.ids.get(module)
+        if node is None:
+            return 0
+        if node not in self._closures:
+            self._condense(node)
+        return self._closures[node]
+
+    def reachable(self, module: str) -> List[str]:
+        return self.names_of(self.closure(module))
+
+    def names_of(self, bits: int) -> List[str]:
+        names = self.names
+        return [names[node] for node, bit in enumerate(reversed(bin(bits)[2:])) if bit == "1"]
+
+    def mask(self, pred: Callable[[str], object], key: Hashable = None) -> int:
+        """A bitset of all modules matching pred.
+
+        If a key is provided, the mask is remembered under that key.
+        """
+        if key is not None and key in self._masks:
+            return self._masks[key][1]
+        mask = _bits((node for node, name in enumerate(self.names) if pred(name)), len(self.names))
+        if key is not None:
+            self._masks[key] = (pred, mask)
+        return mask
+
+    def reaches(self, module: str, mask: int) -> bool:
+        """Can module (transitively) import any of the modules in mask?"""
+        return bool(self.closure(module) & mask)
+
+    def _condense(self, start: int) -> None:
+        # Iterative version of Tarjan's algorithm. Components are found
+        # in reverse topological order, so the closures of all components
+        # a component depends on are known by the time it is completed.
+        successors = self.graph.successors
+        closures = self._closures
+        index: Dict[int, int] = {start: 0}
+        low: Dict[int, int] = {start: 0}
+        stack = [start]
+        on_stack = {start}
+        work = [(start, iter(successors(start)))]
+        while work:
+            v, it = work[-1]
+            for w in it:
+                if w in closures:
+                    continue
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(successors(w))))
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        members.append(w)
+                        if w == v:
+                            break
+                    self._close(members)
+
+    def _close(self, members: List[int]) -> None:
+        closures = self._closures
+        component = set(members)
+        direct = []
+        bits = 0
+        seen = set()
+        for u in members:
+            for w in self.graph.successors(u):
+                direct.append(w)
+                if w not in component:
+                    closure = closures[w]
+                    # all members of a component share the same closure object
+                    if id(closure) not in seen:
+                        seen.add(id(closure))
+                        bits |= closure
+        bits |= _bits(direct, len(self.names))
+        for u in members:
+            closures[u] = bits
+
+
+def _prefix(name: str, depth: int) -> str:
+    return ".".join(name.split(".", depth)[:depth])
+
+
+def _bits(nodes: Iterable[int], size: int) -> int:
+    """A bitset with the bits of nodes set."""
+    buf = bytearray((size + 7) // 8)
+    for node in nodes:
+        buf[node >> 3] |= 1 << (node & 7)
+    return int.from_bytes(buf, "little")
@@ -1,15 +1,165 @@
-from itertools import groupby
-from operator import attrgetter
+import dataclasses
+from pathlib import Path
 
 import pytest
 from _pytest._code.code import ExceptionInfo
 
-from pytest_archon.failure import pop_failures
+from pytest_archon.cache import save_rule_results
+from pytest_archon.failure import format_failures, pop_failures
+from pytest_archon.prewarm import Prewarm
+from pytest_archon.profile import format_stats, stats
 from pytest_archon.rule import archrule
+from pytest_archon.settings import ENGINES, Settings, settings
+
+saved_settings_key = pytest.StashKey[Settings]()
+prewarm_key = pytest.StashKey[Prewarm]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("archon")
+    group.addoption(
+        "--archon-no-cache",
+        action="store_true",
+        default=False,
+        help="do not use the persistent archon parse cache",
+    )
+    group.addoption(
+        "--archon-workers",
+        type=int,
+        default=None,
+        help="number of processes used by archon to parse modules",
+    )
+    group.addoption(
+        "--archon-engine",
+        choices=ENGINES,
+        default=None,
+        help="how archon extracts imports: 'ast' (default), 'scan' or 'pyc'",
+    )
+    group.addoption(
+        "--archon-recheck",
+        action="store_true",
+        default=False,
+        help="evaluate all rules, even if their cached results are still valid",
+    )
+    group.addoption(
+        "--archon-daemon",
+        default=None,
+        metavar="SOCKET",
+        help="get the import graphs from a daemon started with 'pytest-archon --serve SOCKET'",
+    )
+    group.addoption(
+        "--archon-profile",
+        action="store_true",
+        default=False,
+        help="show where archon spent its time: files parsed, cache hits and time per stage and rule",
+    )
+    parser.addini("archon_workers", "number of processes used by archon to parse modules", default=None)
+    parser.addini(
+        "archon_engine", "how archon extracts imports: 'ast' (default), 'scan' or 'pyc'", default=None
+    )
+    parser.addini(
+        "archon_prewarm",
+        "packages of which archon builds the import graph in the background while tests are collected",
+        type="args",
+        default=[],
+    )
+    parser.addini(
+        "archon_daemon",
+        "socket of a daemon started with 'pytest-archon --serve', to get the import graphs from",
+        default=None,
+    )
+    parser.addini(
+        "archon_cache_dir",
+        "directory of the persistent archon parse cache (default: in the pytest cache directory)",
+        default=None,
+    )
+
+
+def pytest_configure(config):
+    config.stash[saved_settings_key] = dataclasses.replace(settings)
+    settings.cache_dir = cache_dir(config)
+    settings.workers = workers(config)
+    settings.engine = engine(config)
+    settings.reuse_results = not config.getoption("archon_recheck")
+    settings.daemon = daemon(config)
+    # pytest-xdist workers share the parse cache, only one of them scans a package
+    settings.shared_cache = hasattr(config, "workerinput")
+    stats.reset()
+
+    targets = config.getini("archon_prewarm")
+    if targets:
+        try:
+            config.stash[prewarm_key] = Prewarm(targets).start()
+        except ValueError as ex:
+            raise pytest.UsageError(f"archon_prewarm: {ex}") from ex
+
+
+def pytest_unconfigure(config):
+    prewarm = config.stash.get(prewarm_key, None)
+    if prewarm:
+        prewarm.wait()
+    save_rule_results()
+    saved = config.stash.get(saved_settings_key, None)
+    if saved:
+        for field in dataclasses.fields(Settings):
+            setattr(settings, field.name, getattr(saved, field.name))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not config.getoption("archon_profile"):
+        return
+    terminalreporter.write_sep("=", "archon profile")
+    for line in format_stats(stats):
+        terminalreporter.write_line(line)
+
+
+def workers(config):
+    workers = config.getoption("archon_workers")
+    if workers is None:
+        workers = config.getini("archon_workers")
+    return int(workers) if workers else None
+
+
+def engine(config):
+    engine = config.getoption("archon_engine") or config.getini("archon_engine") or "ast"
+    if engine not in ENGINES:
+        raise pytest.UsageError(
+            f"archon_engine: unknown engine {engine!r}, expected one of {', '.join(ENGINES)}"
+        )
+    return engine
+
+
+def daemon(config):
+    if config.getoption("archon_daemon"):
+        return Path(config.getoption("archon_daemon"))
+    configured = config.getini("archon_daemon")
+    return Path(config.rootpath, configured) if configured else None
+
+
+def cache_dir(config):
+    if config.getoption("archon_no_cache"):
+        return None
+    configured = config.getini("archon_cache_dir")
+    if configured:
+        return Path(config.rootpath, configured)
+    if getattr(config, "cache", None) is None:
+        return None
+    return config.cache.mkdir("archon")
+
+
+@pytest.fixture(scope="session")
+def archon_graphs(pytestconfig):
+    """The import graphs built in the background (``archon_prewarm``), by target.
+
+    Each target has a list of graphs, one for each directory of a namespace
+    package. Waits until they are ready.
+    """
+    prewarm = pytestconfig.stash.get(prewarm_key, None)
+    return prewarm.wait() if prewarm else {}
 
 
 @pytest.fixture(name="archrule")
-def check_fixture():
+def check_fixture(archon_graphs):
     return archrule
 
 
@@ -41,16 +191,5 @@ def pytest_runtest_makereport(item, call):
         call.excinfo = excinfo
 
 
-def format_failures(failures):
-    longrepr = []
-    for rule_name, rule_failures in groupby(failures, attrgetter("rule_name")):
-        longrepr.append(f"FAILED Rule '{rule_name}':")
-        for reason, reason_failures in groupby(rule_failures, attrgetter("reason")):
-            longrepr.append(f"- {reason}")
-            for path in set(f.path for f in reason_failures):
-                longrepr.append(f"    from {' ↣ '.join(path)}")
-    return "\n".join(longrepr)
-
-
 class ModelViolation(AssertionError):
     pass
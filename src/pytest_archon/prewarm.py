@@ -0,0 +1,59 @@
+"""Build import graphs in the background, before the first check needs them.
+
+A target is a package name, optionally followed by the kind of imports to
+collect: ``mypkg`` (all imports), ``mypkg:runtime`` (as with
+``skip_type_checking=True``) or ``mypkg:toplevel`` (as with
+``only_toplevel_imports=True``).
+"""
+
+from __future__ import annotations
+
+import threading
+from logging import getLogger
+from typing import Dict, List, Sequence, Tuple
+
+from pytest_archon.collect import ImportGraph, Walker, import_graphs, walk, walk_runtime, walk_toplevel
+from pytest_archon.settings import settings
+
+logger = getLogger(__name__)
+
+WALKERS = {"all": walk, "runtime": walk_runtime, "toplevel": walk_toplevel}
+
+
+def parse_target(target: str) -> Tuple[str, Walker]:
+    package, _, kind = target.partition(":")
+    if kind and kind not in WALKERS:
+        raise ValueError(f"unknown import kind {kind!r} in {target!r}, expected one of {', '.join(WALKERS)}")
+    return package, WALKERS[kind or "all"]
+
+
+class Prewarm:
+    """Builds the import graphs of a number of targets in a background thread.
+
+    The graphs end up in the ``ImportGraph`` registry, so checks of the same
+    package and walker pick them up. A namespace package has a graph for
+    each of its directories. A target that cannot be built is logged and
+    left to the check, which will raise the actual error.
+    """
+
+    def __init__(self, targets: Sequence[str]) -> None:
+        self.targets = {target: parse_target(target) for target in targets}
+        self.graphs: Dict[str, List[ImportGraph]] = {}
+        self._thread = threading.Thread(target=self._run, name="archon-prewarm", daemon=True)
+
+    def start(self) -> Prewarm:
+        self._thread.start()
+        return self
+
+    def wait(self) -> Dict[str, List[ImportGraph]]:
+        """Wait until all graphs are built, returns them by target."""
+        if self._thread.is_alive():
+            self._thread.join()
+        return self.graphs
+
+    def _run(self) -> None:
+        for target, (package, walker) in self.targets.items():
+            try:
+                self.graphs[target] = import_graphs(package, walker, settings.workers, settings.engine)
+            except Exception as ex:
+                logger.warning(f"Could not prewarm the import graph of {target}: {ex!r}")
@@ -0,0 +1,106 @@
+"""Counters and timers for the stages of collecting imports and checking rules.
+
+``stats`` is updated as graphs are built and rules are checked, whether the
+summary is printed (``pytest --archon-profile``) or not. It can be read
+directly, e.g. to feed a dashboard::
+
+    from pytest_archon.profile import stats
+
+    stats.reset()
+    ...  # check rules
+    print(stats.as_dict())
+
+Stages (in seconds):
+
+collect:
+    building and refreshing import graphs, including the stages below
+read:
+    reading source files
+parse:
+    parsing (or scanning) source files and finding the import statements
+resolve:
+    resolving the names of from imports, once for all files parsed
+evaluate:
+    traversing the import graphs to evaluate rules
+
+Files parsed in worker processes (``workers`` > 1) are not counted per
+stage: the pool as a whole is timed as ``parse``.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Dict, Iterator, List
+
+STAGES = ("collect", "read", "parse", "resolve", "evaluate")
+
+
+@dataclass
+class RuleStats:
+    """How much work the checks of one rule took.
+
+    Rules checked together by ``check_all`` share the collection and the
+    traversal, so each of them is charged the wall time of the whole call.
+    """
+
+    checks: int = 0
+    candidates: int = 0
+    steps: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class Stats:
+    files_parsed: int = 0
+    cache_hits: int = 0
+    resolutions: int = 0
+    # stat, read and directory listing calls made by archon itself
+    syscalls: int = 0
+    # rules reported from the rule results cache, without evaluating them
+    results_reused: int = 0
+    seconds: Dict[str, float] = field(default_factory=dict)
+    rules: Dict[str, RuleStats] = field(default_factory=dict)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Add the time spent in the with block to a stage."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + perf_counter() - start
+
+    def rule(self, name: str) -> RuleStats:
+        return self.rules.setdefault(name, RuleStats())
+
+    def reset(self) -> None:
+        for f in dataclasses.fields(self):
+            setattr(self, f.name, f.default_factory() if callable(f.default_factory) else f.default)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+stats = Stats()
+
+
+def format_stats(stats: Stats) -> List[str]:
+    """The lines of the profile summary, slowest rules first."""
+    lines = [
+        f"files parsed: {stats.files_parsed}, cache hits: {stats.cache_hits}, "
+        f"resolutions: {stats.resolutions}, syscalls: {stats.syscalls}, "
+        f"results reused: {stats.results_reused}"
+    ]
+    if stats.seconds:
+        order = sorted(stats.seconds, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+        stages = ", ".join(f"{stage} {stats.seconds[stage]:.3f}s" for stage in order)
+        lines.append(f"stages: {stages}")
+    for name, rule in sorted(stats.rules.items(), key=lambda item: -item[1].seconds):
+        lines.append(
+            f"{rule.seconds:.3f}s {rule.checks:>4} checks {rule.candidates:>6} candidates "
+            f"{rule.steps:>8} steps  {name}"
+        )
+    return lines
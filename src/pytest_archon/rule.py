@@ -1,36 +1,51 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import re
-from dataclasses import dataclass
-from fnmatch import fnmatchcase
+from dataclasses import dataclass, field
+from fnmatch import translate
+from functools import partial
+from time import perf_counter
 from types import ModuleType
-from typing import Callable, Set
+from typing import AbstractSet, Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
 
 
+from pytest_archon.cache import rule_results, walker_kind
 from pytest_archon.collect import (
     ImportMap,
+    Walker,
     collect_imports,
+    package_name,
     recurse_imports,
     walk,
     walk_runtime,
     walk_toplevel,
 )
-from pytest_archon.failure import add_failure  # type: ignore[import]
+from pytest_archon.failure import add_failures, make_failure  # type: ignore[import]
+from pytest_archon.graph import CompactGraph, ReachabilityIndex, ShortestPaths
+from pytest_archon.profile import stats
+from pytest_archon.settings import settings
+from pytest_archon.snapshot import Snapshot
 
 
-ConstraintPredicate = Callable[[str, Set[str], ImportMap], bool]
+ConstraintPredicate = Callable[[str, AbstractSet[str], ImportMap], bool]
+LayerPatterns = Union[str, Sequence[str]]
 
 
-@dataclass
+@dataclass(frozen=True)
 class RulePattern:
     is_regex: bool
     pattern: str
+    regex: re.Pattern = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # globs are anchored, so they can be searched for, just like regexes
+        regex = self.pattern if self.is_regex else rf"\A{translate(self.pattern)}"
+        object.__setattr__(self, "regex", re.compile(regex))
 
     def match(self, k: str):
-        if self.is_regex:
-            return re.search(self.pattern, k)
-        else:
-            return fnmatchcase(k, self.pattern)
+        return self.regex.search(k)
 
     def __str__(self):
         if self.is_regex:
@@ -39,6 +54,55 @@ class RulePattern:
             return f"glob pattern /{self.pattern}/"
 
 
+class PatternMatcher:
+    """Match module names against a list of patterns in one go.
+
+    If possible, the patterns are combined into one regular expression.
+    Results are memoized per module name.
+    """
+
+    def __init__(self, patterns: Iterable[RulePattern]) -> None:
+        self.patterns = tuple(patterns)
+        self._search = _combine(self.patterns)
+        self._memo: dict[str, bool] = {}
+
+    def __call__(self, name: str) -> bool:
+        try:
+            return self._memo[name]
+        except KeyError:
+            matched = self._memo[name] = self._search(name)
+            return matched
+
+
+def _combine(patterns: Sequence[RulePattern]) -> Callable[[str], bool]:
+    regexes = [p.regex for p in patterns]
+    if not regexes:
+        return lambda name: False
+    if len(regexes) == 1:
+        return lambda name: regexes[0].search(name) is not None
+
+    # groups (back references) and inline flags do not survive an alternation
+    if all(r.groups == 0 and r.flags == re.UNICODE for r in regexes):
+        try:
+            combined = re.compile("|".join(f"(?:{r.pattern})" for r in regexes))
+        except re.error:
+            pass
+        else:
+            return lambda name: combined.search(name) is not None
+    return lambda name: any(r.search(name) for r in regexes)
+
+
+def pattern_matcher(patterns: Sequence[RulePattern], all_imports: ImportMap | None = None) -> PatternMatcher:
+    """A matcher for patterns, shared for the lifetime of a compact graph."""
+    if not isinstance(all_imports, CompactGraph):
+        return PatternMatcher(patterns)
+    key = ("matcher", tuple(patterns))
+    matcher = all_imports.memo.get(key)
+    if matcher is None:
+        matcher = all_imports.memo[key] = PatternMatcher(patterns)
+    return matcher
+
+
 def _as_rule_patterns(use_regex, patterns):
     return [RulePattern(is_regex=use_regex, pattern=p) for p in patterns]
 
@@ -131,6 +195,15 @@ class RuleTargets:
         """
         return RuleConstraints(self.rule, self).may_import(*pattern, **kwargs)
 
+    def should_not_have_cycles(self) -> RuleConstraints:
+        """Define a constraint that the defined modules should
+        not be part of an import cycle.
+
+        Every cycle is reported once, with the shortest cycle
+        through one of the defined modules.
+        """
+        return RuleConstraints(self.rule, self).should_not_have_cycles()
+
 
 class RuleConstraints:
     def __init__(self, rule: Rule, targets: RuleTargets) -> None:
@@ -140,6 +213,7 @@ class RuleConstraints:
         self.required: list[RulePattern] = []
         self.ignored: list[RulePattern] = []
         self.constraint_preds: list[tuple[ConstraintPredicate, str]] = []
+        self.acyclic = False
 
     def should_not_import(self, *pattern: str) -> RuleConstraints:
         """Define a constraint that the defined modules should
@@ -175,16 +249,34 @@ class RuleConstraints:
         self.ignored.extend(_as_rule_patterns(self.rule.use_regex, pattern))
         return self
 
+    def should_not_have_cycles(self) -> RuleConstraints:
+        """Define a constraint that the defined modules should
+        not be part of an import cycle.
+
+        Every cycle is reported once, with the shortest cycle
+        through one of the defined modules.
+        """
+        self.acyclic = True
+        return self
+
     def check(
         self,
-        package: str | ModuleType,
+        package: str | ModuleType | Sequence[str | ModuleType] | Snapshot,
         *,
         skip_type_checking=False,
         only_toplevel_imports=False,
         only_direct_imports=False,
+        workers: int | None = None,
+        engine: str | None = None,
+        max_witnesses: int | None = None,
+        threads: int | None = None,
+        granularity: int | None = None,
     ) -> None:
         """Check the rule against a package or module.
 
+        Namespace packages and lists of packages are checked as one graph:
+        imports are followed across the packages given.
+
         Options:
 
         skip_type_checking:
@@ -193,75 +285,65 @@ class RuleConstraints:
             Do not traverse functions and methods, looking for imports
         only_direct_imports:
             Only check imports done by the module, not indirect imports
+        workers:
+            Parse files in this many processes (default: serial)
+        engine:
+            Extract imports with the ``"ast"`` (default) or the faster
+            ``"scan"`` engine, or read them from ``__pycache__`` with the
+            ``"pyc"`` engine
+        max_witnesses:
+            Report at most this many forbidden imports per candidate and
+            constraint, the nearest first. The rest is only counted.
+        threads:
+            Evaluate candidates in this many threads (default: serial).
+            Failures are reported in the same order as in a serial run.
+        granularity:
+            Check packages instead of modules: every module is merged into
+            its package at this depth (``pkg.billing`` at depth 2) before
+            candidates are matched and imports are followed. Patterns and
+            predicates see package names. Every violation also names the
+            module level imports behind it.
         """
-        rule_name = self.rule.name
-        rule_comment = self.rule.comment
-
-        if only_toplevel_imports:
-            walker = walk_toplevel
-        elif skip_type_checking:
-            walker = walk_runtime
-        else:
-            walker = walk
-
-        all_imports = collect_imports(
+        check_all(
+            [self],
             package,
-            walker,
+            skip_type_checking=skip_type_checking,
+            only_toplevel_imports=only_toplevel_imports,
+            only_direct_imports=only_direct_imports,
+            workers=workers,
+            engine=engine,
+            max_witnesses=max_witnesses,
+            threads=threads,
+            granularity=granularity,
         )
-        match_criteria = self.targets.match_criteria
-        exclude_criteria = self.targets.exclude_criteria
-
-        candidates: list[str] = []
-        for mp in match_criteria:
-            candidates.extend(k for k in all_imports.keys() if mp.match(k))
-        for ep in exclude_criteria:
-            candidates = [k for k in candidates if not ep.match(k)]
-
-        match_criteria_pretty = [str(c) for c in match_criteria]
-        exclude_criteria_pretty = [str(c) for c in exclude_criteria]
-        if not candidates:
-            add_failure(
-                rule_name,
-                rule_comment,
-                f"NO CANDIDATES MATCHED. Match criteria: {match_criteria_pretty}, "
-                f"exclude_criteria: {exclude_criteria_pretty}",
-            )
-            return
-
-        candidates = sorted(candidates)
-
-        for candidate in candidates:
-            import_map = {candidate: all_imports[candidate]} if only_direct_imports else all_imports
-
-            for constraint in self._find_required_constraints(candidate, import_map):
-                add_failure(
-                    rule_name,
-                    rule_comment,
-                    f"module '{candidate}' is missing REQUIRED imports matching {constraint}",
-                    ["."],
-                )
-
-            for constraint, path in self._find_forbidden_constraints(candidate, import_map):
-                add_failure(
-                    rule_name,
-                    rule_comment,
-                    f"module '{candidate}' has FORBIDDEN import {path[-1]} (matched by {constraint})",
-                    path,
-                )
 
-            for constraint in self._find_constraint_predicates(candidate, import_map):
-                add_failure(
-                    rule_name,
-                    rule_comment,
-                    f"module '{candidate}' VIOLATED constraint '{constraint}'",
-                    ["."],
-                )
+    def _candidates(self, all_imports: ImportMap) -> list[str]:
+        match = pattern_matcher(self.targets.match_criteria, all_imports)
+        exclude = pattern_matcher(self.targets.exclude_criteria, all_imports)
+        return sorted(k for k in all_imports.keys() if match(k) and not exclude(k))
+
+    def _no_candidates_reason(self) -> str:
+        match_criteria_pretty = [str(c) for c in self.targets.match_criteria]
+        exclude_criteria_pretty = [str(c) for c in self.targets.exclude_criteria]
+        return (
+            f"NO CANDIDATES MATCHED. Match criteria: {match_criteria_pretty}, "
+            f"exclude_criteria: {exclude_criteria_pretty}"
+        )
 
-    def _find_required_constraints(self, module: str, all_imports: ImportMap):
+    def _find_required_constraints(
+        self,
+        module: str,
+        all_imports: ImportMap,
+        index: ReachabilityIndex | None = None,
+        graph: ImportMap | None = None,
+    ):
         for constraint in self.required:
-            if not any(
-                imp for path in recurse_imports(module, all_imports) if constraint.match(imp := path[-1])
-            ):
+            match = pattern_matcher([constraint], graph)
+            if index:
+                found = index.reaches(module, index.mask(match, key=constraint))
+            else:
+                found = any(match(path[-1]) for path in recurse_imports(module, all_imports))
+            if not found:
                 yield constraint
 
     def _find_constraint_predicates(self, module: str, all_imports: ImportMap):
@@ -270,14 +352,482 @@ class RuleConstraints:
             if not pred(module, direct_imports, all_imports):
                 yield name
 
-    def _find_forbidden_constraints(
+
+class ForbiddenSearch:
+    """Collect the forbidden imports of one module.
+
+    Imported modules are fed in by a breadth first traversal that can be
+    shared by multiple rules. Constraints that cannot be violated according
+    to the reachability index are left out beforehand.
+
+    At most ``max_witnesses`` imports are kept per constraint, the others
+    are only counted.
+    """
+
+    def __init__(
         self,
+        rule: RuleConstraints,
         module: str,
-        all_imports: ImportMap,
-    ):
-        for constraint in self.forbidden:
-            yield from (
-                (constraint, path)
-                for path in recurse_imports(module, all_imports)
-                if constraint.match(path[-1]) and not any(ignore.match(path[-1]) for ignore in self.ignored)
+        index: ReachabilityIndex | None = None,
+        graph: ImportMap | None = None,
+        max_witnesses: int | None = None,
+    ) -> None:
+        self.forbidden = pattern_matcher(rule.forbidden, graph)
+        self.ignored = pattern_matcher(rule.ignored, graph)
+        constraints = [(c, pattern_matcher([c], graph)) for c in rule.forbidden]
+        if index:
+            ignored_mask = index.mask(self.ignored, key=self.ignored.patterns)
+            constraints = [
+                (c, match)
+                for c, match in constraints
+                if index.reaches(module, index.mask(match, key=c) & ~ignored_mask)
+            ]
+        self.constraints = constraints
+        self.max_witnesses = max_witnesses
+        self.witnesses: list[list[str]] = [[] for _ in constraints]
+        self.omitted = [0] * len(constraints)
+
+    def __bool__(self) -> bool:
+        return bool(self.constraints)
+
+    def visit(self, imp: str) -> None:
+        if self.forbidden(imp) and not self.ignored(imp):
+            for i, (_, match) in enumerate(self.constraints):
+                if match(imp):
+                    if self.max_witnesses is None or len(self.witnesses[i]) < self.max_witnesses:
+                        self.witnesses[i].append(imp)
+                    else:
+                        self.omitted[i] += 1
+
+    def found(self, paths: ShortestPaths) -> Iterator[tuple[RulePattern, Sequence[str]]]:
+        """The constraint and shortest path of every forbidden import kept."""
+        for (constraint, _), witnesses in zip(self.constraints, self.witnesses):
+            for imp in witnesses:
+                yield constraint, paths.path(imp)
+
+    def omissions(self) -> Iterator[tuple[RulePattern, int]]:
+        """The number of forbidden imports left out, per constraint."""
+        for (constraint, _), omitted in zip(self.constraints, self.omitted):
+            if omitted:
+                yield constraint, omitted
+
+
+CheckOptions = Dict[str, Any]
+_walker_options = ("skip_type_checking", "only_toplevel_imports", "only_direct_imports")
+_check_options = _walker_options + ("max_witnesses", "granularity")
+
+
+def check_all(
+    rules: Iterable[RuleConstraints | tuple[RuleConstraints, CheckOptions]],
+    package: str | ModuleType | Sequence[str | ModuleType] | Snapshot,
+    *,
+    workers: int | None = None,
+    engine: str | None = None,
+    threads: int | None = None,
+    **options,
+) -> None:
+    """Check a number of rules against a package or module in one go.
+
+    The import graph is collected once per walker, and all rules are
+    evaluated in a single traversal per candidate. Failures are reported
+    per rule, in the same way separate ``check()`` calls would.
+
+    Options (``skip_type_checking``, ``only_toplevel_imports``,
+    ``only_direct_imports``, ``max_witnesses`` and ``granularity``) apply to all rules. A rule
+    can override them by passing it as a ``(rule, options)`` tuple.
+    With ``threads``, candidates are evaluated in a pool of threads.
+
+    If a cache directory is configured, the failures of every rule are
+    cached. A rule is not evaluated again as long as neither the rule nor
+    the import graph changed (see ``settings.reuse_results``).
+    """
+    start = perf_counter()
+    checks: list[tuple[RuleConstraints, CheckOptions]] = []
+    for entry in rules:
+        rule, overrides = entry if isinstance(entry, tuple) else (entry, {})
+        rule_options = {**options, **overrides}
+        unknown = set(rule_options) - set(_check_options)
+        if unknown:
+            raise TypeError(f"unexpected check option(s): {', '.join(sorted(unknown))}")
+        granularity = rule_options.get("granularity")
+        if granularity is not None and granularity < 1:
+            raise ValueError(f"granularity must be at least 1, not {granularity}")
+        checks.append((rule, rule_options))
+
+    groups: dict[tuple[Walker, bool, int | None], list[int]] = {}
+    for i, (_, rule_options) in enumerate(checks):
+        key = (
+            _walker(**rule_options),
+            bool(rule_options.get("only_direct_imports")),
+            rule_options.get("granularity"),
+        )
+        groups.setdefault(key, []).append(i)
+
+    failures: list[list[tuple[str, Sequence[str] | None]]] = [[] for _ in checks]
+    results = rule_results()
+    for (walker, only_direct_imports, granularity), members in groups.items():
+        all_imports = _imports(package, walker, workers, engine)
+        keys: dict[int, str] = {}
+        if results is not None:
+            graph_key = CompactGraph.from_mapping(all_imports).fingerprint()
+            for i in members:
+                rule_key = _fingerprint(*checks[i])
+                if rule_key is not None:
+                    keys[i] = f"{graph_key}-{rule_key}"
+            if settings.reuse_results:
+                reused = set()
+                for i, rule_key in keys.items():
+                    cached = results.get(rule_key)
+                    if cached is not None:
+                        failures[i].extend(cached)
+                        reused.add(i)
+                stats.results_reused += len(reused)
+                members = [i for i in members if i not in reused]
+        if not members:
+            continue
+
+        with stats.timer("evaluate"):
+            graph = CompactGraph.from_mapping(all_imports)
+            _evaluate(
+                [checks[i][0] for i in members],
+                graph if granularity is None else graph.collapse(granularity),
+                only_direct_imports,
+                [failures[i] for i in members],
+                [checks[i][1].get("max_witnesses") for i in members],
+                threads,
             )
+            if granularity is not None:
+                for i in members:
+                    failures[i][:] = [_drill_down(failure, graph, granularity) for failure in failures[i]]
+        for i in members:
+            if i in keys:
+                results.put(keys[i], failures[i])  # type: ignore[union-attr]
+
+    elapsed = perf_counter() - start
+    for rule, _ in checks:
+        rule_stats = stats.rule(rule.rule.name)
+        rule_stats.checks += 1
+        rule_stats.seconds += elapsed
+
+    add_failures(
+        make_failure(rule.rule.name, rule.rule.comment, reason, path)
+        for (rule, _), rule_failures in zip(checks, failures)
+        for reason, path in rule_failures
+    )
+
+
+def _fingerprint(rule: RuleConstraints, options: CheckOptions) -> str | None:
+    """A hash of everything the result of a rule depends on, besides the import graph.
+
+    Rules with predicates are not cached: a predicate may depend on
+    globals, defaults or other code that its source does not show.
+    """
+    if rule.constraint_preds:
+        return None
+
+    def patterns(rule_patterns: Sequence[RulePattern]) -> list[tuple[bool, str]]:
+        return [(p.is_regex, p.pattern) for p in rule_patterns]
+
+    data = {
+        "match": patterns(rule.targets.match_criteria),
+        "exclude": patterns(rule.targets.exclude_criteria),
+        "forbidden": patterns(rule.forbidden),
+        "required": patterns(rule.required),
+        "ignored": patterns(rule.ignored),
+        "acyclic": rule.acyclic,
+        "options": {
+            "walker": walker_kind(_walker(**options)),
+            "only_direct_imports": bool(options.get("only_direct_imports")),
+            "max_witnesses": options.get("max_witnesses"),
+            "granularity": options.get("granularity"),
+        },
+    }
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _drill_down(
+    failure: tuple[str, Sequence[str] | None], graph: CompactGraph, granularity: int
+) -> tuple[str, Sequence[str] | None]:
+    """Add the module level imports behind a path between packages to the reason of a failure."""
+    reason, path = failure
+    if not path or len(path) < 2:
+        return failure
+    # consecutive imports are joined into chains
+    chains: list[list[str]] = []
+    for module, imp in graph.witness(path, granularity):
+        if chains and chains[-1][-1] == module:
+            chains[-1].append(imp)
+        else:
+            chains.append([module, imp])
+    through = ", ".join(" ↣ ".join(chain) for chain in chains)
+    return f"{reason} through {through}", path
+
+
+def _find_cycles(graph: CompactGraph, candidates: AbstractSet[str]) -> Iterator[tuple[str, Sequence[str]]]:
+    for cycle in graph.cycles():
+        members = [module for module in cycle if module in candidates]
+        if members:
+            path = graph.shortest_cycle(members[0], set(cycle))
+            yield f"module '{members[0]}' is part of an import CYCLE of {len(cycle)} modules", path
+
+
+def _imports(
+    package: str | ModuleType | Sequence[str | ModuleType] | Snapshot,
+    walker: Walker,
+    workers: int | None,
+    engine: str | None,
+) -> ImportMap:
+    if isinstance(package, Snapshot):
+        return package.imports_for(walker)
+    if settings.daemon is not None:
+        # imported here, only checks served by a daemon need sockets
+        from pytest_archon.daemon import daemon_imports
+
+        packages = [package] if isinstance(package, (str, ModuleType)) else list(package)
+        imports = daemon_imports(settings.daemon, [package_name(p) for p in packages], walker)
+        if imports is not None:
+            return imports
+    return collect_imports(package, walker, workers, engine)
+
+
+def _walker(skip_type_checking=False, only_toplevel_imports=False, **_) -> Walker:
+    if only_toplevel_imports:
+        return walk_toplevel
+    elif skip_type_checking:
+        return walk_runtime
+    return walk
+
+
+def _evaluate(
+    rules: Sequence[RuleConstraints],
+    all_imports: ImportMap,
+    only_direct_imports: bool,
+    failures: Sequence[list[tuple[str, Sequence[str] | None]]],
+    max_witnesses: Sequence[int | None] | None = None,
+    threads: int | None = None,
+) -> None:
+    if max_witnesses is None:
+        max_witnesses = [None] * len(rules)
+    graph = CompactGraph.from_mapping(all_imports)
+    candidate_rules: dict[str, list[int]] = {}
+    for i, rule in enumerate(rules):
+        candidates = rule._candidates(all_imports)
+        stats.rule(rule.rule.name).candidates += len(candidates)
+        if not candidates:
+            failures[i].append((rule._no_candidates_reason(), None))
+        for candidate in candidates:
+            candidate_rules.setdefault(candidate, []).append(i)
+        if rule.acyclic and candidates:
+            failures[i].extend(_find_cycles(graph, set(candidates)))
+
+    index = None if only_direct_imports else graph.reachability
+    evaluate = partial(
+        _evaluate_candidate,
+        rules=rules,
+        all_imports=all_imports,
+        graph=graph,
+        index=index,
+        only_direct_imports=only_direct_imports,
+        max_witnesses=max_witnesses,
+    )
+    candidates = sorted(candidate_rules)
+    if threads and threads > 1 and len(candidates) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # results come back in candidate order, so failures are reported as in a serial run
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results: Iterable[CandidateResult] = list(
+                executor.map(evaluate, candidates, [candidate_rules[c] for c in candidates])
+            )
+    else:
+        results = (evaluate(candidate, candidate_rules[candidate]) for candidate in candidates)
+
+    for candidate_failures, steps in results:
+        for i, failure in candidate_failures:
+            failures[i].append(failure)
+        for i, count in steps.items():
+            stats.rule(rules[i].rule.name).steps += count
+
+
+# failures (rule index, (reason, path)) and traversal steps per rule index
+CandidateResult = Tuple[List[Tuple[int, Tuple[str, Union[Sequence[str], None]]]], Dict[int, int]]
+
+
+def _evaluate_candidate(
+    candidate: str,
+    members: Sequence[int],
+    rules: Sequence[RuleConstraints],
+    all_imports: ImportMap,
+    graph: CompactGraph,
+    index: ReachabilityIndex | None,
+    only_direct_imports: bool,
+    max_witnesses: Sequence[int | None],
+) -> CandidateResult:
+    """Evaluate the rules that match one candidate.
+
+    Only reads the graph and its (thread safe) memos, so candidates can be
+    evaluated in parallel.
+    """
+    failures: list[tuple[int, tuple[str, Sequence[str] | None]]] = []
+    steps: dict[int, int] = {}
+    import_map = {candidate: all_imports[candidate]} if only_direct_imports else all_imports
+
+    searches = {
+        i: ForbiddenSearch(rules[i], candidate, index, all_imports, max_witnesses[i]) for i in members
+    }
+    paths = None
+    if any(searches.values()):
+        direct_graph = CompactGraph.from_items(import_map.items()) if only_direct_imports else graph
+        paths = direct_graph.shortest_paths(candidate)
+        visitors = [search.visit for search in searches.values() if search]
+        for imp in paths:
+            for visit in visitors:
+                visit(imp)
+        for i, search in searches.items():
+            if search:
+                steps[i] = len(paths)
+
+    for i in members:
+        rule = rules[i]
+        for constraint in rule._find_required_constraints(candidate, import_map, index, all_imports):
+            reason = f"module '{candidate}' is missing REQUIRED imports matching {constraint}"
+            failures.append((i, (reason, ["."])))
+
+        if paths is not None:
+            for constraint, path in searches[i].found(paths):
+                reason = f"module '{candidate}' has FORBIDDEN import {path[-1]} (matched by {constraint})"
+                failures.append((i, (reason, path)))
+            for constraint, omitted in searches[i].omissions():
+                reason = (
+                    f"module '{candidate}' has {omitted} more FORBIDDEN imports (matched by {constraint})"
+                )
+                failures.append((i, (reason, None)))
+
+        for name in rule._find_constraint_predicates(candidate, import_map):
+            failures.append((i, (f"module '{candidate}' VIOLATED constraint '{name}'", ["."])))
+    return failures, steps
+
+
+def layers(
+    *layer: LayerPatterns,
+    name: str = "layers",
+    comment: str | None = None,
+    strict: bool = False,
+    use_regex: bool = False,
+) -> Layers:
+    """Define a layered architecture, from the top layer down.
+
+    A layer is a pattern, or a sequence of patterns. A module belongs to the
+    first layer it matches. Modules may import modules of their own layer
+    and of the layers below it. With ``strict=True``, only the layer right
+    below may be imported.
+    """
+    return Layers(
+        [_as_rule_patterns(use_regex, [p] if isinstance(p, str) else p) for p in layer],
+        name,
+        comment,
+        strict,
+    )
+
+
+class Layers:
+    def __init__(
+        self, layers: List[List[RulePattern]], name: str, comment: str | None, strict: bool = False
+    ) -> None:
+        if len(layers) < 2:
+            raise ValueError("define at least two layers")
+        self.layers = layers
+        self.name = name
+        self.comment = comment
+        self.strict = strict
+
+    def check(
+        self,
+        package: str | ModuleType | Sequence[str | ModuleType] | Snapshot,
+        *,
+        skip_type_checking=False,
+        only_toplevel_imports=False,
+        only_direct_imports=False,
+        workers: int | None = None,
+        engine: str | None = None,
+    ) -> None:
+        """Check the layers against a package or module.
+
+        Every module is assigned to a layer once. Then each layered module
+        is traversed until the next layered modules it imports, through
+        modules outside of the layers. Every import found that goes up, or
+        skips a layer (if strict), is reported with its path.
+
+        Options are the same as for ``RuleConstraints.check()``.
+        """
+        start = perf_counter()
+        walker = _walker(skip_type_checking=skip_type_checking, only_toplevel_imports=only_toplevel_imports)
+        graph = CompactGraph.from_mapping(_imports(package, walker, workers, engine))
+        add_failures(
+            make_failure(self.name, self.comment, reason, path)
+            for reason, path in self._violations(graph, only_direct_imports)
+        )
+        rule_stats = stats.rule(self.name)
+        rule_stats.checks += 1
+        rule_stats.seconds += perf_counter() - start
+
+    def _assign(self, graph: CompactGraph) -> Dict[int, int]:
+        """The layer of every module in a layer, by module id."""
+        matchers = [pattern_matcher(patterns, graph) for patterns in self.layers]
+        assigned = {}
+        for node, module in enumerate(graph.names):
+            for level, matcher in enumerate(matchers):
+                if matcher(module):
+                    assigned[node] = level
+                    break
+        return assigned
+
+    def _violations(self, graph: CompactGraph, only_direct_imports: bool) -> Iterator[Tuple[str, List[str]]]:
+        assigned = self._assign(graph)
+        if not any(graph.is_key[node] for node in assigned):
+            yield f"NO MODULES MATCHED any of the layers {self._describe_all()}", []
+            return
+
+        names = graph.names
+        for node in sorted(assigned, key=names.__getitem__):
+            if not graph.is_key[node]:
+                continue
+            level = assigned[node]
+            for target, path in self._imported_layers(graph, node, assigned, only_direct_imports):
+                target_level = assigned[target]
+                if target_level < level:
+                    kind = "UPWARD"
+                elif self.strict and target_level > level + 1:
+                    kind = "SKIP-LAYER"
+                else:
+                    continue
+                yield (
+                    f"module '{names[node]}' in layer {self._describe(level)} has {kind} import "
+                    f"{names[target]} (layer {self._describe(target_level)})",
+                    [names[n] for n in path],
+                )
+
+    def _imported_layers(
+        self, graph: CompactGraph, start: int, assigned: Dict[int, int], only_direct_imports: bool
+    ) -> Iterator[Tuple[int, List[int]]]:
+        """The layered modules start imports, directly or through modules outside the layers."""
+        parents = {start: start}
+        todo = [start]
+        for node in todo:
+            for target in graph.successors(node):
+                if target in parents:
+                    continue
+                parents[target] = node
+                if target in assigned:
+                    path = [target]
+                    while path[-1] != start:
+                        path.append(parents[path[-1]])
+                    yield target, path[::-1]
+                elif graph.is_key[target] and not only_direct_imports:
+                    todo.append(target)
+
+    def _describe(self, level: int) -> str:
+        return f"{level} ({', '.join(p.pattern for p in self.layers[level])})"
+
+    def _describe_all(self) -> str:
+        return ", ".join(self._describe(level) for level in range(len(self.layers)))
@@ -0,0 +1,279 @@
+"""Find import statements without parsing the module.
+
+Only import statements matter for the import graph, so building a full AST
+is wasted effort for large (generated) modules. The scanner blanks out
+strings and comments and finds the import statements with regular
+expressions. The result is a list of ``ast.Import`` and ``ast.ImportFrom``
+nodes, which can be processed just like the nodes found by a walker.
+
+Modes mirror the walkers in ``collect``:
+
+all:
+    every import statement (``walk``)
+runtime:
+    skip ``if TYPE_CHECKING:`` blocks, including their elif and else
+    clauses (``walk_runtime``)
+toplevel:
+    only import statements in the module body (``walk_toplevel``)
+
+The scanner does not validate the source. It raises ``SyntaxError`` for
+sources it cannot make sense of, e.g. unterminated strings, so the caller
+can fall back to the parser.
+"""
+
+from __future__ import annotations
+
+import ast
+import io
+import keyword
+import re
+import tokenize
+from tokenize import NAME, NUMBER, OP, TokenInfo
+from typing import List, Optional, Tuple
+
+MODES = ("all", "runtime", "toplevel")
+
+# match x: and case y: cannot be followed by an import on the same line
+COMPOUND_KEYWORDS = frozenset(
+    {"if", "elif", "else", "for", "while", "try", "except", "finally", "with", "def", "class", "async"}
+)
+
+# every alternative starts with a literal, which lets the regex engine skip
+# ahead quickly. String prefixes (r, b, f, ...) do not change where a string
+# ends, so they are left alone.
+STRINGS_AND_COMMENTS = re.compile(
+    r"""
+        '''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''
+      | \"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\"
+      | '[^'\\\n]*(?:\\.[^'\\\n]*)*'
+      | "[^"\\\n]*(?:\\.[^"\\\n]*)*"
+      | \#[^\n]*
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+IMPORTS = re.compile(
+    r"""
+        from\b(?P<module>(?:[\w. \t\f]|\\\n)*?)\bimport\b(?P<names>[ \t\f]*\([^)]*\)|(?:[^;\n\\]|\\\n)*)
+      | import\b(?P<plain>(?:[^;\n\\]|\\\n)*)
+    """,
+    re.VERBOSE,
+)
+TYPE_CHECKING_HEADERS = re.compile(r"^[ \t\f]*(?:el)?if\b[^\n]*\bTYPE_CHECKING\b", re.MULTILINE)
+BRACKETS = re.compile(r"[()\[\]{}]")
+WORD = re.compile(r"[ \t\f]*(\w*)")
+INDENT = re.compile(r"[ \t\f]*")
+
+
+def scan_imports(source: bytes, mode: str = "all") -> List[ast.stmt]:
+    """Find the import statements in source."""
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}")
+    if b"import" not in source:
+        return []
+
+    encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+    text = source.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+    code = blank_strings_and_comments(text)
+
+    skipped: List[Tuple[int, int]] = []
+    if mode == "runtime" and "TYPE_CHECKING" in code:
+        skipped = type_checking_blocks(code)
+
+    nodes: List[ast.stmt] = []
+    for match in IMPORTS.finditer(code):
+        pos = match.start()
+        if pos and (code[pos - 1].isalnum() or code[pos - 1] == "_"):
+            # e.g. reimport, not a keyword
+            continue
+        if mode == "toplevel" and not _is_toplevel(code, pos):
+            continue
+        if skipped and any(start <= pos < end for start, end in skipped):
+            continue
+
+        if match.group("plain") is not None:
+            nodes.append(ast.Import(names=_aliases(match.group("plain"))))
+        else:
+            module = "".join(match.group("module").replace("\\\n", " ").split())
+            level = len(module) - len(module.lstrip("."))
+            names = _aliases(match.group("names"))
+            nodes.append(ast.ImportFrom(module=module[level:] or None, names=names, level=level))
+    return nodes
+
+
+def blank_strings_and_comments(text: str) -> str:
+    """Replace every string and comment by a single NUL character.
+
+    Newlines in triple quoted strings disappear with them, so the lines of
+    the result are no longer the lines of the source.
+    """
+    code = STRINGS_AND_COMMENTS.sub("\0", text)
+    if "'" in code or '"' in code:
+        raise SyntaxError("unterminated string literal")
+    return code
+
+
+def _is_toplevel(code: str, pos: int) -> bool:
+    """Is the import statement at pos part of the module body?"""
+    line_start = code.rfind("\n", 0, pos) + 1
+    if line_start > 1 and code[line_start - 2] == "\\":
+        raise SyntaxError("line continuation before import statement")
+    depth = 0
+    for bracket in BRACKETS.findall(code, line_start, pos):
+        depth += 1 if bracket in "([{" else -1
+        if depth < 0:
+            # the line continues a bracketed expression of an earlier line
+            raise SyntaxError("import statement after multi-line expression")
+    return code[line_start] not in " \t\f" and _word(code, line_start) not in COMPOUND_KEYWORDS
+
+
+def type_checking_blocks(code: str) -> List[Tuple[int, int]]:
+    """The (start, end) positions of all ``if TYPE_CHECKING:`` statements."""
+    blocks: List[Tuple[int, int]] = []
+    for match in TYPE_CHECKING_HEADERS.finditer(code):
+        start = match.start()
+        if blocks and start < blocks[-1][1]:
+            # nested in a block that is skipped anyway
+            continue
+        end = _line_end(code, start)
+        if not is_type_checking_header(code[start:end]):
+            continue
+
+        indent = _indent(code, start)
+        depth = _depth(code[start:end])
+        continued = code[end - 1] == "\\"
+        pos = end
+        while pos < len(code):
+            line_start = pos + 1
+            line_end = _line_end(code, line_start)
+            line = code[line_start:line_end]
+            if not depth and not continued and line.strip(" \t\f\0"):
+                width = _indent(code, line_start)
+                if width < indent or (width == indent and _word(line) not in ("elif", "else")):
+                    break
+            depth += _depth(line)
+            continued = line.endswith("\\")
+            pos = line_end
+        blocks.append((start, pos))
+    return blocks
+
+
+def _line_end(code: str, pos: int) -> int:
+    end = code.find("\n", pos)
+    return len(code) if end < 0 else end
+
+
+def _indent(code: str, line_start: int) -> int:
+    match = INDENT.match(code, line_start)
+    return len(match.group().expandtabs(8)) if match else 0
+
+
+def _word(code: str, pos: int = 0) -> str:
+    """The word at pos, after any indentation."""
+    match = WORD.match(code, pos)
+    return match.group(1) if match else ""
+
+
+def _depth(line: str) -> int:
+    return sum(map(line.count, "([{")) - sum(map(line.count, ")]}"))
+
+
+def is_type_checking_header(line: str) -> bool:
+    """Does the line start with ``if TYPE_CHECKING:`` or ``if <expr>.TYPE_CHECKING:``?
+
+    This is the source equivalent of ``collect.type_checking_clause``.
+    Blanked strings are read as numbers, so they still count as atoms.
+    """
+    tokens: List[TokenInfo] = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(line.replace("\0", " 0 ").strip()).readline):
+            if token.type in (NAME, NUMBER, OP):
+                tokens.append(token)
+    except tokenize.TokenError:
+        # an unclosed bracket after the header
+        pass
+    end = _header_end(tokens)
+    return end is not None and _is_type_checking(tokens[1:end])
+
+
+def _header_end(tokens: List[TokenInfo]) -> Optional[int]:
+    """The index of the colon that ends a compound statement header."""
+    depth = 0
+    lambdas = 0
+    for i, token in enumerate(tokens):
+        if token.type == NAME and token.string == "lambda" and depth == 0:
+            lambdas += 1
+        elif token.type == OP:
+            if token.string in ("(", "[", "{"):
+                depth += 1
+            elif token.string in (")", "]", "}"):
+                depth -= 1
+            elif token.string == ":" and depth == 0:
+                if not lambdas:
+                    return i
+                lambdas -= 1
+    return None
+
+
+def _is_type_checking(test: List[TokenInfo]) -> bool:
+    while len(test) > 2 and test[0].string == "(" and _closing_bracket(test, 0) == len(test) - 1:
+        test = test[1:-1]
+    if not test or test[-1].type != NAME or test[-1].string != "TYPE_CHECKING":
+        return False
+    if len(test) == 1:
+        return True
+    if test[-2].string != ".":
+        return False
+
+    # everything before the last dot must be a primary: an atom followed by
+    # attributes, calls and subscripts, without any operators in between
+    i = 0
+    expect_atom = True
+    while i < len(test) - 2:
+        token = test[i]
+        if token.type == OP and token.string in ("(", "[", "{"):
+            closing = _closing_bracket(test, i)
+            if closing is None:
+                return False
+            i = closing
+            expect_atom = False
+        elif token.type == OP and token.string == "." and not expect_atom:
+            expect_atom = True
+        elif token.type in (NAME, NUMBER) and expect_atom:
+            if token.type == NAME and keyword.iskeyword(token.string):
+                return False
+            expect_atom = False
+        elif token.type == NUMBER and test[i - 1].type == NUMBER:
+            # implicitly concatenated strings
+            pass
+        else:
+            return False
+        i += 1
+    return not expect_atom
+
+
+def _closing_bracket(tokens: List[TokenInfo], start: int) -> Optional[int]:
+    depth = 0
+    for i in range(start, len(tokens)):
+        token = tokens[i]
+        if token.type == OP and token.string in ("(", "[", "{"):
+            depth += 1
+        elif token.type == OP and token.string in (")", "]", "}"):
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _aliases(names: str) -> List[ast.alias]:
+    aliases = []
+    names = names.replace("\\\n", " ").replace("\0", " ").replace("(", " ").replace(")", " ")
+    for item in names.split(","):
+        words = item.split()
+        if not words:
+            continue
+        if "as" in words:
+            i = words.index("as")
+            aliases.append(ast.alias(name="".join(words[:i]), asname="".join(words[i + 1 :])))
+        else:
+            aliases.append(ast.alias(name="".join(words), asname=None))
+    return aliases
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+ENGINES = ("ast", "scan", "pyc")
+
+
+@dataclass
+class Settings:
+    """Process wide defaults, usually filled in by the pytest plugin.
+
+    cache_dir:
+        Directory for the persistent parse cache. ``None`` disables it.
+    workers:
+        Number of processes used to parse files. ``None`` parses serially.
+    shared_cache:
+        Lock the parse cache while scanning, so processes that scan the same
+        package (e.g. pytest-xdist workers) do the work only once.
+    engine:
+        How imports are extracted from source files: ``"ast"`` parses them,
+        ``"scan"`` only scans them for import statements, which is faster.
+        ``"pyc"`` reads them from fresh ``__pycache__`` files, if there are.
+    reuse_results:
+        Report the cached result of a rule, instead of evaluating it, if
+        neither the rule nor the import graph changed since it was cached.
+        Results are cached in ``cache_dir``, even if they are not reused.
+    daemon:
+        Socket of a daemon started with ``pytest-archon --serve``. Checks
+        get their import graphs from it, and collect them in process if it
+        cannot be reached.
+    """
+
+    cache_dir: Optional[Path] = None
+    workers: Optional[int] = None
+    shared_cache: bool = False
+    engine: str = "ast"
+    reuse_results: bool = True
+    daemon: Optional[Path] = None
+
+
+settings = Settings()
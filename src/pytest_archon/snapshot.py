@@ -0,0 +1,233 @@
+"""Save the import graph of a package, and check rules against it later.
+
+A snapshot holds the imports collected for one walker, the package roots
+they were collected from and a fingerprint (mtime and size) of every
+source file. Rules can be checked against a loaded snapshot without
+touching the source tree: pass it to ``check()`` instead of a package.
+
+Two formats are supported:
+
+binary:
+    zlib compressed, with the compact graph arrays as is (default)
+jsonl:
+    a header line, followed by one line per module, so other tools can
+    stream it (used for files ending in ``.jsonl``)
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from pytest_archon.cache import walker_kind
+from pytest_archon.collect import ImportGraph, Walker, import_graphs, merge_graphs, package_name, walk
+from pytest_archon.graph import CompactGraph
+from pytest_archon.settings import settings
+
+SNAPSHOT_VERSION = 1
+MAGIC = b"ARCHON-SNAPSHOT\n"
+FORMATS = ("binary", "jsonl")
+
+# root index, path relative to the root, mtime_ns, size
+Fingerprint = Tuple[int, str, int, int]
+
+
+@dataclass
+class Snapshot:
+    walker: str
+    # (package, path) of every root the imports were collected from
+    roots: List[Tuple[str, str]]
+    imports: CompactGraph
+    files: Dict[str, Fingerprint] = field(default_factory=dict)
+    version: int = SNAPSHOT_VERSION
+
+    def imports_for(self, walker: Walker) -> CompactGraph:
+        """The imports, if they were collected with walker."""
+        if walker_kind(walker) != self.walker:
+            raise ValueError(
+                f"the snapshot was taken with walker {self.walker}, not {walker_kind(walker) or walker!r}"
+            )
+        return self.imports
+
+    def stale(self) -> List[str]:
+        """The source files that changed, were added or were removed since the snapshot was taken."""
+        recorded = {(index, path): (mtime_ns, size) for index, path, mtime_ns, size in self.files.values()}
+        stale = []
+        for index, (_, root) in enumerate(self.roots):
+            for py_file in sorted(Path(root).glob("**/*.py")):
+                rel_path = py_file.relative_to(root).as_posix()
+                stat = py_file.stat()
+                if recorded.pop((index, rel_path), None) != (stat.st_mtime_ns, stat.st_size):
+                    stale.append(str(py_file))
+        stale.extend(str(Path(self.roots[index][1], rel_path)) for index, rel_path in recorded)
+        return sorted(stale)
+
+
+def take_snapshot(
+    package: str | ModuleType | Sequence[str | ModuleType],
+    walker: Walker = walk,
+    workers: int | None = None,
+    engine: str | None = None,
+) -> Snapshot:
+    """Collect the imports of one or more packages into a snapshot."""
+    kind = walker_kind(walker)
+    if kind is None:
+        raise ValueError(f"walker {walker!r} has no stable name, it cannot be stored in a snapshot")
+    packages = [package] if isinstance(package, (str, ModuleType)) else list(package)
+
+    graphs: List[ImportGraph] = []
+    for name in map(package_name, packages):
+        graphs.extend(
+            import_graphs(
+                name,
+                walker,
+                settings.workers if workers is None else workers,
+                settings.engine if engine is None else engine,
+            )
+        )
+    imports = graphs[0].imports if len(graphs) == 1 else merge_graphs(graphs)
+
+    files: Dict[str, Fingerprint] = {}
+    for index, graph in enumerate(graphs):
+        for py_file, state in sorted(graph.files.items()):
+            fingerprint = (index, py_file.relative_to(graph.path).as_posix(), state.mtime_ns, state.size)
+            files.setdefault(state.module, fingerprint)
+    return Snapshot(kind, [(graph.package, str(graph.path)) for graph in graphs], imports, files)
+
+
+def save_snapshot(snapshot: Snapshot, file: str | Path, format: str | None = None) -> None:
+    """Write a snapshot, by default as binary, or as JSON lines for ``.jsonl`` files."""
+    file = Path(file)
+    if format is None:
+        format = "jsonl" if file.suffix == ".jsonl" else "binary"
+    if format not in FORMATS:
+        raise ValueError(f"unknown snapshot format {format!r}, expected one of {', '.join(FORMATS)}")
+
+    if format == "binary":
+        file.write_bytes(_dump_binary(snapshot))
+    else:
+        with file.open("w", encoding="utf-8") as out:
+            for line in _dump_jsonl(snapshot):
+                out.write(line)
+                out.write("\n")
+
+
+def load_snapshot(file: str | Path) -> Snapshot:
+    """Read a snapshot written by ``save_snapshot``, in either format."""
+    file = Path(file)
+    with file.open("rb") as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    if binary:
+        return _load_binary(file.read_bytes())
+    with file.open(encoding="utf-8") as lines:
+        return _load_jsonl(lines)
+
+
+def _header(snapshot: Snapshot) -> dict:
+    return {
+        "format": "pytest-archon-snapshot",
+        "version": snapshot.version,
+        "walker": snapshot.walker,
+        "roots": snapshot.roots,
+    }
+
+
+def _check_header(header: dict) -> None:
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"unsupported snapshot version {header.get('version')!r}, expected {SNAPSHOT_VERSION}"
+        )
+
+
+def _dump_jsonl(snapshot: Snapshot) -> Iterator[str]:
+    yield json.dumps(_header(snapshot))
+    imports = snapshot.imports
+    for module in imports:
+        entry: Dict[str, Any] = {"module": module, "imports": sorted(imports[module])}
+        if module in snapshot.files:
+            entry["file"] = snapshot.files[module]
+        yield json.dumps(entry)
+
+
+def _load_jsonl(lines: Iterable[str]) -> Snapshot:
+    lines = iter(lines)
+    header = json.loads(next(lines, "{}"))
+    _check_header(header)
+    files: Dict[str, Fingerprint] = {}
+    items = []
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        items.append((entry["module"], entry["imports"]))
+        if "file" in entry:
+            files[entry["module"]] = _fingerprint(entry["file"])
+    return Snapshot(header["walker"], _roots(header), CompactGraph.from_items(items), files)
+
+
+def _fingerprint(value: Sequence) -> Fingerprint:
+    index, path, mtime_ns, size = value
+    return int(index), str(path), int(mtime_ns), int(size)
+
+
+def _roots(header: dict) -> List[Tuple[str, str]]:
+    return [(str(package), str(path)) for package, path in header["roots"]]
+
+
+def _dump_binary(snapshot: Snapshot) -> bytes:
+    graph = snapshot.imports
+    metadata = {**_header(snapshot), "files": snapshot.files}
+    blocks = [
+        json.dumps(metadata).encode(),
+        "\n".join(graph.names).encode(),
+        bytes(graph.is_key),
+        _int_bytes(graph.offsets),
+        _int_bytes(graph.targets),
+    ]
+    body = b"".join(struct.pack("<I", len(block)) + block for block in blocks)
+    return MAGIC + struct.pack("<I", SNAPSHOT_VERSION) + zlib.compress(body)
+
+
+def _load_binary(data: bytes) -> Snapshot:
+    (version,) = struct.unpack_from("<I", data, len(MAGIC))
+    _check_header({"version": version})
+    body = zlib.decompress(data[len(MAGIC) + 4 :])
+    blocks = []
+    pos = 0
+    while pos < len(body):
+        (size,) = struct.unpack_from("<I", body, pos)
+        blocks.append(body[pos + 4 : pos + 4 + size])
+        pos += 4 + size
+    metadata, names, is_key, offsets, targets = blocks
+
+    header = json.loads(metadata)
+    graph = CompactGraph(
+        names.decode().split("\n") if names else [],
+        bytearray(is_key),
+        _int_array(offsets),
+        _int_array(targets),
+    )
+    files = {module: _fingerprint(fingerprint) for module, fingerprint in header["files"].items()}
+    return Snapshot(header["walker"], _roots(header), graph, files)
+
+
+def _int_bytes(values: array) -> bytes:
+    values = array("i", values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _int_array(data: bytes) -> array:
+    values = array("i")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BENCH = Path(__file__).parents[1] / "benchmarks" / "bench.py"
+
+
+def test_benchmarks_run(tmp_path):
+    results = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, str(BENCH), "--sizes", "50", "--repeat", "1", "--root", str(tmp_path / "packages")]
+        + ["--json", str(results)],
+        check=True,
+        capture_output=True,
+    )
+
+    benchmarks = json.loads(results.read_text())
+    assert {b["benchmark"] for b in benchmarks} == {
+        "collect_imports (no cache)",
+        "resolve_module_or_object_by_path",
+        "recurse_imports",
+        "check (cold graph)",
+        "check (warm graph)",
+    }
+    assert len(list((tmp_path / "packages" / "synth50").glob("**/m*.py"))) == 50
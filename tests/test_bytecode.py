@@ -0,0 +1,78 @@
+import ast
+import compileall
+import py_compile
+import sys
+
+import pytest
+from test_scanner import SNIPPETS
+
+from pytest_archon.bytecode import bytecode_imports, cached_code
+from pytest_archon.collect import collect_imports_from_path as collect
+from pytest_archon.collect import extract_imports_ast, walk, walk_runtime
+
+
+def imports(nodes):
+    return set(extract_imports_ast(nodes, "pkg.sub.mod", resolve=False))
+
+
+@pytest.mark.parametrize(
+    "source",
+    SNIPPETS
+    + [
+        "\n".join(f"name{i} = {i}.5" for i in range(300)) + "\nimport a\nfrom .b import c",
+        "class A:\n    x = [y for y in ()]\n    def f(self):\n        from b import c\n",
+        "def f():\n    def g():\n        import a.b as c\n    return g",
+    ],
+)
+def test_snippets_match_ast(source):
+    if "match x:" in source and sys.version_info < (3, 10):
+        pytest.skip("match statements need python 3.10")
+
+    code = compile(source, "<snippet>", "exec")
+    assert imports(bytecode_imports(code)) == imports(walk(ast.parse(source)))
+
+
+def test_cached_code_is_fresh(tmp_path):
+    py_file = tmp_path / "mod.py"
+    py_file.write_text("import os\n")
+    assert cached_code(py_file, py_file.read_bytes()) is None
+
+    py_compile.compile(str(py_file))
+    assert cached_code(py_file, py_file.read_bytes())
+
+    py_file.write_text("import sys, os\n")
+    assert cached_code(py_file, py_file.read_bytes()) is None
+
+
+def test_cached_code_checks_hash_based_pyc(tmp_path):
+    py_file = tmp_path / "mod.py"
+    py_file.write_text("import os\n")
+    for mode in (py_compile.PycInvalidationMode.CHECKED_HASH, py_compile.PycInvalidationMode.UNCHECKED_HASH):
+        py_compile.compile(str(py_file), invalidation_mode=mode)
+        assert cached_code(py_file, py_file.read_bytes())
+        assert cached_code(py_file, b"import sys\n") is None
+
+
+def test_pyc_engine(create_testset, monkeypatch):
+    path = create_testset(
+        ("mymodule.py", "import sys\nif TYPE_CHECKING:\n    import os\n"),
+        ("other.py", "from . import mymodule\ndef f():\n    import json\n"),
+    )
+    expected = collect(path, "pkg", walk, engine="ast")
+    compileall.compile_dir(str(path), quiet=1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file should not be parsed")
+
+    monkeypatch.setattr(ast, "parse", fail)
+    assert collect(path, "pkg", walk, engine="pyc") == expected
+
+
+def test_pyc_engine_falls_back_to_ast(create_testset):
+    path = create_testset(
+        ("mymodule.py", "import sys\nif TYPE_CHECKING:\n    import os\n"), ("other.py", "import json")
+    )
+    compileall.compile_file(str(path / "mymodule.py"), quiet=1)
+
+    for walker in (walk, walk_runtime):
+        assert collect(path, "pkg", walker, engine="pyc") == collect(path, "pkg", walker, engine="ast")
@@ -0,0 +1,234 @@
+import ast
+import compileall
+import os
+import threading
+
+import pytest
+
+import pytest_archon.rule
+from pytest_archon import archrule
+from pytest_archon.cache import RuleResults, file_lock, rule_results, save_rule_results
+from pytest_archon.collect import ImportGraph
+from pytest_archon.collect import collect_imports_from_path as collect
+from pytest_archon.collect import forget_module_indexes, walk, walk_toplevel
+from pytest_archon.failure import pop_failures
+from pytest_archon.profile import stats
+from pytest_archon.settings import settings
+
+
+@pytest.fixture
+def cache_dir(tmp_path_factory, monkeypatch):
+    path = tmp_path_factory.mktemp("archon-cache")
+    monkeypatch.setattr(settings, "cache_dir", path)
+    return path
+
+
+@pytest.fixture
+def forbid_parsing(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("file should not be parsed")
+
+    return lambda: monkeypatch.setattr(ast, "parse", fail)
+
+
+def test_warm_run_does_not_parse(create_testset, cache_dir, forbid_parsing):
+    path = create_testset(("mymodule.py", "import sys"), ("other.py", "import os"))
+    cold = collect(path, "pkg", walk)
+    forbid_parsing()
+    warm = collect(path, "pkg", walk)
+
+    assert warm == cold
+    assert list(cache_dir.iterdir())
+
+
+def test_changed_file_is_parsed_again(create_testset, cache_dir):
+    path = create_testset(("mymodule.py", "import sys"))
+    collect(path, "pkg", walk)
+
+    (path / "mymodule.py").write_text("import os, sys\n")
+    collected = dict(collect(path, "pkg", walk))
+
+    assert collected["pkg.mymodule"] == {"os", "sys"}
+
+
+def test_touched_file_is_checked_by_hash(create_testset, cache_dir, forbid_parsing):
+    path = create_testset(("mymodule.py", "import sys"))
+    collect(path, "pkg", walk)
+
+    stat = (path / "mymodule.py").stat()
+    os.utime(path / "mymodule.py", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+    forbid_parsing()
+    collected = dict(collect(path, "pkg", walk))
+
+    assert collected["pkg.mymodule"] == {"sys"}
+
+
+def test_warm_run_resolves_names_again(create_testset, cache_dir):
+    path = create_testset(
+        ("pkgwarm/__init__.py", ""),
+        ("pkgwarm/a.py", "from pkgwarm.foo import bar"),
+        ("pkgwarm/foo/__init__.py", "bar = 1"),
+    )
+    assert dict(collect(path / "pkgwarm", "pkgwarm"))["pkgwarm.a"] == {"pkgwarm.foo"}
+
+    # a new run, with a module added since the last one
+    forget_module_indexes()
+    stats.reset()
+    (path / "pkgwarm" / "foo" / "bar.py").write_text("")
+    assert dict(collect(path / "pkgwarm", "pkgwarm"))["pkgwarm.a"] == {"pkgwarm.foo.bar"}
+    # only the new module is parsed
+    assert stats.files_parsed == 1
+
+    # and removed again
+    forget_module_indexes()
+    (path / "pkgwarm" / "foo" / "bar.py").unlink()
+    assert dict(collect(path / "pkgwarm", "pkgwarm"))["pkgwarm.a"] == {"pkgwarm.foo"}
+
+
+def test_cache_is_per_walker(create_testset, cache_dir):
+    path = create_testset(("mymodule.py", "import sys\nif 0:\n    import os\n"))
+    collect(path, "pkg", walk)
+
+    collected = dict(collect(path, "pkg", walk_toplevel))
+
+    assert collected["pkg.mymodule"] == {"sys"}
+
+
+def test_cache_is_per_engine(create_testset, cache_dir, monkeypatch):
+    # the compiler drops the dead code, and the import in it
+    path = create_testset(("mymodule.py", "import os\nif False:\n    import json\n"))
+    compileall.compile_dir(str(path), quiet=1)
+    monkeypatch.setattr(ImportGraph, "_registry", {})
+
+    collect(path, "pkg", walk, engine="pyc")
+    pyc_graph = ImportGraph.for_root(path, "pkg", walk, engine="pyc")
+
+    assert dict(collect(path, "pkg", walk, engine="ast"))["pkg.mymodule"] == {"os", "json"}
+    assert ImportGraph.for_root(path, "pkg", walk, engine="ast") is not pyc_graph
+    assert ImportGraph.for_root(path, "pkg", walk, engine="scan").imports["pkg.mymodule"] == {"os", "json"}
+
+
+def test_shared_cache_waits_for_other_process(create_testset, cache_dir, monkeypatch):
+    monkeypatch.setattr(settings, "shared_cache", True)
+    path = create_testset(("mymodule.py", "import sys"))
+    collect(path, "pkg", walk)
+    (lock_file,) = cache_dir.glob("pkg-*.lock")
+
+    (path / "mymodule.py").write_text("import os\n")
+    result = {}
+    with file_lock(lock_file):
+        scan = threading.Thread(target=lambda: result.update(collect(path, "pkg", walk)))
+        scan.start()
+        scan.join(0.2)
+        assert scan.is_alive()
+    scan.join()
+
+    assert result == {"pkg.mymodule": {"os"}}
+
+
+@pytest.fixture
+def forbid_evaluation(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("rule should not be evaluated")
+
+    return lambda: monkeypatch.setattr(pytest_archon.rule, "_evaluate", fail)
+
+
+@pytest.fixture
+def cached_package(create_testset, cache_dir):
+    create_testset(("pkgrr/__init__.py", ""), ("pkgrr/a.py", "import pkgrr.b"), ("pkgrr/b.py", ""))
+    yield "pkgrr"
+    save_rule_results()
+
+
+def test_unchanged_rule_is_not_evaluated_again(cached_package, forbid_evaluation):
+    rule = archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b")
+    rule.check(cached_package)
+    evaluated = pop_failures()
+    stats.reset()
+
+    forbid_evaluation()
+    archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b").check(cached_package)
+
+    assert pop_failures() == evaluated
+    assert evaluated[0].path == ("pkgrr.a", "pkgrr.b")
+    assert stats.results_reused == 1
+
+
+def test_changed_rule_is_evaluated(cached_package):
+    archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b").check(cached_package)
+    assert pop_failures()
+
+    archrule("cached").match("pkgrr.a").should_not_import("pkgrr.c").check(cached_package)
+    assert not pop_failures()
+    rule = archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b")
+    rule.check(cached_package, only_direct_imports=True)
+    assert pop_failures()
+
+
+def test_changed_graph_is_evaluated(cached_package):
+    rule = archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b")
+    rule.check(cached_package)
+    assert pop_failures()
+
+    graph = ImportGraph.for_package(cached_package)
+    (graph.path / "a.py").write_text("import os\n")
+    graph.refresh()
+    rule.check(cached_package)
+
+    assert not pop_failures()
+
+
+def test_recheck_evaluates_and_stores(cached_package, forbid_evaluation, monkeypatch):
+    rule = archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b")
+    monkeypatch.setattr(settings, "reuse_results", False)
+    rule.check(cached_package)
+    rule.check(cached_package)
+    assert len(pop_failures()) == 2
+
+    monkeypatch.setattr(settings, "reuse_results", True)
+    forbid_evaluation()
+    rule.check(cached_package)
+    assert len(pop_failures()) == 1
+
+
+ALLOWED = {"pkgrr.b"}
+
+
+def only_allowed_imports(module, direct, _):
+    return direct <= ALLOWED
+
+
+def test_rules_with_predicates_are_not_cached(cached_package, monkeypatch):
+    monkeypatch.setattr(settings, "reuse_results", True)
+    rule = archrule("predicate").match("pkgrr.a").should(only_allowed_imports)
+    rule.check(cached_package)
+    assert not pop_failures()
+
+    # the source of the predicate is the same, the global it uses is not
+    monkeypatch.setitem(globals(), "ALLOWED", set())
+    rule.check(cached_package)
+    assert pop_failures()
+
+
+def test_rules_with_closures_are_not_cached(cached_package):
+    allowed = {"pkgrr.b"}
+    rule = archrule("closure").match("pkgrr.a").should(lambda module, direct, _: direct <= allowed)
+    rule.check(cached_package)
+    assert not pop_failures()
+
+    allowed.clear()
+    rule.check(cached_package)
+    assert pop_failures()
+
+
+def test_rule_results_are_saved(cached_package, cache_dir):
+    archrule("cached").match("pkgrr.a").should_not_import("pkgrr.b").check(cached_package)
+    pop_failures()
+    (key,) = rule_results().used
+    save_rule_results()
+
+    results = RuleResults(cache_dir / "rule-results.json")
+
+    reason = "module 'pkgrr.a' has FORBIDDEN import pkgrr.b (matched by glob pattern /pkgrr.b/)"
+    assert results.get(key) == [(reason, ["pkgrr.a", "pkgrr.b"])]
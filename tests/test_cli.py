@@ -0,0 +1,123 @@
+import dataclasses
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pytest_archon.cli import EXIT_ERROR, EXIT_OK, EXIT_VIOLATIONS, main
+from pytest_archon.settings import settings
+
+SRC = str(Path(__file__).parents[1] / "src")
+
+RULES = """\
+from pytest_archon import archrule
+
+
+def test_allowed(archrule):
+    archrule("allowed").match("clipkg.a").should_not_import("clipkg.c").check("clipkg")
+
+
+def test_forbidden():
+    archrule("forbidden").match("clipkg.a").should_not_import("clipkg.b").check("clipkg")
+"""
+
+
+@pytest.fixture
+def project(create_testset, monkeypatch):
+    saved = dataclasses.replace(settings)
+    path = create_testset(
+        ("clipkg/__init__.py", ""),
+        ("clipkg/a.py", "import clipkg.b"),
+        ("clipkg/b.py", ""),
+        ("clipkg/c.py", ""),
+        ("rules_ok.py", RULES.split("\n\n\ndef test_forbidden")[0]),
+        ("rules_all.py", RULES),
+    )
+    monkeypatch.chdir(path)
+    yield path
+    for f in dataclasses.fields(settings):
+        setattr(settings, f.name, getattr(saved, f.name))
+
+
+def test_rules_pass(project, capsys):
+    assert main(["rules_ok.py", "--no-cache"]) == EXIT_OK
+    assert "0 failed, 1 passed, 0 errors" in capsys.readouterr().out
+
+
+def test_rules_violated(project, capsys):
+    assert main(["rules_all.py", "--no-cache"]) == EXIT_VIOLATIONS
+
+    out = capsys.readouterr().out
+    assert "rules_all.py::test_forbidden\nFAILED Rule 'forbidden':" in out
+    assert "1 failed, 1 passed, 0 errors" in out
+
+
+def test_unknown_fixture_is_an_error(project, capsys):
+    (project / "rules_fixture.py").write_text("def test_tmp(tmp_path):\n    pass\n")
+
+    assert main(["rules_fixture.py", "--no-cache"]) == EXIT_ERROR
+    assert "fixture 'tmp_path' is not available outside pytest" in capsys.readouterr().out
+
+
+def test_rules_from_pyproject(project, capsys):
+    (project / "pyproject.toml").write_text(
+        '[tool.pytest-archon]\nrules = ["rules_all.py"]\nengine = "scan"\n'
+    )
+
+    assert main(["--no-cache"]) == EXIT_VIOLATIONS
+    assert settings.engine == "scan"
+
+
+def test_no_rules_is_a_usage_error(project, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        main([])
+
+    assert exc_info.value.code == EXIT_ERROR
+
+
+def test_serve_and_connect(project, capsys):
+    socket_path = project / "archon.sock"
+    server = threading.Thread(target=main, args=(["--serve", str(socket_path), "rules_all.py", "--poll"],))
+    server.start()
+    try:
+        for _ in range(500):
+            if socket_path.exists():
+                break
+            time.sleep(0.01)
+
+        assert main(["--connect", str(socket_path)]) == EXIT_VIOLATIONS
+        (project / "clipkg" / "a.py").write_text("")
+        assert main(["--connect", str(socket_path), "rules_all.py"]) == EXIT_OK
+    finally:
+        from pytest_archon.daemon import request
+
+        request(socket_path, {"command": "stop"})
+        server.join()
+
+    out = capsys.readouterr().out
+    assert f"serving on {socket_path}" in out
+    assert "0 failed, 2 passed, 0 errors" in out
+
+
+def test_startup_does_not_import_pytest(project):
+    script = (
+        "import sys\n"
+        "from pytest_archon.cli import main\n"
+        "code = main(['rules_ok.py', '--no-cache'])\n"
+        "assert 'pytest' not in sys.modules and '_pytest' not in sys.modules, 'pytest was imported'\n"
+        "sys.exit(code)\n"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([SRC, str(project)])}
+    env.pop("PYTEST_PLUGINS", None)
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True)
+    duration = time.perf_counter() - start
+
+    assert result.returncode == EXIT_OK, result.stdout + result.stderr
+    # a cold interpreter, the check itself takes milliseconds
+    assert duration < 2.0
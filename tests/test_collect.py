@@ -1,12 +1,27 @@
+import logging
+import os
 from pathlib import Path
 
+import pytest
+
+import pytest_archon.collect as collect
+from pytest_archon import archrule
 from pytest_archon.collect import (
+    ImportGraph,
+    build_module_index,
     collect_imports_from_path,
+    module_index,
+    parse_file,
     path_to_module,
     recurse_imports,
     resolve_module_or_object_by_path,
     resolve_module_or_object_by_spec,
+    resolve_names,
+    walk,
 )
+from pytest_archon.failure import pop_failures
+from pytest_archon.profile import stats
+from pytest_archon.settings import settings
 
 
 def test_collect_modules(create_testset):
@@ -100,3 +115,276 @@ def test_recurse_imports():
     res = list(recurse_imports("a", all_imports))
 
     assert res == [("a", "b"), ("a", "b", "c"), ("a", "b", "c", "e"), ("a", "b", "d"), ("a", "c")]
+
+
+def test_parallel_collection_matches_serial(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(
+        ("package/__init__.py", ""),
+        ("package/module.py", "from .importme import val\nimport os"),
+        ("package/importme.py", "val = 1"),
+        ("package/sub/__init__.py", "import sys"),
+        ("package/sub/deep.py", "from ..importme import val\nfrom package.sub import deep"),
+    )
+
+    serial = collect_imports_from_path(path / "package", "package", walk)
+    parallel = collect_imports_from_path(path / "package", "package", walk, workers=2)
+
+    assert parallel == serial
+
+
+def test_module_index(create_testset):
+    create_testset(
+        ("pkgidx/__init__.py", ""),
+        ("pkgidx/module.py", ""),
+        ("pkgidx/sub/__init__.py", ""),
+        ("pkgidx/sub/deep.py", ""),
+        ("pkgidx/initless/module.py", ""),
+    )
+
+    spec, index = module_index("pkgidx")
+
+    assert spec.name == "pkgidx"
+    assert index == {"__init__", "module", "sub", "sub.__init__", "sub.deep", "initless", "initless.module"}
+
+
+def test_module_index_follows_symlinks(create_testset):
+    path = create_testset(
+        ("pkgidxl/__init__.py", ""),
+        ("real/__init__.py", ""),
+        ("real/mod.py", "A = 1"),
+    )
+    try:
+        (path / "pkgidxl" / "linked").symlink_to(path / "real", target_is_directory=True)
+        (path / "real" / "loop").symlink_to(path / "real", target_is_directory=True)
+    except OSError as ex:
+        pytest.skip(f"cannot create symlinks: {ex}")
+
+    _, index = module_index("pkgidxl")
+
+    # the loop back to real is not followed
+    assert index == {"__init__", "linked", "linked.__init__", "linked.mod"}
+    assert resolve_module_or_object_by_path("pkgidxl.linked.mod") == "pkgidxl.linked.mod"
+    assert resolve_module_or_object_by_path("pkgidxl.linked.mod.A") == "pkgidxl.linked.mod"
+
+
+def test_module_index_is_reused(create_testset, monkeypatch):
+    create_testset(("pkgidx/__init__.py", ""), ("pkgidx/module.py", "A = 1"))
+    assert resolve_module_or_object_by_path("pkgidx.module.A") == "pkgidx.module"
+
+    monkeypatch.setattr(os, "walk", None)
+
+    assert resolve_module_or_object_by_path("pkgidx.module.A") == "pkgidx.module"
+    assert resolve_module_or_object_by_path("pkgidx.module") == "pkgidx.module"
+
+
+def test_module_index_is_persisted(create_testset, tmp_path_factory, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", tmp_path_factory.mktemp("archon-cache"))
+    path = create_testset(("pkgidx/__init__.py", ""), ("pkgidx/module.py", ""))
+    spec, _ = module_index("pkgidx")
+    locations = list(spec.submodule_search_locations)
+    build_module_index(locations)
+
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", None)
+    assert build_module_index(locations) == {"__init__", "module"}
+
+    (path / "pkgidx" / "other.py").write_text("")
+    monkeypatch.setattr(os, "walk", walk)
+    assert build_module_index(locations) == {"__init__", "module", "other"}
+
+
+def test_names_are_resolved_once_for_all_files(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(
+        ("pkgres/__init__.py", ""),
+        ("pkgres/models.py", "class User: pass"),
+        ("pkgres/a.py", "from pkgres.models import User\nfrom typing import Optional"),
+        ("pkgres/b.py", "from pkgres.models import User\nfrom typing import Optional"),
+        ("pkgres/c.py", "from .models import User"),
+    )
+    stats.reset()
+
+    collected = dict(collect_imports_from_path(path / "pkgres", "pkgres"))
+
+    assert collected["pkgres.a"] == collected["pkgres.c"] | {"typing"} == {"pkgres.models", "typing"}
+    assert stats.resolutions == 2
+
+
+def test_unresolved_names_are_reported_once(create_testset, caplog):
+    create_testset(("pkgunres/__init__.py", ""))
+    names = ["nowhere.to.be.found", "nowhere.else", "pkgunres.thing"]
+
+    with caplog.at_level(logging.WARNING, logger="pytest_archon.collect"):
+        assert resolve_names(names + names) == {
+            "nowhere.to.be.found": "nowhere.to.be.found",
+            "nowhere.else": "nowhere.else",
+            "pkgunres.thing": "pkgunres",
+        }
+        resolve_names(names)
+
+    assert len(caplog.records) == 1
+    assert "2 imported names" in caplog.text
+    assert "nowhere.else, nowhere.to.be.found" in caplog.text
+
+
+def test_threaded_resolution_matches_serial(create_testset):
+    create_testset(
+        ("pkgthr1/__init__.py", ""),
+        ("pkgthr1/mod.py", ""),
+        ("pkgthr2/__init__.py", ""),
+        ("pkgthr2/sub/__init__.py", ""),
+    )
+    names = ["pkgthr1.mod", "pkgthr1.mod.obj", "pkgthr2.sub", "pkgthr2.obj", "os.path", "json.dumps"]
+
+    threaded = resolve_names(names, workers=4)
+    collect._module_indexes.clear()
+
+    assert threaded == resolve_names(names)
+    assert threaded["pkgthr1.mod.obj"] == "pkgthr1.mod"
+    assert threaded["pkgthr2.obj"] == "pkgthr2"
+
+
+def test_import_graph_refresh(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(
+        ("pkgref/__init__.py", ""),
+        ("pkgref/a.py", "import pkgref.b"),
+        ("pkgref/b.py", "import pkgref.c"),
+        ("pkgref/c.py", ""),
+    )
+    graph = ImportGraph(path / "pkgref", "pkgref")
+    assert graph.imports.reachability.reachable("pkgref.a") == ["pkgref.b", "pkgref.c"]
+
+    parsed = []
+    monkeypatch.setattr(collect, "parse_file", lambda job: parsed.append(job[1]) or parse_file(job))
+
+    assert graph.refresh() == set()
+    assert parsed == []
+
+    (path / "pkgref" / "b.py").write_text("import os\n")
+    (path / "pkgref" / "c.py").unlink()
+    (path / "pkgref" / "d.py").write_text("import pkgref.a\n")
+
+    assert graph.refresh() == {"pkgref.b", "pkgref.c", "pkgref.d"}
+    assert sorted(parsed) == ["pkgref.b", "pkgref.d"]
+    assert dict(graph.imports) == {
+        "pkgref": set(),
+        "pkgref.a": {"pkgref.b"},
+        "pkgref.b": {"os"},
+        "pkgref.d": {"pkgref.a"},
+    }
+    assert graph.imports.reachability.reachable("pkgref.a") == ["pkgref.b", "os"]
+
+
+def test_import_graph_refresh_paths(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(
+        ("pkgrefp/__init__.py", ""),
+        ("pkgrefp/a.py", "import pkgrefp.b"),
+        ("pkgrefp/b.py", ""),
+    )
+    graph = ImportGraph(path / "pkgrefp", "pkgrefp")
+
+    (path / "pkgrefp" / "a.py").write_text("import os\n")
+    (path / "pkgrefp" / "b.py").unlink()
+    (path / "pkgrefp" / "c.py").write_text("import pkgrefp.a\n")
+    (path / "pkgrefp" / "d.py").write_text("import pkgrefp.a\n")
+
+    changed = [path / "pkgrefp" / name for name in ("b.py", "c.py", "notes.txt")] + [path / "other.py"]
+    assert graph.refresh(changed) == {"pkgrefp.b", "pkgrefp.c"}
+    assert dict(graph.imports) == {"pkgrefp": set(), "pkgrefp.a": {"pkgrefp.b"}, "pkgrefp.c": {"pkgrefp.a"}}
+
+    assert graph.refresh() == {"pkgrefp.a", "pkgrefp.d"}
+
+
+def test_import_graph_refresh_resolves_importers_again(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(
+        ("pkgrefr/__init__.py", ""),
+        ("pkgrefr/a.py", "from pkgrefr.foo import bar"),
+        ("pkgrefr/b.py", "import pkgrefr.foo"),
+        ("pkgrefr/foo/__init__.py", "bar = 1"),
+    )
+    graph = ImportGraph(path / "pkgrefr", "pkgrefr")
+    assert graph.imports["pkgrefr.a"] == {"pkgrefr.foo"}
+
+    parsed = []
+    monkeypatch.setattr(collect, "parse_file", lambda job: parsed.append(job[1]) or parse_file(job))
+
+    # a.py did not change, but what it imports did
+    (path / "pkgrefr" / "foo" / "bar.py").write_text("")
+    assert graph.refresh() == {"pkgrefr.a", "pkgrefr.foo.bar"}
+    assert graph.imports["pkgrefr.a"] == {"pkgrefr.foo.bar"}
+    assert parsed == ["pkgrefr.foo.bar"]
+
+    (path / "pkgrefr" / "foo" / "bar.py").unlink()
+    assert graph.refresh([path / "pkgrefr" / "foo" / "bar.py"]) == {"pkgrefr.a", "pkgrefr.foo.bar"}
+    assert graph.imports["pkgrefr.a"] == {"pkgrefr.foo"}
+
+
+def test_import_graph_is_shared_by_checks(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    path = create_testset(("pkgref/__init__.py", ""), ("pkgref/a.py", ""), ("pkgref/b.py", ""))
+    rule = archrule("refresh").match("pkgref.a").should_not_import("pkgref.b")
+    rule.check("pkgref")
+    assert not pop_failures()
+
+    (path / "pkgref" / "a.py").write_text("import pkgref.b\n")
+    ImportGraph.for_package("pkgref", walk).refresh()
+    rule.check("pkgref")
+
+    assert pop_failures()
+
+
+def test_collect_namespace_package(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    for portion, module, source in (("one", "a", "import nsportions.b"), ("two", "b", "import os")):
+        (tmp_path / portion / "nsportions").mkdir(parents=True)
+        (tmp_path / portion / "nsportions" / f"{module}.py").write_text(source)
+        monkeypatch.syspath_prepend(str(tmp_path / portion))
+
+    all_imports = collect.collect_imports("nsportions", walk)
+
+    assert dict(all_imports) == {"nsportions.a": {"nsportions.b"}, "nsportions.b": {"os"}}
+    assert collect.collect_imports("nsportions", walk) is all_imports
+
+
+def test_import_graph_for_namespace_package(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    monkeypatch.setattr(ImportGraph, "_registry", {})
+    for portion, module in (("one", "a"), ("two", "b")):
+        (tmp_path / portion / f"nsgraph{portion}").mkdir(parents=True)
+        (tmp_path / portion / f"nsgraph{portion}" / f"{module}.py").write_text("import os")
+        (tmp_path / portion / "nsgraphboth").mkdir(parents=True)
+        (tmp_path / portion / "nsgraphboth" / f"{module}.py").write_text("import os")
+        monkeypatch.syspath_prepend(str(tmp_path / portion))
+
+    graph = ImportGraph.for_package("nsgraphone", walk)
+
+    assert graph.path == tmp_path / "one" / "nsgraphone"
+    assert dict(graph.imports) == {"nsgraphone.a": {"os"}}
+    assert ImportGraph.for_package("nsgraphone", walk) is graph
+    assert collect.import_graphs("nsgraphone", walk) == [graph]
+    with pytest.raises(ValueError, match="several directories"):
+        ImportGraph.for_package("nsgraphboth", walk)
+
+
+def test_collect_several_packages(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    create_testset(
+        ("multia/__init__.py", ""),
+        ("multia/sub/__init__.py", ""),
+        ("multia/sub/x.py", "import multib"),
+        ("multib/__init__.py", "import os"),
+    )
+
+    all_imports = collect.collect_imports(["multia", "multib", "multia.sub"], walk)
+
+    assert dict(all_imports) == {
+        "multia": set(),
+        "multia.sub": set(),
+        "multia.sub.x": {"multib"},
+        "multib": {"os"},
+    }
+    assert ImportGraph.for_package("multib", walk).imports is collect.collect_imports("multib", walk)
@@ -0,0 +1,161 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from pytest_archon import archrule, rule
+from pytest_archon.cli import EXIT_ERROR, main
+from pytest_archon.collect import ImportGraph
+from pytest_archon.daemon import Daemon, InotifyWatcher, PollingWatcher, daemon_snapshot
+from pytest_archon.daemon import request as daemon_request
+from pytest_archon.failure import pop_failures
+from pytest_archon.settings import settings
+
+
+def inotify_watcher():
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError) as ex:
+        pytest.skip(f"inotify is not available: {ex}")
+
+
+@pytest.fixture
+def package(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    monkeypatch.setattr(ImportGraph, "_registry", {})
+    path = create_testset(
+        ("pkgdmn/__init__.py", ""),
+        ("pkgdmn/a.py", "import pkgdmn.b"),
+        ("pkgdmn/b.py", ""),
+    )
+    return path / "pkgdmn"
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def daemon(request, package, tmp_path):
+    watcher = inotify_watcher() if request.param == "inotify" else PollingWatcher(interval=0.05)
+    daemon = Daemon(tmp_path / "archon.sock", watcher)
+    ImportGraph.for_package("pkgdmn")
+    thread = threading.Thread(target=daemon.serve)
+    thread.start()
+    try:
+        for _ in range(100):
+            if daemon.socket_path.exists():
+                break
+            thread.join(0.01)
+        yield daemon
+    finally:
+        daemon_request(daemon.socket_path, {"command": "stop"})
+        thread.join()
+
+
+def test_inotify_watcher_reports_changed_files(package):
+    watcher = inotify_watcher()
+    assert watcher.watch(package) == {package / "__init__.py", package / "a.py", package / "b.py"}
+
+    (package / "b.py").write_text("import os\n")
+    (package / "a.py").unlink()
+    (package / "sub").mkdir()
+    (package / "sub" / "c.py").write_text("")
+    (package / "notes.txt").write_text("")
+    watcher.wait(0.5)
+
+    assert watcher.take() == {package / "a.py", package / "b.py", package / "sub" / "c.py"}
+    assert watcher.take() == set()
+
+    # the new directory is watched as well
+    (package / "sub" / "c.py").write_text("import os\n")
+    assert watcher.take() == {package / "sub" / "c.py"}
+    watcher.close()
+
+
+def test_daemon_serves_current_graph(daemon, package):
+    assert daemon_request(daemon.socket_path, {"command": "ping"})["graphs"] == [f"pkgdmn {package}"]
+
+    rule = archrule("daemon").match("pkgdmn.b").should_not_import("pkgdmn.a")
+    rule.check(daemon_snapshot(daemon.socket_path, "pkgdmn"))
+    assert not pop_failures()
+
+    # the graph is brought up to date before the request is handled
+    (package / "b.py").write_text("import pkgdmn.a\n")
+    (package / "c.py").write_text("import pkgdmn.b\n")
+    snapshot = daemon_snapshot(daemon.socket_path, "pkgdmn")
+
+    assert snapshot.imports["pkgdmn.c"] == {"pkgdmn.b"}
+    rule.check(snapshot)
+    assert [f.path for f in pop_failures()] == [("pkgdmn.b", "pkgdmn.a")]
+
+
+def test_snapshot_is_fetched_again_only_after_changes(daemon, package):
+    first = daemon_snapshot(daemon.socket_path, "pkgdmn")
+    assert daemon_snapshot(daemon.socket_path, "pkgdmn") is first
+
+    (package / "b.py").write_text("import os\n")
+    second = daemon_snapshot(daemon.socket_path, "pkgdmn")
+
+    assert second is not first
+    assert second.imports["pkgdmn.b"] == {"os"}
+    assert daemon_snapshot(daemon.socket_path, "pkgdmn") is second
+
+
+def test_snapshot_formats(daemon):
+    response = daemon_request(daemon.socket_path, {"command": "snapshot", "package": "pkgdmn"})
+    assert json.loads(response["snapshot"][0])["format"] == "pytest-archon-snapshot"
+
+    message = {"command": "snapshot", "package": "pkgdmn", "version": response["version"]}
+    assert daemon_request(daemon.socket_path, message)["unchanged"]
+
+
+def test_daemon_reports_errors(daemon):
+    with pytest.raises(RuntimeError, match="unknown command 'nope'"):
+        daemon_request(daemon.socket_path, {"command": "nope"})
+    with pytest.raises(RuntimeError, match="ModuleNotFoundError"):
+        daemon_request(daemon.socket_path, {"command": "snapshot", "package": "no_such_package"})
+
+
+def test_connect_without_daemon(tmp_path, capsys):
+    assert main(["--connect", str(tmp_path / "missing.sock"), "--no-cache"]) == EXIT_ERROR
+    assert "cannot check the rules in the daemon" in capsys.readouterr().out
+
+
+def test_serve_keeps_files_that_are_not_sockets(tmp_path):
+    path = tmp_path / "archon.sock"
+    path.write_text("data")
+    with pytest.raises(FileExistsError, match="is not a socket"):
+        Daemon(path, PollingWatcher()).serve()
+    assert path.read_text() == "data"
+
+
+def test_serve_refuses_a_socket_in_use(daemon):
+    with pytest.raises(FileExistsError, match="another daemon"):
+        Daemon(daemon.socket_path, PollingWatcher()).serve()
+    assert daemon_request(daemon.socket_path, {"command": "ping"})
+
+
+def test_serve_replaces_a_stale_socket(tmp_path):
+    path = tmp_path / "archon.sock"
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(str(path))
+    Daemon(path, PollingWatcher()).remove_stale_socket()
+    assert not path.exists()
+
+
+def test_check_gets_imports_from_daemon(daemon, monkeypatch):
+    monkeypatch.setattr(settings, "daemon", daemon.socket_path)
+    monkeypatch.setattr(settings, "reuse_results", False)
+    monkeypatch.setattr(rule, "collect_imports", None)
+
+    archrule("daemon").match("pkgdmn.b").should_not_import("pkgdmn.a").check("pkgdmn")
+    assert not pop_failures()
+    archrule("daemon").match("pkgdmn.a").should_not_import("pkgdmn.b").check("pkgdmn")
+    assert [f.path for f in pop_failures()] == [("pkgdmn.a", "pkgdmn.b")]
+
+
+def test_check_without_daemon_collects_imports(package, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "daemon", tmp_path / "missing.sock")
+    monkeypatch.setattr(settings, "reuse_results", False)
+
+    archrule("daemon").match("pkgdmn.a").should_not_import("pkgdmn.b").check("pkgdmn")
+    assert [f.path for f in pop_failures()] == [("pkgdmn.a", "pkgdmn.b")]
+    assert "Could not get the imports from the archon daemon" in caplog.text
@@ -0,0 +1,195 @@
+import random
+
+import pytest
+
+from pytest_archon.collect import recurse_imports
+from pytest_archon.graph import CompactGraph, ReachabilityIndex
+
+
+def test_compact_graph_is_a_mapping():
+    graph = CompactGraph.from_items([("a", ["b", "os", "a"]), ("b", ["os"]), ("c", [])])
+
+    assert list(graph) == ["a", "b", "c"]
+    assert len(graph) == 3
+    assert graph["a"] == {"b", "os"}
+    assert graph["c"] == set()
+    assert "b" in graph
+    assert "os" not in graph
+    assert dict(graph.items()) == {"a": {"b", "os"}, "b": {"os"}, "c": set()}
+    with pytest.raises(KeyError):
+        graph["os"]
+
+
+def test_compact_graph_duplicate_module():
+    with pytest.raises(KeyError):
+        CompactGraph.from_items([("a", []), ("a", [])])
+
+
+def test_compact_graph_paths():
+    all_imports = {"a": ["b", "c"], "b": ["c", "d"], "c": ["e"]}
+    graph = CompactGraph.from_mapping(all_imports)
+
+    assert list(graph.paths("a")) == list(recurse_imports("a", all_imports))
+
+
+def test_collapse():
+    graph = CompactGraph.from_items(
+        [
+            ("p", []),
+            ("p.a.x", ["p.a.y", "p.b.z", "os.path"]),
+            ("p.a.y", ["p"]),
+            ("p.b.z", ["p.c"]),
+            ("p.c", []),
+        ]
+    )
+    collapsed = graph.collapse(2)
+
+    assert dict(collapsed) == {"p": set(), "p.a": {"p", "p.b", "os.path"}, "p.b": {"p.c"}, "p.c": set()}
+    assert dict(graph.collapse(1)) == {"p": {"os"}}
+    assert graph.collapse(2) is collapsed
+    with pytest.raises(ValueError):
+        graph.collapse(0)
+
+
+def test_witness():
+    graph = CompactGraph.from_items(
+        [
+            ("p.a.x", ["p.b.y"]),
+            ("p.a.z", ["p.b.v"]),
+            ("p.b.v", ["p.b.w"]),
+            ("p.b.w", ["p.c.w"]),
+            ("p.b.y", []),
+            ("p.c.w", ["p.d.x"]),
+            ("p.d.u", ["p.e.x"]),
+        ]
+    )
+
+    assert graph.witness(("p.a", "p.b"), 2) == [("p.a.x", "p.b.y")]
+    # a chain of imports, also within a package
+    assert graph.witness(("p.a", "p.b", "p.c"), 2) == [
+        ("p.a.z", "p.b.v"),
+        ("p.b.v", "p.b.w"),
+        ("p.b.w", "p.c.w"),
+    ]
+    # p.d.x does not import p.e
+    assert graph.witness(("p.c", "p.d", "p.e"), 2) == [("p.c.w", "p.d.x"), ("p.d.u", "p.e.x")]
+    with pytest.raises(KeyError):
+        graph.witness(("p.a", "p.c"), 2)
+
+
+def test_reachable():
+    all_imports = {"a": {"b", "c"}, "b": {"c", "d"}, "c": {"e"}}
+    index = ReachabilityIndex(all_imports)
+
+    assert set(index.reachable("a")) == {"b", "c", "d", "e"}
+    assert set(index.reachable("c")) == {"e"}
+    assert index.reachable("e") == []
+    assert index.reachable("unknown") == []
+
+
+def test_reachable_in_cycle():
+    all_imports = {"a": {"b"}, "b": {"c"}, "c": {"a", "d"}, "d": set()}
+    index = ReachabilityIndex(all_imports)
+
+    assert set(index.reachable("a")) == {"a", "b", "c", "d"}
+    assert set(index.reachable("c")) == {"a", "b", "c", "d"}
+    assert index.reachable("d") == []
+
+
+def test_reaches_mask():
+    all_imports = {"a": {"b"}, "b": {"os"}, "c": set()}
+    index = ReachabilityIndex(all_imports)
+    mask = index.mask(lambda name: name == "os")
+
+    assert index.reaches("a", mask)
+    assert index.reaches("b", mask)
+    assert not index.reaches("c", mask)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_recurse_imports(seed):
+    rnd = random.Random(seed)
+    modules = [f"m{i}" for i in range(40)]
+    all_imports = {m: set(rnd.sample(modules + ["os", "sys"], rnd.randint(0, 4))) - {m} for m in modules}
+    index = ReachabilityIndex(all_imports)
+    graph = CompactGraph.from_mapping(all_imports)
+
+    for module in modules:
+        expected = {path[-1] for path in recurse_imports(module, all_imports)}
+        assert set(index.reachable(module)) == expected
+        assert {path[-1] for path in graph.paths(module)} == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_patched_graph_and_index(seed):
+    rnd = random.Random(seed)
+    modules = [f"m{i}" for i in range(30)]
+    all_imports = {m: set(rnd.sample(modules + ["os"], rnd.randint(0, 3))) - {m} for m in modules}
+    graph = CompactGraph.from_mapping(all_imports)
+    for module in modules:
+        graph.reachability.closure(module)
+    graph.reachability.mask(lambda name: name.endswith("1"), key="ends with 1")
+
+    updates = {m: set(rnd.sample(modules + ["new"], 2)) - {m} for m in rnd.sample(modules, 3)}
+    updates[rnd.choice(modules)] = None
+    patched = graph.patched(updates)
+
+    expected = {m: imports for m, imports in {**all_imports, **updates}.items() if imports is not None}
+    fresh = ReachabilityIndex(expected)
+    assert dict(patched) == expected
+    for module in expected:
+        assert set(patched.reachability.reachable(module)) == set(fresh.reachable(module))
+    assert set(patched.reachability.names_of(patched.reachability.mask(None, key="ends with 1"))) == {
+        name for name in patched.names if name.endswith("1")
+    }
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_shortest_paths(seed):
+    rnd = random.Random(seed)
+    modules = [f"m{i}" for i in range(40)]
+    all_imports = {m: set(rnd.sample(modules + ["os"], rnd.randint(0, 3))) - {m} for m in modules}
+    graph = CompactGraph.from_mapping(all_imports)
+
+    for module in modules:
+        paths = graph.shortest_paths(module)
+        assert set(paths) == {path[-1] for path in recurse_imports(module, all_imports)}
+
+        distance = {module: 0}
+        todo = [module]
+        for current in todo:
+            for imp in sorted(all_imports.get(current, ())):
+                if imp not in distance:
+                    distance[imp] = distance[current] + 1
+                    todo.append(imp)
+        for imp in paths:
+            path = paths.path(imp)
+            assert path[0] == module and path[-1] == imp
+            assert all(b in all_imports[a] for a, b in zip(path, path[1:]))
+            if imp != module:
+                assert len(path) == distance[imp] + 1
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_cycles(seed):
+    rnd = random.Random(seed)
+    modules = [f"m{i}" for i in range(40)]
+    all_imports = {m: set(rnd.sample(modules + ["os"], rnd.randint(0, 3))) - {m} for m in modules}
+    graph = CompactGraph.from_mapping(all_imports)
+    index = ReachabilityIndex(all_imports)
+
+    # two modules are in the same cycle if they reach each other
+    expected = set()
+    for module in modules:
+        members = tuple(sorted(m for m in index.reachable(module) if module in index.reachable(m)))
+        if len(members) > 1:
+            expected.add(members)
+    assert set(graph.cycles()) == expected
+    assert len(graph.cycles()) == len(expected)
+
+    for cycle in graph.cycles():
+        path = graph.shortest_cycle(cycle[0], set(cycle))
+        assert path[0] == path[-1] == cycle[0]
+        assert set(path) <= set(cycle)
+        assert all(b in all_imports[a] for a, b in zip(path, path[1:]))
+        assert len(path) == len(set(path[1:])) + 1
@@ -0,0 +1,65 @@
+import pytest
+
+from pytest_archon import layers
+from pytest_archon.failure import pop_failures
+
+
+@pytest.fixture
+def layered(create_testset):
+    create_testset(
+        ("layered/__init__.py", ""),
+        ("layered/api/__init__.py", ""),
+        ("layered/api/views.py", "import layered.service.orders\nimport layered.domain.model"),
+        ("layered/service/__init__.py", ""),
+        ("layered/service/orders.py", "import layered.domain.model\nfrom layered import util"),
+        ("layered/domain/__init__.py", ""),
+        ("layered/domain/model.py", "import os"),
+        ("layered/util.py", "import layered.api.views"),
+    )
+
+
+def test_layers_upward_import_through_unlayered_module(layered):
+    layers("layered.api*", "layered.service*", "layered.domain*").check("layered")
+
+    failures = pop_failures()
+    assert [(f.rule_name, f.reason, f.path) for f in failures] == [
+        (
+            "layers",
+            "module 'layered.service.orders' in layer 1 (layered.service*) has UPWARD import "
+            "layered.api.views (layer 0 (layered.api*))",
+            ("layered.service.orders", "layered.util", "layered.api.views"),
+        )
+    ]
+
+
+def test_layers_strict(layered):
+    layers(("layered.api*", "layered.util"), "layered.service*", "layered.domain*", strict=True).check(
+        "layered"
+    )
+
+    reasons = [f.reason for f in pop_failures()]
+    assert reasons == [
+        "module 'layered.api.views' in layer 0 (layered.api*, layered.util) has SKIP-LAYER import "
+        "layered.domain.model (layer 2 (layered.domain*))",
+        "module 'layered.service.orders' in layer 1 (layered.service*) has UPWARD import "
+        "layered.util (layer 0 (layered.api*, layered.util))",
+    ]
+
+
+def test_layers_only_direct_imports(layered):
+    layers("layered.api*", "layered.service*", "layered.domain*").check("layered", only_direct_imports=True)
+
+    assert not pop_failures()
+
+
+def test_layers_without_matches(layered):
+    layers("layered.web*", "layered.db*", name="missing").check("layered")
+
+    failures = pop_failures()
+    assert [f.rule_name for f in failures] == ["missing"]
+    assert failures[0].reason.startswith("NO MODULES MATCHED")
+
+
+def test_layers_need_two_layers():
+    with pytest.raises(ValueError):
+        layers("a*")
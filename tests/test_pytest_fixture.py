@@ -1,3 +1,7 @@
+from pytest_archon.prewarm import Prewarm
+from pytest_archon.settings import settings
+
+
 def test_rule_basic(archrule):
     (
         archrule("abc", "def")
@@ -24,3 +28,87 @@ def test_rule_fail(pytester):
     result = pytester.runpytest()
     result.assert_outcomes(failed=1)
     result.stdout.fnmatch_lines("FAILED Rule 'abc':")
+
+
+def test_prewarm(pytester):
+    pytester.makeini(
+        """
+        [pytest]
+        archon_prewarm = pytest_archon pytest_archon:runtime
+    """
+    )
+    pytester.makepyfile(
+        """
+        from pytest_archon.collect import ImportGraph, walk_runtime
+
+        def test_prewarm(archon_graphs, archrule):
+            assert sorted(archon_graphs) == ["pytest_archon", "pytest_archon:runtime"]
+            assert archon_graphs["pytest_archon:runtime"] == [
+                ImportGraph.for_package("pytest_archon", walk_runtime)
+            ]
+            (
+                archrule("prewarmed")
+                .match("pytest_archon.collect")
+                .should_not_import("pytest")
+                .check("pytest_archon")
+            )
+    """
+    )
+    result = pytester.runpytest_inprocess()
+    result.assert_outcomes(passed=1)
+
+
+def test_prewarm_namespace_package(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    for portion, module in (("one", "a"), ("two", "b")):
+        (tmp_path / portion / "nsprewarm").mkdir(parents=True)
+        (tmp_path / portion / "nsprewarm" / f"{module}.py").write_text("import os")
+        monkeypatch.syspath_prepend(str(tmp_path / portion))
+
+    graphs = Prewarm(["nsprewarm", "no_such_package"]).start().wait()
+
+    assert [graph.path for graph in graphs["nsprewarm"]] == [
+        tmp_path / "two" / "nsprewarm",
+        tmp_path / "one" / "nsprewarm",
+    ]
+    assert "no_such_package" not in graphs
+    assert "ModuleNotFoundError(" in caplog.text
+
+
+def test_prewarm_unknown_kind(pytester):
+    pytester.makeini(
+        """
+        [pytest]
+        archon_prewarm = pytest_archon:sometimes
+    """
+    )
+    pytester.makepyfile("def test_nothing(): pass")
+    result = pytester.runpytest_inprocess()
+    result.stderr.fnmatch_lines("*archon_prewarm: unknown import kind*")
+
+
+def test_profile(pytester):
+    pytester.syspathinsert()
+    pytester.makepyfile(
+        **{
+            "profiled/__init__.py": "",
+            "profiled/a.py": "from profiled import b",
+            "profiled/b.py": "import os.path",
+        }
+    )
+    pytester.makepyfile(
+        """
+        from pytest_archon.profile import stats
+
+        def test_profile(archrule):
+            archrule("profiled").match("profiled.a").should_not_import("json").check("profiled")
+            assert stats.files_parsed == 3
+            assert stats.resolutions
+            assert stats.rules["profiled"].checks == 1
+    """
+    )
+    result = pytester.runpytest_inprocess("--archon-profile", "--archon-no-cache")
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(
+        ["*archon profile*", "files parsed: 3, *", "stages: collect *, read *", "*  profiled"]
+    )
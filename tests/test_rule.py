@@ -1,9 +1,16 @@
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+import pytest
 
 import pytest_archon
-from pytest_archon import archrule
-from pytest_archon.failure import pop_failures
+from pytest_archon import archrule, check_all
+from pytest_archon.failure import collect_failures, pop_failures
 from pytest_archon.plugin import format_failures
+from pytest_archon.rule import PatternMatcher, RulePattern
+from pytest_archon.settings import settings
 
 
 def test_rule_basic():
@@ -16,6 +23,7 @@ def test_rule_exclusion():
         .exclude("pytest_archon")
         .match("*")
         .exclude("pytest_archon.plugin")
+        .exclude("pytest_archon.cli")
         .should_not_import("pytest_archon.rule")
         .check("pytest_archon")
     )
@@ -27,6 +35,7 @@ def test_rule_exclusion_regex():
         .exclude(r"^pytest_archon$")
         .match(".*")
         .exclude(r"^pytest_archon\..lugin")
+        .exclude(r"^pytest_archon\.cli$")
         .should_not_import(r"^pytest\warchon\.rule$")
         .check("pytest_archon")
     )
@@ -241,3 +250,293 @@ def test_resolution_non_existing_module(create_testset):
         ("abcz/moduleC.py", ""),
     )
     archrule("rule exclusion").match("abcz.moduleA").should_import("abcz.moduleC").check("abcz")
+
+
+def test_pattern_matcher_globs():
+    match = PatternMatcher([RulePattern(False, "abcz.mod*"), RulePattern(False, "abcz.other")])
+
+    assert match("abcz.module")
+    assert match("abcz.other")
+    assert not match("abcz.other.sub")
+    assert not match("xabcz.module")
+
+
+def test_pattern_matcher_regexes_with_flags_and_groups():
+    match = PatternMatcher([RulePattern(True, "(?i)^ABCZ$"), RulePattern(True, r"(a)\1")])
+
+    assert match("abcz")
+    assert match("xaax")
+    assert not match("abcz.module")
+
+
+def test_pattern_matcher_memoizes():
+    pattern = RulePattern(True, "^abcz")
+    match = PatternMatcher([pattern])
+    assert match("abcz.module")
+
+    match._search = None
+    assert match("abcz.module")
+
+
+def test_overlapping_match_criteria_check_candidates_once(create_testset):
+    create_testset(
+        ("abcz/__init__.py", ""),
+        ("abcz/moduleA.py", "import abcz.moduleB"),
+        ("abcz/moduleB.py", ""),
+    )
+    archrule("overlap").match("abcz.module*", "abcz.moduleA").should_not_import("abcz.moduleB").check("abcz")
+
+    failures = pop_failures()
+    assert len(failures) == 1
+
+
+def test_check_all_reports_like_separate_checks(create_testset):
+    create_testset(
+        ("abcz/__init__.py", ""),
+        ("abcz/moduleA.py", "import abcz.moduleB"),
+        ("abcz/moduleB.py", "import abcz.moduleC\nif 0:\n    import abcz.moduleD"),
+        ("abcz/moduleC.py", ""),
+        ("abcz/moduleD.py", ""),
+    )
+    rules = [
+        archrule("forbidden").match("abcz.module*").should_not_import("abcz.moduleC", "abcz.moduleD"),
+        archrule("required").match("abcz.moduleA").should_import("abcz.moduleD"),
+        archrule("nothing").match("abcz.nothing").should_import("abcz.moduleD"),
+        archrule("predicate").match("abcz.moduleB").should(lambda m, di, ai: not di, "no_imports"),
+    ]
+
+    for rule in rules:
+        rule.check("abcz")
+    for rule in rules:
+        rule.check("abcz", only_toplevel_imports=True)
+    separate = pop_failures()
+
+    check_all(rules, "abcz")
+    check_all(rules, "abcz", only_toplevel_imports=True)
+    batched = pop_failures()
+
+    assert separate
+    assert batched == separate
+
+
+def test_check_all_with_rule_options(create_testset):
+    create_testset(
+        ("abcz/__init__.py", ""),
+        ("abcz/moduleA.py", "import abcz.moduleB"),
+        ("abcz/moduleB.py", "import abcz.moduleC"),
+        ("abcz/moduleC.py", ""),
+    )
+    rule = archrule("direct").match("abcz.moduleA").should_not_import("abcz.moduleC")
+
+    check_all([rule, (rule, {"only_direct_imports": True})], "abcz")
+
+    failures = pop_failures()
+    assert len(failures) == 1
+
+
+def test_check_all_unknown_option():
+    rule = archrule("rule").match("pytest_archon.rule").should_import("pytest_archon.collect")
+    with pytest.raises(TypeError):
+        check_all([rule], "pytest_archon", only_everything=True)
+
+
+def test_forbidden_import_reports_shortest_path(create_testset):
+    create_testset(
+        ("abcz/__init__.py", ""),
+        ("abcz/moduleA.py", "import abcz.moduleB\nimport abcz.moduleC"),
+        ("abcz/moduleB.py", "import abcz.moduleD"),
+        ("abcz/moduleC.py", "import abcz.moduleE"),
+        ("abcz/moduleD.py", "import abcz.moduleE"),
+        ("abcz/moduleE.py", ""),
+    )
+    archrule("shortest").match("abcz.moduleA").should_not_import("abcz.moduleE").check("abcz")
+
+    failures = pop_failures()
+    assert [f.path for f in failures] == [("abcz.moduleA", "abcz.moduleC", "abcz.moduleE")]
+
+
+def test_max_witnesses(create_testset):
+    create_testset(
+        ("abcz/__init__.py", ""),
+        ("abcz/moduleA.py", "\n".join(f"import abcz.other{i}" for i in range(5))),
+        *((f"abcz/other{i}.py", "") for i in range(5)),
+    )
+    archrule("capped").match("abcz.moduleA").should_not_import("abcz.other*").check("abcz", max_witnesses=2)
+
+    failures = pop_failures()
+    assert [f.path[-1] for f in failures if f.path] == ["abcz.other0", "abcz.other1"]
+    assert failures[-1].reason == (
+        "module 'abcz.moduleA' has 3 more FORBIDDEN imports (matched by glob pattern /abcz.other*/)"
+    )
+
+
+def test_granularity(create_testset):
+    create_testset(
+        ("pkggran/__init__.py", ""),
+        ("pkggran/billing/__init__.py", ""),
+        ("pkggran/billing/api.py", "import pkggran.common.util"),
+        ("pkggran/billing/models.py", ""),
+        ("pkggran/common/__init__.py", ""),
+        ("pkggran/common/util.py", "import pkggran.shipping.models"),
+        ("pkggran/shipping/__init__.py", ""),
+        ("pkggran/shipping/models.py", "import pkggran.billing.models"),
+    )
+
+    rule = archrule("packages").match("pkggran.billing").should_not_import("pkggran.shipping")
+    rule.check("pkggran", granularity=2)
+
+    failures = pop_failures()
+    assert [(f.reason, f.path) for f in failures] == [
+        (
+            "module 'pkggran.billing' has FORBIDDEN import pkggran.shipping "
+            "(matched by glob pattern /pkggran.shipping/) "
+            "through pkggran.billing.api ↣ pkggran.common.util ↣ pkggran.shipping.models",
+            ("pkggran.billing", "pkggran.common", "pkggran.shipping"),
+        )
+    ]
+
+    # imports within a package are not a cycle
+    archrule("cycles").match("pkggran.*").should_not_have_cycles().check("pkggran", granularity=3)
+    assert not pop_failures()
+    archrule("cycles").match("pkggran.*").should_not_have_cycles().check("pkggran", granularity=2)
+    assert [f.path for f in pop_failures()] == [
+        ("pkggran.billing", "pkggran.common", "pkggran.shipping", "pkggran.billing")
+    ]
+
+    with pytest.raises(ValueError):
+        rule.check("pkggran", granularity=0)
+
+
+def test_check_across_packages(create_testset):
+    create_testset(
+        ("service_a/__init__.py", ""),
+        ("service_a/handler.py", "from shared_lib import util"),
+        ("shared_lib/__init__.py", ""),
+        ("shared_lib/util.py", "import service_b.api"),
+        ("service_b/__init__.py", ""),
+        ("service_b/api.py", ""),
+    )
+    rule = archrule("services").match("service_a*").should_not_import("service_b*")
+
+    rule.check("service_a")
+    assert not pop_failures()
+
+    rule.check(["service_a", "shared_lib", "service_b"])
+    failures = pop_failures()
+    assert [f.path for f in failures] == [("service_a.handler", "shared_lib.util", "service_b.api")]
+
+
+def test_should_not_have_cycles(create_testset):
+    create_testset(
+        ("cyclic/__init__.py", ""),
+        ("cyclic/a.py", "import cyclic.b"),
+        ("cyclic/b.py", "import cyclic.c\nimport cyclic.a"),
+        ("cyclic/c.py", "import cyclic.a"),
+        ("cyclic/d.py", "import cyclic.e"),
+        ("cyclic/e.py", "import cyclic.d"),
+        ("cyclic/f.py", "import cyclic.a"),
+    )
+
+    archrule("no cycles").match("cyclic.*").exclude("cyclic.d").should_not_have_cycles().check("cyclic")
+
+    failures = pop_failures()
+    assert [(f.reason, f.path) for f in failures] == [
+        (
+            "module 'cyclic.a' is part of an import CYCLE of 3 modules",
+            ("cyclic.a", "cyclic.b", "cyclic.a"),
+        ),
+        (
+            "module 'cyclic.e' is part of an import CYCLE of 2 modules",
+            ("cyclic.e", "cyclic.d", "cyclic.e"),
+        ),
+    ]
+
+    archrule("no cycles").match("cyclic.f").should_not_have_cycles().check("cyclic")
+    assert not pop_failures()
+
+
+def test_threaded_evaluation_reports_like_serial(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "reuse_results", False)
+    create_testset(
+        ("threaded/__init__.py", ""),
+        *((f"threaded/m{i}.py", f"import threaded.m{i + 1}\nimport threaded.forbidden") for i in range(20)),
+        ("threaded/m20.py", ""),
+        ("threaded/forbidden.py", ""),
+    )
+    rules = [
+        archrule("forbidden").match("threaded.m*").should_not_import("threaded.forbidden"),
+        archrule("required").match("threaded.m*").should_import("threaded.m20"),
+    ]
+
+    check_all(rules, "threaded")
+    serial = pop_failures()
+    check_all(rules, "threaded", threads=4)
+    threaded = pop_failures()
+
+    assert len(serial) == 21
+    assert threaded == serial
+
+
+def test_failures_of_concurrent_checks_are_collected_separately(create_testset):
+    create_testset(
+        ("concpkg/__init__.py", ""),
+        *((f"concpkg/m{i}.py", "import concpkg.forbidden") for i in range(8)),
+        ("concpkg/forbidden.py", ""),
+    )
+    barrier = threading.Barrier(8)
+
+    def check(i):
+        with collect_failures() as failures:
+            barrier.wait()
+            archrule(f"rule {i}").match(f"concpkg.m{i}").should_not_import("concpkg.forbidden").check(
+                "concpkg"
+            )
+        return failures
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(check, range(8)))
+
+    assert [[(f.rule_name, f.path) for f in failures] for failures in results] == [
+        [(f"rule {i}", (f"concpkg.m{i}", "concpkg.forbidden"))] for i in range(8)
+    ]
+    assert not pop_failures()
+
+
+def test_failures_of_a_check_stay_together(create_testset, monkeypatch):
+    monkeypatch.setattr(settings, "cache_dir", None)
+    create_testset(
+        ("together/__init__.py", ""),
+        *((f"together/m{i}.py", "import together.forbidden") for i in range(50)),
+        ("together/forbidden.py", ""),
+    )
+    rules = [
+        archrule(f"rule {i}").match("together.m*").should_not_import("together.forbidden") for i in range(8)
+    ]
+    # build the graph first, so the checks overlap
+    check_all(rules[:1], "together")
+    pop_failures()
+    barrier = threading.Barrier(len(rules))
+
+    def check(rule):
+        barrier.wait()
+        for _ in range(5):
+            rule.check("together")
+
+    with ThreadPoolExecutor(max_workers=len(rules)) as executor:
+        list(executor.map(check, rules))
+
+    # every check adds 50 failures, consecutive checks of the same rule join up
+    sizes = [len(list(failures)) for _, failures in groupby(pop_failures(), lambda f: f.rule_name)]
+    assert sum(sizes) == 5 * 50 * len(rules)
+    assert all(size % 50 == 0 for size in sizes)
+
+
+def test_failures_without_collector_are_shared_between_threads(create_testset):
+    create_testset(("shared/__init__.py", ""), ("shared/a.py", "import shared.b"), ("shared/b.py", ""))
+    rule = archrule("shared").match("shared.a").should_not_import("shared.b")
+
+    thread = threading.Thread(target=rule.check, args=("shared",))
+    thread.start()
+    thread.join()
+
+    assert [f.rule_name for f in pop_failures()] == ["shared"]
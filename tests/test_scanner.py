@@ -0,0 +1,143 @@
+import ast
+import sys
+import sysconfig
+from pathlib import Path
+
+import pytest
+
+import pytest_archon
+from pytest_archon.collect import collect_imports_from_path as collect
+from pytest_archon.collect import extract_imports_ast, walk, walk_runtime, walk_toplevel
+from pytest_archon.scanner import scan_imports
+
+MODES = {"all": walk, "runtime": walk_runtime, "toplevel": walk_toplevel}
+
+SNIPPETS = [
+    "import a",
+    "import a.b.c as d, e",
+    "from a import b, c as d",
+    "from a.b import (\n    c,\n    d as e,\n)",
+    "from . import a",
+    "from .. import a\nfrom ...a.b import c\nfrom ... import d",
+    "from .mod import *",
+    "from a import \\\n    b",
+    "import a; import b\nx = 1; from c import d",
+    "def f():\n    import a\n    if x:\n        from b import c\n",
+    "class A:\n    import a\n    def m(self): import b\n",
+    "if x: import a\nelse: import b",
+    "try: import a\nexcept ImportError: import b",
+    "for x in y: import a; import b",
+    "while (x := 1): import a",
+    "with open(f) as fp, lock: import a",
+    "async def f():\n    import a\n    async with x: import b\n",
+    "@decorator(lambda: 1)\ndef f(x: int = {'a': 1}) -> dict: import a",
+    "if (lambda: 1)(): import a",
+    "x = {'import': 1}\nimport_ = 1\ny = '''\nimport notreally\n'''",
+    "from __future__ import annotations\nimport typing",
+    "# import a\nimport b  # import c",
+    "if TYPE_CHECKING:\n    import a\nimport b",
+    "if typing.TYPE_CHECKING:\n    import a\nelif x:\n    import b\nelse:\n    import c\nimport d",
+    "if x:\n    import a\nelif TYPE_CHECKING:\n    import b\nelse:\n    import c\nimport d",
+    "if TYPE_CHECKING: import a\nelse: import b\nimport c",
+    "if (TYPE_CHECKING):\n    import a",
+    "if not TYPE_CHECKING:\n    import a",
+    "if TYPE_CHECKING or x:\n    import a",
+    "if get().TYPE_CHECKING:\n    import a",
+    "if a[0].b().TYPE_CHECKING:\n    import a",
+    "if TYPE_CHECKING == x:\n    import a",
+    "def f():\n    if TYPE_CHECKING:\n        import a\n    import b\nif TYPE_CHECKING:\n    import c",
+    "if x:\n    if TYPE_CHECKING:\n        import a\n    else:\n        import b\nelse:\n    import c",
+    "match x:\n    case 1: import a\n    case {'k': v}:\n        import b\nmatch = 1\ncase = 2; import c",
+    "print(f'{x:>10}'); import a",
+    "x = 1 if y else 2; from a import b",
+    "if x:\n    pass\n    # comment\n\n\n    import a\n",
+    'x = """\nimport a\n"""; import b\ny = \'import c\' "# import d"',
+    "if x == '''\n''': import a\nelse: pass",
+    "def f():\n    return'x'\nimport a",
+    "import reimport\nreimport = 1; from_ = 2\nyield_from = 3",
+    "x = [\n    1,\n]; import a",
+    "def f():\n    x = (\n1); import a",
+    "import a, \\\n    b",
+    "x = 1; \\\nimport a",
+    "if TYPE_CHECKING:\n    x = (\n1)\n    import a\nimport b",
+    "if TYPE_CHECKING:\n    x = '''\n'''\n    import a\n\n\n# comment\nimport b",
+    "if ''.TYPE_CHECKING:\n    import a",
+    "if x:\n\tif TYPE_CHECKING:\n\t\timport a\n\timport b",
+    "import a",  # no trailing newline
+]
+
+# statements that follow a multi-line expression can not be placed by the scanner
+FALLBACK = ["x = [\n    1,\n]; import a", "def f():\n    x = (\n1); import a", "x = 1; \\\nimport a"]
+
+
+def ast_imports(source, walker):
+    return sorted(extract_imports_ast(walker(ast.parse(source)), "pkg.sub.mod", resolve=False))
+
+
+def scanned_imports(source, mode):
+    return sorted(extract_imports_ast(scan_imports(source.encode(), mode), "pkg.sub.mod", resolve=False))
+
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("source", SNIPPETS)
+def test_snippets_match_ast(source, mode):
+    if "match x:" in source and sys.version_info < (3, 10):
+        pytest.skip("match statements need python 3.10")
+
+    try:
+        scanned = scanned_imports(source, mode)
+    except SyntaxError:
+        # parse_file falls back to the ast engine
+        assert mode == "toplevel" and source in FALLBACK
+        return
+    assert scanned == ast_imports(source, MODES[mode])
+
+
+def corpus():
+    files = sorted(Path(pytest_archon.__file__).parent.glob("*.py"))
+    stdlib = Path(sysconfig.get_paths()["stdlib"])
+    files.extend(sorted(stdlib.glob("*.py"))[:150])
+    files.extend(sorted(stdlib.glob("[a-j]*/*.py"))[:150])
+    return files
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_corpus_matches_ast(mode):
+    checked = 0
+    for py_file in corpus():
+        source = py_file.read_bytes()
+        try:
+            expected = ast_imports(source, MODES[mode])
+        except (SyntaxError, ValueError):
+            continue
+        actual = sorted(extract_imports_ast(scan_imports(source, mode), "pkg.sub.mod", resolve=False))
+        assert actual == expected, py_file
+        checked += 1
+    assert checked > 100
+
+
+def test_scan_engine(create_testset):
+    path = create_testset(
+        ("mymodule.py", "import sys\nif TYPE_CHECKING:\n    import os\n"),
+        ("other.py", "from . import mymodule\ndef f():\n    import json\n"),
+        ("fallback.py", "x = [\n    1,\n]; import json\n"),
+    )
+
+    for walker in (walk, walk_runtime, walk_toplevel):
+        assert collect(path, "pkg", walker, engine="scan") == collect(path, "pkg", walker, engine="ast")
+
+
+def test_scan_engine_falls_back_to_ast(create_testset):
+    path = create_testset(("mymodule.py", "import sys\nimport os\n"))
+
+    def only_first(tree):
+        yield tree.body[0]
+
+    assert dict(collect(path, "pkg", only_first, engine="scan")) == {"pkg.mymodule": {"sys"}}
+
+
+def test_unknown_engine(create_testset):
+    path = create_testset(("mymodule.py", "import sys"))
+
+    with pytest.raises(ValueError):
+        collect(path, "pkg", walk, engine="regex")
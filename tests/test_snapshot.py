@@ -0,0 +1,79 @@
+import shutil
+
+import pytest
+
+from pytest_archon import archrule, layers
+from pytest_archon.collect import walk_runtime
+from pytest_archon.failure import pop_failures
+from pytest_archon.snapshot import MAGIC, load_snapshot, save_snapshot, take_snapshot
+
+
+@pytest.fixture
+def package(create_testset):
+    return create_testset(
+        ("snapped/__init__.py", ""),
+        ("snapped/a.py", "import snapped.b\nif TYPE_CHECKING:\n    import snapped.c"),
+        ("snapped/b.py", "import os"),
+        ("snapped/c.py", "from snapped import a"),
+    )
+
+
+@pytest.mark.parametrize("name", ["graph.snapshot", "graph.jsonl"])
+def test_snapshot_roundtrip(package, tmp_path, name):
+    snapshot = take_snapshot("snapped")
+    save_snapshot(snapshot, tmp_path / name)
+    loaded = load_snapshot(tmp_path / name)
+
+    assert (tmp_path / name).read_bytes().startswith(MAGIC) == name.endswith(".snapshot")
+    assert (
+        dict(loaded.imports)
+        == dict(snapshot.imports)
+        == {
+            "snapped": set(),
+            "snapped.a": {"snapped.b", "snapped.c"},
+            "snapped.b": {"os"},
+            "snapped.c": {"snapped.a"},
+        }
+    )
+    assert loaded.walker == snapshot.walker
+    assert loaded.roots == snapshot.roots == [("snapped", str(package / "snapped"))]
+    assert loaded.files == snapshot.files
+    assert loaded.files["snapped.a"][1] == "a.py"
+    assert not loaded.stale()
+
+
+def test_check_snapshot_without_sources(package, tmp_path):
+    save_snapshot(take_snapshot("snapped", walk_runtime), tmp_path / "runtime.snapshot")
+    shutil.rmtree(package / "snapped")
+    snapshot = load_snapshot(tmp_path / "runtime.snapshot")
+
+    rule = archrule("snapshot").match("snapped.b").should_not_import("snapped.a")
+    rule.check(snapshot, skip_type_checking=True)
+    assert not pop_failures()
+
+    archrule("snapshot").match("snapped.c").should_not_import("os").check(snapshot, skip_type_checking=True)
+    assert [f.path for f in pop_failures()] == [("snapped.c", "snapped.a", "snapped.b", "os")]
+
+    layers("snapped.c", "snapped.a").check(snapshot, skip_type_checking=True)
+    assert not pop_failures()
+
+    with pytest.raises(ValueError):
+        rule.check(snapshot)
+
+
+def test_stale_snapshot(package):
+    snapshot = take_snapshot("snapped")
+    (package / "snapped" / "b.py").write_text("import os, sys")
+    (package / "snapped" / "d.py").write_text("")
+    (package / "snapped" / "c.py").unlink()
+
+    assert snapshot.stale() == sorted(str(package / "snapped" / name) for name in ("b.py", "c.py", "d.py"))
+
+
+def test_snapshot_version(package, tmp_path):
+    file = tmp_path / "graph.jsonl"
+    save_snapshot(take_snapshot("snapped"), file)
+    file.write_text(file.read_text().replace('"version": 1', '"version": 999', 1))
+
+    with pytest.raises(ValueError):
+        load_snapshot(file)